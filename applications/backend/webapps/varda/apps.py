@@ -1,20 +1,24 @@
 import os
+import threading
 from functools import partial
 
-from celery.signals import setup_logging, task_failure, task_prerun
+from celery.signals import setup_logging, task_failure, task_postrun, task_prerun
 from django.apps import AppConfig
 from django.conf import settings
 from django.contrib.auth import user_logged_in, user_logged_out
 from django.core.cache import cache
-from django.db.models.signals import post_delete, post_migrate, post_save, pre_delete, pre_save
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save, pre_delete, pre_save
 from django.utils import timezone
 from django_cas_ng.signals import cas_user_logout
+from simple_history.signals import post_create_historical_record
 
 from varda.constants import ALIVE_BOOT_TIME_CACHE_KEY, ALIVE_SEQ_CACHE_KEY
 from varda.custom_signal_handlers import (
     cas_logout_handler,
     celery_setup_logging_signal_handler,
     celery_task_failure_signal_handler,
+    celery_task_postrun_signal_handler,
     celery_task_prerun_signal_handler,
     login_handler,
     logout_handler,
@@ -123,7 +127,7 @@ def load_dev_testing_data():
 
 def receiver_save_user(**kwargs):
     from django.utils import timezone
-    from varda.cache import delete_object_ids_user_has_permissions
+    from varda.cache import delete_related_organisaatio_cache
     from varda.models import Z7_AdditionalUserFields
 
     created = kwargs["created"]
@@ -133,16 +137,38 @@ def receiver_save_user(**kwargs):
     if not created and update_fields is None:
         """
         User permissions changed "on-the-fly".
-        We need to remove the cache for user - varda.cache.get_object_ids_user_has_permissions
+        We need to remove the cache for user - varda.permissions.get_related_organisaatio_id_list_for_user
         """
         user_id = user.id
-        delete_object_ids_user_has_permissions(user_id)
+        delete_related_organisaatio_cache(user_id)
     elif created and user.is_staff and user.has_usable_password():
         # Update password_changed_timestamp when staff user is created
         now = timezone.now()
         Z7_AdditionalUserFields.objects.update_or_create(user=user, defaults={"password_changed_timestamp": now})
 
 
+def receiver_user_groups_change(**kwargs):
+    """
+    Permission groups of users have changed, remove the cache of related Organisaatio IDs
+    (varda.permissions.get_related_organisaatio_id_list_for_user). Signal is sent from both sides of the relation,
+    e.g. user.groups.set(...) and group.user_set.clear().
+    """
+    from varda.cache import delete_related_organisaatio_cache_many
+
+    action = kwargs["action"]
+    instance = kwargs["instance"]
+    if not kwargs["reverse"]:
+        # instance is User
+        if action in ("post_add", "post_remove", "post_clear"):
+            delete_related_organisaatio_cache_many([instance.id])
+    elif action in ("post_add", "post_remove"):
+        # instance is Group and pk_set contains User IDs
+        delete_related_organisaatio_cache_many(kwargs["pk_set"])
+    elif action == "pre_clear":
+        # Users of the Group are not known after clear
+        delete_related_organisaatio_cache_many(list(instance.user_set.values_list("id", flat=True)))
+
+
 def receiver_pre_save_user(**kwargs):
     from django.utils import timezone
     from varda.models import User, Z7_AdditionalUserFields
@@ -159,6 +185,86 @@ def receiver_pre_save_user(**kwargs):
         Z7_AdditionalUserFields.objects.update_or_create(user=instance, defaults={"password_changed_timestamp": now})
 
 
+# Z9_RelatedObjectChanged objects of the current transaction of the thread, see create_related_object_changed
+_related_object_changed_buffer = threading.local()
+
+
+def create_related_object_changed(**kwargs):
+    """
+    Z9_RelatedObjectChanged objects created inside a transaction are buffered and saved with a single bulk_create in
+    the same transaction, right before it is committed (see receiver_connection_created), so that they are committed
+    atomically with the data change. Objects are buffered per savepoint and buffers are registered as on_commit
+    callbacks, so if transaction or savepoint is rolled back, buffered objects are discarded. The on_commit callback is
+    only a fallback (e.g. TestCase transactions are never committed), flushed buffers are not saved again.
+    :param kwargs: Z9_RelatedObjectChanged field values
+    """
+    from django.db import transaction
+    from varda.models import Z9_RelatedObjectChanged
+
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        Z9_RelatedObjectChanged.objects.create(**kwargs)
+        return None
+
+    buffer = getattr(_related_object_changed_buffer, "buffer", None)
+    if (
+        not buffer
+        or buffer["is_flushed"]
+        or buffer["savepoint_ids"] != connection.savepoint_ids
+        or not any(func is buffer["flush"] for sids, func, robust in connection.run_on_commit)
+    ):
+        # No buffer for current transaction and savepoint (previous one has been flushed or discarded)
+        buffer = {"savepoint_ids": list(connection.savepoint_ids), "object_list": [], "is_flushed": False}
+        buffer["flush"] = partial(_flush_related_object_changed_buffer, buffer)
+        _related_object_changed_buffer.buffer = buffer
+        transaction.on_commit(buffer["flush"])
+
+    buffer["object_list"].append(Z9_RelatedObjectChanged(**kwargs))
+
+
+def _flush_related_object_changed_buffer(buffer):
+    from varda.models import Z9_RelatedObjectChanged
+
+    if buffer["is_flushed"]:
+        return None
+    buffer["is_flushed"] = True
+    Z9_RelatedObjectChanged.objects.bulk_create(buffer["object_list"])
+
+
+def flush_related_object_changed_buffers(connection):
+    """
+    Save buffered Z9_RelatedObjectChanged objects of all live savepoints of the current transaction with a single
+    bulk_create
+    :param connection: database connection
+    """
+    from varda.models import Z9_RelatedObjectChanged
+
+    buffer_list = [
+        func.args[0]
+        for sids, func, robust in connection.run_on_commit
+        if isinstance(func, partial) and func.func is _flush_related_object_changed_buffer and not func.args[0]["is_flushed"]
+    ]
+    object_list = []
+    for buffer in buffer_list:
+        buffer["is_flushed"] = True
+        object_list.extend(buffer["object_list"])
+    if object_list:
+        Z9_RelatedObjectChanged.objects.bulk_create(object_list)
+
+
+def receiver_connection_created(**kwargs):
+    connection = kwargs["connection"]
+    if not isinstance(connection.commit, partial):
+        # Atomic calls commit when the outermost atomic block is exited, save buffered Z9_RelatedObjectChanged objects
+        # before that so that they are committed (or rolled back on error) together with the data change
+        connection.commit = partial(_commit_with_related_object_changed, connection, connection.commit)
+
+
+def _commit_with_related_object_changed(connection, commit):
+    flush_related_object_changed_buffers(connection)
+    commit()
+
+
 def tutkinto_tyontekija_id_lookup(instance):
     from varda.models import Tyontekija
 
@@ -195,7 +301,6 @@ def update_related_object_change(
     :param path_to_parent_id: iterable of strings that lead to parent id
     """
     from varda.misc import get_nested_value
-    from varda.models import Z9_RelatedObjectChanged
 
     instance_id = custom_id_lookup(instance) if custom_id_lookup else get_nested_value(instance, path_to_id)
     if not instance_id:
@@ -210,7 +315,7 @@ def update_related_object_change(
         {"parent_model_name": parent_model_name, "parent_instance_id": parent_instance_id} if parent_instance_id else {}
     )
 
-    Z9_RelatedObjectChanged.objects.create(
+    create_related_object_changed(
         model_name=model_name,
         instance_id=instance_id,
         changed_timestamp=timestamp,
@@ -220,7 +325,7 @@ def update_related_object_change(
         **additional_values,
     )
     if parent_instance_id and create_parent_record:
-        Z9_RelatedObjectChanged.objects.create(
+        create_related_object_changed(
             model_name=parent_model_name,
             instance_id=parent_instance_id,
             changed_timestamp=timestamp,
@@ -240,11 +345,11 @@ def update_related_object_change_henkilo(instance, timestamp, history_type):
     :param timestamp: timestamp
     :param history_type: history type string (+, ~ or -)
     """
-    from varda.models import Huoltajuussuhde, Lapsi, Tyontekija, Z9_RelatedObjectChanged
+    from varda.models import Huoltajuussuhde, Lapsi, Tyontekija
 
     if huoltaja := getattr(instance, "huoltaja", None):
         for huoltajuussuhde in huoltaja.huoltajuussuhteet.all():
-            Z9_RelatedObjectChanged.objects.create(
+            create_related_object_changed(
                 model_name=Lapsi.get_name(),
                 instance_id=huoltajuussuhde.lapsi_id,
                 changed_timestamp=timestamp,
@@ -254,7 +359,7 @@ def update_related_object_change_henkilo(instance, timestamp, history_type):
             )
 
     for lapsi in instance.lapsi.all():
-        Z9_RelatedObjectChanged.objects.create(
+        create_related_object_changed(
             model_name=Lapsi.get_name(),
             instance_id=lapsi.id,
             changed_timestamp=timestamp,
@@ -264,7 +369,7 @@ def update_related_object_change_henkilo(instance, timestamp, history_type):
         )
 
     for tyontekija in instance.tyontekijat.all():
-        Z9_RelatedObjectChanged.objects.create(
+        create_related_object_changed(
             model_name=Tyontekija.get_name(),
             instance_id=tyontekija.id,
             changed_timestamp=timestamp,
@@ -275,10 +380,10 @@ def update_related_object_change_henkilo(instance, timestamp, history_type):
 
 
 def update_related_object_change_maksutieto(instance, timestamp, history_type):
-    from varda.models import Lapsi, Maksutieto, MaksutietoHuoltajuussuhde, Z9_RelatedObjectChanged
+    from varda.models import Lapsi, Maksutieto, MaksutietoHuoltajuussuhde
 
     for maksutieto_huoltajuussuhde in instance.maksutiedot_huoltajuussuhteet.all():
-        Z9_RelatedObjectChanged.objects.create(
+        create_related_object_changed(
             model_name=Lapsi.get_name(),
             instance_id=maksutieto_huoltajuussuhde.huoltajuussuhde.lapsi_id,
             changed_timestamp=timestamp,
@@ -291,10 +396,10 @@ def update_related_object_change_maksutieto(instance, timestamp, history_type):
 
 
 def update_related_object_change_taydennyskoulutus(instance, timestamp, history_type):
-    from varda.models import Taydennyskoulutus, TaydennyskoulutusTyontekija, Tyontekija, Z9_RelatedObjectChanged
+    from varda.models import Taydennyskoulutus, TaydennyskoulutusTyontekija, Tyontekija
 
     for taydennyskoulutus_tyontekija in instance.taydennyskoulutukset_tyontekijat.all():
-        Z9_RelatedObjectChanged.objects.create(
+        create_related_object_changed(
             model_name=Tyontekija.get_name(),
             instance_id=taydennyskoulutus_tyontekija.tyontekija_id,
             changed_timestamp=timestamp,
@@ -439,12 +544,19 @@ def handle_related_object_change(instance, history_type):
         receiver_dict[model_name](instance, timestamp, history_type)
 
 
-def create_kela_varhaiskasvatussuhde(instance, history_type):
+def get_kela_varhaiskasvatussuhde(instance, history_type, history_date=None):
+    """
+    Returns unsaved Z10_KelaVarhaiskasvatussuhde object of Varhaiskasvatussuhde instance
+    :param instance: Varhaiskasvatussuhde object
+    :param history_type: history type string (+, ~ or -)
+    :param history_date: datetime, defaults to current time
+    :return: Z10_KelaVarhaiskasvatussuhde object
+    """
     from varda.models import Z10_KelaVarhaiskasvatussuhde
 
     vakapaatos = instance.varhaiskasvatuspaatos
     henkilo = vakapaatos.lapsi.henkilo
-    Z10_KelaVarhaiskasvatussuhde.objects.create(
+    return Z10_KelaVarhaiskasvatussuhde(
         varhaiskasvatussuhde_id=instance.id,
         suhde_luonti_pvm=instance.luonti_pvm,
         suhde_alkamis_pvm=instance.alkamis_pvm,
@@ -457,10 +569,62 @@ def create_kela_varhaiskasvatussuhde(instance, history_type):
         henkilo_id=instance.varhaiskasvatuspaatos.lapsi.henkilo_id,
         has_hetu=henkilo.henkilotunnus != "",
         history_type=history_type,
-        history_date=timezone.now(),
+        history_date=history_date or timezone.now(),
+    )
+
+
+def create_kela_varhaiskasvatussuhde(instance, history_type):
+    get_kela_varhaiskasvatussuhde(instance, history_type).save()
+
+
+def update_history_intervals(model_name, history_instance_list):
+    """
+    Updates Z13_HistoryInterval table: closes the open intervals of the instances and opens new ones starting from the
+    created historical records. Historical records must have the same history_date and at most one historical record
+    per instance can be provided.
+    :param model_name: name of the model, e.g. lapsi
+    :param history_instance_list: list of historical records
+    """
+    from django.contrib.postgres.fields import DateTimeRangeField
+    from django.db.backends.postgresql.psycopg_any import DateTimeTZRange
+    from django.db.models import F, Func, Value
+    from varda.models import Z13_HistoryInterval
+
+    if model_name not in Z13_HistoryInterval.MODEL_NAME_LIST or not history_instance_list:
+        return
+
+    history_date = history_instance_list[0].history_date
+    Z13_HistoryInterval.objects.filter(
+        model_name=model_name,
+        instance_id__in=[history_instance.id for history_instance in history_instance_list],
+        valid_period__upper_inf=True,
+    ).update(
+        valid_period=Func(
+            Func(F("valid_period"), function="lower"),
+            Value(history_date),
+            Value("[)"),
+            function="tstzrange",
+            output_field=DateTimeRangeField(),
+        )
+    )
+    Z13_HistoryInterval.objects.bulk_create(
+        [
+            Z13_HistoryInterval(
+                model_name=model_name,
+                instance_id=history_instance.id,
+                history_id=history_instance.history_id,
+                history_type=history_instance.history_type,
+                valid_period=DateTimeTZRange(history_date, None, "[)"),
+            )
+            for history_instance in history_instance_list
+        ]
     )
 
 
+def receiver_post_create_historical_record(**kwargs):
+    update_history_intervals(kwargs["instance"].get_name(), [kwargs["history_instance"]])
+
+
 def receiver_save(**kwargs):
     from django.db import transaction
     from varda.cache import invalidate_cache
@@ -485,9 +649,13 @@ def receiver_save(**kwargs):
     elif isinstance(instance, Varhaiskasvatussuhde):
         create_kela_varhaiskasvatussuhde(instance, history_type)
     elif isinstance(instance, PaosOikeus):
-        # tallentaja_organisaatio has been changed, run permission changes
-        change_paos_tallentaja_organization_task.delay(
-            instance.jarjestaja_kunta_organisaatio_id, instance.tuottaja_organisaatio_id
+        # tallentaja_organisaatio has been changed, run permission changes after changes are committed
+        transaction.on_commit(
+            partial(
+                change_paos_tallentaja_organization_task.delay,
+                instance.jarjestaja_kunta_organisaatio_id,
+                instance.tuottaja_organisaatio_id,
+            )
         )
 
     handle_related_object_change(instance, history_type)
@@ -514,6 +682,7 @@ def receiver_pre_delete(**kwargs):
 
 
 def receiver_post_delete(**kwargs):
+    from django.db import transaction
     from varda.models import PaosOikeus
     from varda.tasks import change_paos_tallentaja_organization_task
 
@@ -522,8 +691,13 @@ def receiver_post_delete(**kwargs):
     if isinstance(instance, PaosOikeus):
         # PaosOikeus has been deleted so nobody is tallentaja_organisaato, run permission changes
         # (jarjestaja_kunta_organisaatio and tuottaja_organisaatio only have view permissions)
-        change_paos_tallentaja_organization_task.delay(
-            instance.jarjestaja_kunta_organisaatio_id, instance.tuottaja_organisaatio_id
+        # Task is run after deletion is committed so that it does not see the deleted PaosOikeus
+        transaction.on_commit(
+            partial(
+                change_paos_tallentaja_organization_task.delay,
+                instance.jarjestaja_kunta_organisaatio_id,
+                instance.tuottaja_organisaatio_id,
+            )
         )
 
 
@@ -541,8 +715,11 @@ class VardaConfig(AppConfig):
     name = "varda"
 
     def ready(self):
+        from django.contrib.auth.models import User
+
         # Django signals
         post_migrate.connect(run_post_migration_tasks, sender=self)
+        connection_created.connect(receiver_connection_created)
 
         # Auth signals
         user_logged_in.connect(login_handler)
@@ -551,6 +728,7 @@ class VardaConfig(AppConfig):
 
         # Celery signals
         task_prerun.connect(celery_task_prerun_signal_handler)
+        task_postrun.connect(celery_task_postrun_signal_handler)
         task_failure.connect(celery_task_failure_signal_handler)
         # Connect to setup_logging signal to override default Celery logging
         # https://docs.celeryq.dev/en/stable/userguide/signals.html#setup-logging
@@ -560,6 +738,7 @@ class VardaConfig(AppConfig):
         pre_save.connect(receiver_pre_save_user, sender="auth.User")
 
         post_save.connect(receiver_save_user, sender="auth.User")
+        m2m_changed.connect(receiver_user_groups_change, sender=User.groups.through)
         post_save.connect(receiver_save, sender="varda.Organisaatio")
         post_save.connect(receiver_save, sender="varda.Toimipaikka")
         post_save.connect(receiver_save, sender="varda.ToiminnallinenPainotus")
@@ -607,5 +786,8 @@ class VardaConfig(AppConfig):
         pre_delete.connect(receiver_pre_delete, sender="varda.TaydennyskoulutusTyontekija")
         post_delete.connect(receiver_post_delete, sender="varda.PaosOikeus")
 
+        # simple_history signals
+        post_create_historical_record.connect(receiver_post_create_historical_record)
+
         # Additional operations run on startup
         init_alive_log()
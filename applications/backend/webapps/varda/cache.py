@@ -1,14 +1,14 @@
 import datetime
 import logging
+import uuid
 
 from django.conf import settings
-from django.core.cache import cache
+from django.core.cache import cache, caches
+from django.core.cache.backends.redis import RedisCache
 from django.utils.http import urlencode
 from functools import wraps
 from hashlib import sha1
 
-from guardian.shortcuts import get_objects_for_user
-
 from varda.misc import hash_string
 
 
@@ -50,43 +50,16 @@ def caching_to_representation(model_name, cache_invalidation_time=settings.DEFAU
     return true_decorator
 
 
-def get_object_ids_user_has_permissions(user, model, cached_time=settings.DEFAULT_CACHE_INVALIDATION_TIME):
+def get_redis_client():
     """
-    Cache-keys:
-    - cache_key_objs_user_has_permissions = create_cache_key(user.id, model_name + '_obj_permissions')
-    - cache_key_list_of_user_ids :: list of user.ids for this model --> Used for cache invalidation
-    :param user: User object
-    :param model: Django model
-    :param cached_time: Time IDs are stored in cache
-    :return: List of IDs
+    Returns redis-py client of the default cache, so that Redis data structures (e.g. lists) can be used directly.
+    Keys should be created with cache.make_key so that they match the prefix of the cache.
+    :return: redis.Redis instance, or None if default cache is not RedisCache (e.g. in unit tests)
     """
-    model_name = model.get_name()
-
-    cache_key_objs_user_has_permissions = create_cache_key(user.id, model_name + "_obj_permissions")
-    object_ids_user_has_permissions = cache.get(cache_key_objs_user_has_permissions)
-    if object_ids_user_has_permissions is None:
-        object_ids_user_has_permissions = list(
-            get_objects_for_user(
-                user,
-                f"view_{model_name}",
-                klass=model,
-                use_groups=True,
-                any_perm=False,
-                with_superuser=True,
-                accept_global_perms=False,
-            ).values_list("id", flat=True)
-        )
-        cache.set(cache_key_objs_user_has_permissions, object_ids_user_has_permissions, cached_time)
-
-        cache_key_list_of_users_for_this_model = create_cache_key(0, model_name + "_cache_user_list")
-        list_of_user_ids_for_this_model = cache.get(cache_key_list_of_users_for_this_model)
-        if list_of_user_ids_for_this_model is None:
-            list_of_user_ids_for_this_model = []
-        if cache_key_objs_user_has_permissions not in list_of_user_ids_for_this_model:
-            list_of_user_ids_for_this_model.append(cache_key_objs_user_has_permissions)
-        cache.set(cache_key_list_of_users_for_this_model, list_of_user_ids_for_this_model, cached_time)
-
-    return object_ids_user_has_permissions
+    default_cache = caches["default"]
+    if not isinstance(default_cache, RedisCache):
+        return None
+    return default_cache._cache.get_client(write=True)
 
 
 def invalidate_cache(model_name, object_id):
@@ -95,32 +68,39 @@ def invalidate_cache(model_name, object_id):
     if model_name == "organisaatio":
         cache.delete("{}.{}".format("organisaatio-ui", object_id))
 
-    cache_key_list_of_users_for_this_model = create_cache_key(0, model_name + "_cache_user_list")
-    list_of_users_for_this_model = cache.get(cache_key_list_of_users_for_this_model)
-    if list_of_users_for_this_model:
-        cache.delete_many(list_of_users_for_this_model)
+
+def invalidate_cache_many(model_name, object_id_list):
+    key_list = ["{}.{}".format(model_name, object_id) for object_id in object_id_list]
+    if model_name == "organisaatio":
+        key_list += ["{}.{}".format("organisaatio-ui", object_id) for object_id in object_id_list]
+    cache.delete_many(key_list)
 
 
 def delete_cache_keys_related_model(model_name, object_id):
     cache.delete("{}.{}".format(model_name, object_id))  # cache-value from serializer, e.g. vakajarjestaja.3
 
 
-def delete_object_ids_user_has_permissions(user_id):
+def get_related_organisaatio_cache_key(user_id):
+    return f"related_organisaatio_{user_id}"
+
+
+def get_related_organisaatio_id_list_cache(user_id):
+    return cache.get(get_related_organisaatio_cache_key(user_id), None)
+
+
+def set_related_organisaatio_id_list_cache(user_id, data, cached_time=settings.DEFAULT_CACHE_INVALIDATION_TIME):
+    cache.set(get_related_organisaatio_cache_key(user_id), data, cached_time)
+
+
+def delete_related_organisaatio_cache(user_id):
     """
-    Here we assume if the model has history attr, user has cache keys for that specific model.
+    Delete cached related Organisaatio IDs of user, must be called every time permission groups of user change.
     """
-    from django.apps import apps
-    from django.db import transaction
+    cache.delete(get_related_organisaatio_cache_key(user_id))
 
-    cache_keys = []
-    with transaction.atomic():
-        app_models = apps.get_app_config("varda").get_models()
-        for model in app_models:
-            if hasattr(model, "history"):
-                model_name = model.__name__.lower()
-                cache_key_objs_user_has_permissions = create_cache_key(user_id, model_name + "_obj_permissions")
-                cache_keys.append(cache_key_objs_user_has_permissions)
-        cache.delete_many(cache_keys)
+
+def delete_related_organisaatio_cache_many(user_id_list):
+    cache.delete_many([get_related_organisaatio_cache_key(user_id) for user_id in user_id_list])
 
 
 def get_koodistot_cache(language):
@@ -131,6 +111,44 @@ def set_koodistot_cache(language, data, cached_time=settings.DEFAULT_CACHE_INVAL
     cache.set("koodistot.{}".format(language.upper()), data, cached_time)
 
 
+KOODISTO_INDEX_VERSION_CACHE_KEY = "koodisto_index_version"
+# Process-local index of codes, shared version key in cache is used to detect changes made by other processes
+# (version, {koodisto_name: {code_value.lower(): (alkamis_pvm, paattymis_pvm)}})
+_koodisto_index = (None, {})
+
+
+def get_koodisto_index():
+    """
+    Returns process-local koodisto index, which is reloaded from the database if shared version has changed
+    :return: dict {koodisto_name: {code_value.lower(): (alkamis_pvm, paattymis_pvm)}}
+    """
+    from varda.models import Z2_Code
+
+    global _koodisto_index
+
+    version = cache.get(KOODISTO_INDEX_VERSION_CACHE_KEY)
+    if version is None:
+        cache.add(KOODISTO_INDEX_VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+        version = cache.get(KOODISTO_INDEX_VERSION_CACHE_KEY)
+
+    local_version, index = _koodisto_index
+    if version is None or version != local_version:
+        # Version is read before loading so that changes made during loading cause a new reload
+        index = {}
+        code_qs = Z2_Code.objects.values_list("koodisto__name", "code_value", "alkamis_pvm", "paattymis_pvm")
+        for koodisto_name, code_value, alkamis_pvm, paattymis_pvm in code_qs.iterator():
+            index.setdefault(koodisto_name, {})[code_value.lower()] = (alkamis_pvm, paattymis_pvm)
+        _koodisto_index = (version, index)
+    return index
+
+
+def delete_koodisto_index():
+    """
+    Invalidates koodisto index of every process, must be called every time Z2_Code objects change.
+    """
+    cache.delete(KOODISTO_INDEX_VERSION_CACHE_KEY)
+
+
 def get_localisation_cache(category, locale):
     # keys are hashed to prevent malformed keys in cache
     category = hash_string(category.lower())
@@ -26,11 +26,15 @@ def custom_shared_task(single_instance=False, timeout_in_seconds=8 * 60):
         @shared_task
         @wraps(original_function)
         def _custom_shared_task_wrapper(*args, **kwargs):
+            if not single_instance:
+                # Lock is not needed, arguments (that may contain personal data) are not used in cache keys
+                return original_function(*args, **kwargs)
+
             # Generate a cache key for this specific task, whitespaces are not allowed
             cache_key_suffix = re.sub(r"\s+", "", f"{args}{kwargs}")
             lock_id = "celery-single-instance-{}-{}".format(original_function.__name__, cache_key_suffix)
             # Uses cache as non-persistent storage which could be culled or crash losing all locks!
-            if single_instance and not cache.add(lock_id, "true", timeout_in_seconds):
+            if not cache.add(lock_id, "true", timeout_in_seconds):
                 # Single instance task exists in cache so it is already running, do not execute it again
                 logger.error(f"Task already running with lock_id {lock_id}")
                 return None
@@ -38,7 +42,7 @@ def custom_shared_task(single_instance=False, timeout_in_seconds=8 * 60):
             try:
                 result = original_function(*args, **kwargs)
             finally:
-                # Delete cache key whether task is single_instance or not, no error is raised from deletion
+                # Delete cache key, no error is raised from deletion
                 cache.delete(lock_id)
             return result
 
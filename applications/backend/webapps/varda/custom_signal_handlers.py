@@ -37,6 +37,19 @@ def celery_task_prerun_signal_handler(sender=None, task_id=None, task=None, args
     local_thread.request_id = task_id.replace("-", "")
 
 
+def celery_task_postrun_signal_handler(sender=None, task_id=None, task=None, **extra_kwargs):
+    from varda.misc import pop_external_service_statistics
+
+    # Log request counters of external services used by the task
+    for service_name, statistics in pop_external_service_statistics().items():
+        logger.info(
+            f"Task {getattr(task, 'name', None)} requests to {service_name}: count={statistics['count']}, "
+            f"error_count={statistics['error_count']}, "
+            f"average_duration={statistics['duration'] / statistics['count']:.3f}s, "
+            f"max_duration={statistics['max_duration']:.3f}s"
+        )
+
+
 def celery_task_failure_signal_handler(
     sender=None, task_id=None, exception=None, args=None, kwargs=None, traceback=None, einfo=None, **extra_kwargs
 ):
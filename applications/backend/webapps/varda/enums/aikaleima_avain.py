@@ -13,6 +13,8 @@ class AikaleimaAvain(enum.Enum):
     ORGANISAATIOS_LAST_UPDATE = "ORGANISAATIOS_LAST_UPDATE"
     ORGANISAATIOS_VARDA_LAST_UPDATE = "ORGANISAATIOS_VARDA_LAST_UPDATE"
     REQUEST_SUMMARY_LAST_UPDATE = "REQUEST_SUMMARY_LAST_UPDATE"
+    ERROR_REPORT_LAST_UPDATE = "ERROR_REPORT_LAST_UPDATE"
+    ERROR_REPORT_LAST_FULL_UPDATE = "ERROR_REPORT_LAST_FULL_UPDATE"
     NO_PAAKAYTTAJA = "NO_PAAKAYTTAJA"
     NO_TRANSFERS = "NO_TRANSFERS"
 
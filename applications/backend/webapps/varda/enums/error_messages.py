@@ -45,6 +45,7 @@ class ErrorMessages(enum.Enum):
     GE025 = get_error_dict("GE025", "This field must be a number.")
     GE026 = get_error_dict("GE026", "Check the datetime format.")
     GE027 = get_error_dict("GE027", "Request was throttled. Try again after a short while.")  # AWS WAF
+    GE028 = get_error_dict("GE028", "Invalid cursor.")
 
     # Dynamic errors, prefix: DY
     # If dynamic errors are added or changed, changes should be reflected in frontend virkailija-app parseDynamicValue
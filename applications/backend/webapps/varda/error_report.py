@@ -0,0 +1,291 @@
+import logging
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from varda.enums.aikaleima_avain import AikaleimaAvain
+from varda.misc import TemporaryObject, list_to_chunks
+from varda.models import (
+    Aikaleima,
+    Lapsi,
+    Organisaatio,
+    Toimipaikka,
+    Tyontekija,
+    Tyoskentelypaikka,
+    Varhaiskasvatussuhde,
+    Z9_RelatedObjectChanged,
+    Z14_ErrorReportError,
+)
+
+logger = logging.getLogger(__name__)
+
+ERROR_REPORT_BATCH_SIZE = 1000
+ERROR_REPORT_UPDATE_LOCK_KEY = "error_report_update_lock"
+ERROR_REPORT_UPDATE_LOCK_TIMEOUT = 60 * 60
+ERROR_REPORT_MODEL_LIST = (Lapsi, Tyontekija, Toimipaikka, Organisaatio)
+
+
+def get_error_report_viewset(model):
+    """
+    Returns error report ViewSet of the model initialized with all permissions and without Organisaatio, so that
+    errors are evaluated regardless of the user and the Organisaatio
+    :param model: Lapsi, Tyontekija, Toimipaikka or Organisaatio
+    :return: ViewSet instance
+    """
+    # Import locally to avoid circular reference
+    from varda.viewsets_reporting import (
+        ErrorReportLapsetViewSet,
+        ErrorReportOrganisaatioViewSet,
+        ErrorReportToimipaikatViewSet,
+        ErrorReportTyontekijatViewSet,
+    )
+
+    viewset_dict = {
+        Lapsi: ErrorReportLapsetViewSet,
+        Tyontekija: ErrorReportTyontekijatViewSet,
+        Toimipaikka: ErrorReportToimipaikatViewSet,
+        Organisaatio: ErrorReportOrganisaatioViewSet,
+    }
+    viewset = viewset_dict[model]()
+    viewset.is_vakatiedot_permissions = True
+    viewset.is_tyontekijatiedot_permissions = True
+    viewset.is_huoltajatiedot_permissions = True
+    viewset.format_kwarg = None
+    viewset.request = TemporaryObject(query_params={})
+    return viewset
+
+
+def update_error_report_errors(model, id_list):
+    """
+    Evaluates error report rules for objects and replaces their existing Z14_ErrorReportError objects
+    :param model: Lapsi, Tyontekija, Toimipaikka or Organisaatio
+    :param id_list: list of object IDs
+    :return: number of objects with errors
+    """
+    viewset = get_error_report_viewset(model)
+    errors = viewset.get_errors()
+    error_code_list = [error[0].value["error_code"] for error in errors]
+    model_name = model.get_name()
+
+    error_object_count = 0
+    for id_chunk in list_to_chunks(sorted(set(id_list)), ERROR_REPORT_BATCH_SIZE):
+        raw_query, parameter_list = viewset.get_raw_query(errors, f"{viewset.table_alias}.id = ANY(%s)", [id_chunk])
+        error_list = []
+        for instance in model.objects.raw(raw_query, parameter_list):
+            error_object_count += 1
+            for error_code in error_code_list:
+                error_attr = getattr(instance, error_code.lower(), None)
+                if not error_attr:
+                    continue
+                error_list.append(
+                    Z14_ErrorReportError(
+                        model_name=model_name,
+                        instance_id=instance.id,
+                        error_code=error_code,
+                        model_id_list=sorted({int(model_id) for model_id in error_attr.split(",")}),
+                    )
+                )
+
+        with transaction.atomic():
+            Z14_ErrorReportError.objects.filter(model_name=model_name, instance_id__in=id_chunk).delete()
+            Z14_ErrorReportError.objects.bulk_create(error_list, batch_size=ERROR_REPORT_BATCH_SIZE)
+    return error_object_count
+
+
+def _get_changed_id_dict(timestamp_gte, timestamp_lt):
+    """
+    Returns IDs of objects whose errors may have changed based on Z9_RelatedObjectChanged objects
+    :param timestamp_gte: changes inserted at and after this timestamp are considered
+    :param timestamp_lt: changes inserted before this timestamp are considered
+    :return: dict {model: set of IDs}
+    """
+    changed_qs = Z9_RelatedObjectChanged.objects.filter(
+        inserted_timestamp__gte=timestamp_gte, inserted_timestamp__lt=timestamp_lt
+    )
+    id_dict = {}
+    for model in ERROR_REPORT_MODEL_LIST:
+        id_dict[model] = set(changed_qs.filter(model_name=model.get_name()).values_list("instance_id", flat=True).distinct())
+
+    # Toimipaikka errors depend on Varhaiskasvatussuhde and Tyoskentelypaikka objects, history is used so that
+    # Toimipaikka IDs of deleted and moved objects are also found
+    for trigger_model in (Varhaiskasvatussuhde, Tyoskentelypaikka):
+        trigger_id_qs = changed_qs.filter(trigger_model_name=trigger_model.get_name()).values("trigger_instance_id")
+        id_dict[Toimipaikka].update(
+            trigger_model.history.filter(id__in=Subquery(trigger_id_qs), toimipaikka_id__isnull=False)
+            .values_list("toimipaikka_id", flat=True)
+            .distinct()
+        )
+
+    # Lapsi and Tyontekija errors depend on Toimipaikka objects
+    toimipaikka_id_qs = changed_qs.filter(model_name=Toimipaikka.get_name(), trigger_model_name=Toimipaikka.get_name()).values(
+        "instance_id"
+    )
+    id_dict[Lapsi].update(
+        Lapsi.objects.filter(varhaiskasvatuspaatokset__varhaiskasvatussuhteet__toimipaikka_id__in=Subquery(toimipaikka_id_qs))
+        .values_list("id", flat=True)
+        .distinct()
+    )
+    id_dict[Tyontekija].update(
+        Tyontekija.objects.filter(palvelussuhteet__tyoskentelypaikat__toimipaikka_id__in=Subquery(toimipaikka_id_qs))
+        .values_list("id", flat=True)
+        .distinct()
+    )
+    return id_dict
+
+
+def _get_committed_watermark():
+    """
+    Returns timestamp before which all Z9_RelatedObjectChanged objects have been committed. inserted_timestamp is
+    assigned by the database when the row is inserted (changed_timestamp may be earlier, e.g. if buffered rows are
+    saved later), so objects with inserted_timestamp earlier than the start of the oldest transaction that is still
+    running are visible to other transactions. Both timestamps come from the database clock.
+    :return: datetime
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT LEAST(CLOCK_TIMESTAMP(), MIN(xact_start)) FROM pg_stat_activity
+            WHERE datname = CURRENT_DATABASE() AND backend_type = 'client backend' AND xact_start IS NOT NULL
+                AND pid <> PG_BACKEND_PID()
+            """
+        )
+        return cursor.fetchone()[0]
+
+
+def is_error_report_full_update_needed():
+    """
+    Error report rules depend on the current date, so all objects must be evaluated once a day
+    :return: True if full update has not been run today
+    """
+    aikaleima = Aikaleima.objects.filter(avain=AikaleimaAvain.ERROR_REPORT_LAST_FULL_UPDATE.value).first()
+    return not aikaleima or timezone.localdate(aikaleima.aikaleima) < timezone.localdate()
+
+
+def update_error_report_table(is_full_update=False):
+    """
+    Updates Z14_ErrorReportError table incrementally by evaluating error report rules only for objects that have
+    changed (Z9_RelatedObjectChanged) since the last update. Changes are processed up to a committed watermark
+    (_get_committed_watermark), so changes of long running transactions are not skipped. Objects are updated in chunks
+    that are committed separately, so other transactions are not blocked. Full update is run by
+    update_error_report_table_task (and when table has not been initialized), it also updates changes of Organisaatio
+    attributes and codes.
+    :param is_full_update: True if rules are evaluated for all objects
+    :return: True if table was updated, False if another update is already running
+    """
+    # Uses cache as non-persistent storage similarly to custom_shared_task
+    if not cache.add(ERROR_REPORT_UPDATE_LOCK_KEY, "true", ERROR_REPORT_UPDATE_LOCK_TIMEOUT):
+        logger.info("Z14_ErrorReportError table is already being updated")
+        return False
+
+    try:
+        start_timestamp = timezone.now()
+        watermark = _get_committed_watermark()
+        last_update = Aikaleima.objects.filter(avain=AikaleimaAvain.ERROR_REPORT_LAST_UPDATE.value).first()
+        # Table has not been initialized yet
+        is_full_update = is_full_update or not last_update
+
+        if is_full_update:
+            id_dict = {model: model.objects.values_list("id", flat=True) for model in ERROR_REPORT_MODEL_LIST}
+            # Remove errors of deleted objects
+            for model in ERROR_REPORT_MODEL_LIST:
+                Z14_ErrorReportError.objects.filter(model_name=model.get_name()).exclude(
+                    instance_id__in=Subquery(model.objects.values("id"))
+                ).delete()
+        elif last_update.aikaleima < watermark:
+            id_dict = _get_changed_id_dict(last_update.aikaleima, watermark)
+        else:
+            id_dict = {}
+
+        count_dict = {}
+        for model, id_list in id_dict.items():
+            count_dict[model.get_name()] = update_error_report_errors(model, list(id_list))
+
+        if not last_update or last_update.aikaleima < watermark:
+            # Changes after watermark are processed in the next update, in case of full update they are evaluated again
+            Aikaleima.objects.update_or_create(
+                avain=AikaleimaAvain.ERROR_REPORT_LAST_UPDATE.value, defaults={"aikaleima": watermark}
+            )
+        if is_full_update:
+            Aikaleima.objects.update_or_create(
+                avain=AikaleimaAvain.ERROR_REPORT_LAST_FULL_UPDATE.value, defaults={"aikaleima": start_timestamp}
+            )
+    finally:
+        cache.delete(ERROR_REPORT_UPDATE_LOCK_KEY)
+
+    duration = (timezone.now() - start_timestamp).total_seconds()
+    logger.info(
+        f"Updated Z14_ErrorReportError table, full update: {is_full_update}, objects with errors: {count_dict}, "
+        f"duration: {duration:.2f}s"
+    )
+    return True
+
+
+def get_active_errors_expression(organisaatio_ref="id"):
+    """
+    Returns condition that is True if Organisaatio has any error in Z14_ErrorReportError table, errors are the same
+    that user with all permissions sees in error reports of the Organisaatio
+    :param organisaatio_ref: path to Organisaatio ID in the outer query
+    :return: combined Exists expressions
+    """
+    expression = Q()
+    for model in ERROR_REPORT_MODEL_LIST:
+        viewset = get_error_report_viewset(model)
+        viewset.vakajarjestaja_id = OuterRef(organisaatio_ref)
+        expression |= Exists(viewset.get_persisted_queryset())
+    return expression
+
+
+# Raw SQL that returns organisaatio_id and instance_id (and paos_organisaatio_id for Lapsi) for every object that is
+# visible in error reports of the Organisaatio, Lapsi is visible to vakatoimija, oma_organisaatio and paos_organisaatio
+ERROR_REPORT_ORGANISAATIO_SQL_DICT = {
+    Lapsi: """
+        SELECT DISTINCT org_id.organisaatio_id, la.id AS instance_id, la.paos_organisaatio_id
+        FROM varda_lapsi la
+        CROSS JOIN LATERAL UNNEST(ARRAY[la.vakatoimija_id, la.oma_organisaatio_id, la.paos_organisaatio_id])
+            AS org_id(organisaatio_id)
+        WHERE org_id.organisaatio_id IS NOT NULL
+    """,
+    Tyontekija: "SELECT vakajarjestaja_id AS organisaatio_id, id AS instance_id FROM varda_tyontekija",
+    Toimipaikka: "SELECT vakajarjestaja_id AS organisaatio_id, id AS instance_id FROM varda_toimipaikka",
+}
+
+
+def get_error_count_dict(model, organisaatio_id_list):
+    """
+    Returns number of erroneous objects (model_id_list) per error code for each Organisaatio with a single query,
+    counts are the same as in error reports of a user with all permissions
+    :param model: Lapsi, Tyontekija or Toimipaikka
+    :param organisaatio_id_list: list of Organisaatio IDs
+    :return: dict {organisaatio_id: {error_code: count}}, error codes are in the order of error report rules
+    """
+    viewset = get_error_report_viewset(model)
+    error_code_list = [error[0].value["error_code"] for error in viewset.get_errors()]
+
+    if model == Lapsi:
+        # Maksutieto related errors are not visible to paos_organisaatio (see get_persisted_error_condition)
+        huoltajatiedot_error_code_list = [
+            error[0].value["error_code"] for error in viewset.get_huoltajatiedot_error_nested_list()
+        ]
+        paos_filter = "AND NOT (er.error_code = ANY(%s) AND obj.organisaatio_id IS NOT DISTINCT FROM obj.paos_organisaatio_id)"
+        paos_parameter_list = [huoltajatiedot_error_code_list]
+    else:
+        paos_filter = ""
+        paos_parameter_list = []
+
+    raw_query = f"""
+        SELECT obj.organisaatio_id, er.error_code, SUM(CARDINALITY(er.model_id_list))
+        FROM varda_z14_errorreporterror er
+        JOIN ({ERROR_REPORT_ORGANISAATIO_SQL_DICT[model]}) obj ON obj.instance_id = er.instance_id
+        WHERE er.model_name = %s AND er.error_code = ANY(%s) AND obj.organisaatio_id = ANY(%s) {paos_filter}
+        GROUP BY obj.organisaatio_id, er.error_code
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(raw_query, [model.get_name(), error_code_list, list(organisaatio_id_list), *paos_parameter_list])
+        result_list = cursor.fetchall()
+
+    error_count_dict = {}
+    for organisaatio_id, error_code, count in sorted(result_list, key=lambda result: error_code_list.index(result[1])):
+        error_count_dict.setdefault(organisaatio_id, {})[error_code] = count
+    return error_count_dict
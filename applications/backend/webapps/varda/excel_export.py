@@ -4,6 +4,8 @@ import logging
 import math
 import os
 import shutil
+import time
+import tracemalloc
 import uuid
 from decimal import Decimal
 from pathlib import Path
@@ -27,6 +29,7 @@ from varda.enums.koodistot import Koodistot
 from varda.enums.reporting import ReportStatus
 from varda.enums.supported_language import SupportedLanguage
 from varda.enums.translation import Translation as T
+from varda.error_report import update_error_report_table
 from varda.lokalisointipalvelu import get_translation
 from varda.misc import (
     decrypt_henkilotunnus,
@@ -88,6 +91,22 @@ class ExcelReportSubtype(enum.Enum):
     HENKILOSTO = "HENKILOSTO"
 
 
+# Reports that write rows strictly in order can be generated in xlsxwriter constant_memory mode, in which each row is
+# flushed to disk when the next row is started. Vuosiraportti writes rows out of order so it cannot be streamed.
+STREAMING_REPORT_TYPES = (
+    ExcelReportType.VAKATIEDOT_VOIMASSA.value,
+    ExcelReportType.PUUTTEELLISET_TOIMIPAIKKA.value,
+    ExcelReportType.PUUTTEELLISET_LAPSI.value,
+    ExcelReportType.PUUTTEELLISET_TYONTEKIJA.value,
+    ExcelReportType.TYONTEKIJATIEDOT_VOIMASSA.value,
+    ExcelReportType.TOIMIPAIKAT_VOIMASSA.value,
+    ExcelReportType.MAKSUTIETO_PUUTTUU_LAPSI.value,
+)
+# In constant_memory mode column widths are estimated from the first rows of each worksheet
+AUTOFIT_SAMPLE_ROW_COUNT = 1000
+EXCEL_ITERATOR_CHUNK_SIZE = 1000
+
+
 # Custom headers used sometimes for specific customer requests, to be modified based on request
 # Remember to update vakasuhde_values below as well - for row writing
 VAKASUHDE_HEADERS_CUSTOM = "VAKASUHDE_HEADERS_CUSTOM"
@@ -301,12 +320,14 @@ class AutofitWorksheet(Worksheet):
         self.min_width = 0
         self.last_row = 0
         self.max_column_widths = {}
+        # If set, column widths are calculated only from rows up to this index
+        self.autofit_row_limit = None
 
     @convert_cell_args
     def write(self, row, col, *args):
         result = super(AutofitWorksheet, self).write(row, col, *args)
 
-        if not result < 0:
+        if not result < 0 and (self.autofit_row_limit is None or row <= self.autofit_row_limit):
             # No errors
             value_len = len(str(args[0]))
             # Set width relative to number of characters to better keep the width consistent across columns
@@ -336,6 +357,8 @@ class AutofitWorkbook(Workbook):
 
     def add_worksheet(self, *args, **kwargs):
         worksheet = super(AutofitWorkbook, self).add_worksheet(*args, **kwargs, worksheet_class=AutofitWorksheet)
+        if self.constant_memory:
+            worksheet.autofit_row_limit = AUTOFIT_SAMPLE_ROW_COUNT
         return worksheet
 
     def close(self):
@@ -395,7 +418,11 @@ class ExcelReportGenerator:
         )
 
         file_path = get_excel_local_file_path(report)
-        self.workbook = AutofitWorkbook(file_path, {"default_date_format": "d.m.yyyy"})
+        workbook_options = {
+            "default_date_format": "d.m.yyyy",
+            "constant_memory": report.report_type in STREAMING_REPORT_TYPES,
+        }
+        self.workbook = AutofitWorkbook(file_path, workbook_options)
         self.integer_format = self.workbook.add_format()
         self.integer_format.set_num_format(3)
         self.float_format = self.workbook.add_format()
@@ -403,7 +430,20 @@ class ExcelReportGenerator:
         self.align_right_format = self.workbook.add_format()
         self.align_right_format.set_align("right")
 
-        self._create_excel_report()
+        generation_start_time = time.perf_counter()
+        # Peak is measured with tracemalloc, so that it describes only this report (ru_maxrss is the peak of the whole
+        # worker process)
+        is_tracing = tracemalloc.is_tracing()
+        if is_tracing:
+            tracemalloc.reset_peak()
+        else:
+            tracemalloc.start()
+        try:
+            self._create_excel_report()
+            excel_log.peak_memory_usage = tracemalloc.get_traced_memory()[1] // 1024
+        finally:
+            if not is_tracing:
+                tracemalloc.stop()
 
         # Make sure excel folder exists
         try:
@@ -424,8 +464,10 @@ class ExcelReportGenerator:
 
         report.status = ReportStatus.FINISHED.value
 
+        generation_duration = time.perf_counter() - generation_start_time
         excel_log.file_size = os.stat(file_path).st_size
         excel_log.number_of_rows = self.workbook.number_of_rows_per_worksheet
+        excel_log.rows_per_second = round(sum(excel_log.number_of_rows) / generation_duration) if generation_duration else 0
 
         password = decrypt_excel_report_password(report.password, report.id)
         encryption_start_timestamp = timezone.now()
@@ -452,13 +494,15 @@ class ExcelReportGenerator:
 
         report.save()
 
-        excel_log.finished_timestamp = timezone.now()
-        excel_log.duration = math.ceil((excel_log.finished_timestamp - excel_log.started_timestamp).total_seconds())
-        excel_log.save()
-
         if not self.admin_user_all_organizations:
             # Save data access logs if henkilo_id_oid_set is not empty
+            data_access_log_start_timestamp = timezone.now()
             save_data_access_log(self.report.user, DataAccessType.EXCEL.value, henkilo_id_oid_list=self.henkilo_id_oid_set)
+            excel_log.data_access_log_duration = math.ceil((timezone.now() - data_access_log_start_timestamp).total_seconds())
+
+        excel_log.finished_timestamp = timezone.now()
+        excel_log.duration = math.ceil((excel_log.finished_timestamp - excel_log.started_timestamp).total_seconds())
+        excel_log.save()
 
     def _create_excel_report(self):
         match self.report.report_type:
@@ -535,7 +579,7 @@ class ExcelReportGenerator:
         else:
             self._write_headers(vakasuhde_sheet, VAKASUHDE_HEADERS)
 
-        for index, vakasuhde in enumerate(vakasuhde_qs.iterator(), 1):
+        for index, vakasuhde in enumerate(vakasuhde_qs.iterator(chunk_size=EXCEL_ITERATOR_CHUNK_SIZE), 1):
             vakapaatos = vakasuhde.varhaiskasvatuspaatos
             lapsi = vakapaatos.lapsi
             henkilo = lapsi.henkilo
@@ -639,7 +683,7 @@ class ExcelReportGenerator:
             maksutieto_sheet = self._add_worksheet(T.EXCEL_MAKSUTIETO)
             self._write_headers(maksutieto_sheet, MAKSUTIETO_HEADERS)
 
-            for index, maksutieto in enumerate(maksutieto_qs.iterator(chunk_size=1000), 1):
+            for index, maksutieto in enumerate(maksutieto_qs.iterator(chunk_size=EXCEL_ITERATOR_CHUNK_SIZE), 1):
                 # Lapsi information
                 maksutieto_values = [
                     maksutieto.henkilo_oid,
@@ -724,8 +768,13 @@ class ExcelReportGenerator:
         self.error_koodisto = self._get_koodisto_with_translations(Koodistot.virhe_koodit.value)
         self.lahdejarjestelma_koodisto = self._get_koodisto_with_translations(Koodistot.lahdejarjestelma_koodit.value)
 
-        queryset = viewset.get_queryset()
-        serializer_data = viewset.get_serializer(queryset, many=True).data
+        # Errors are read from Z14_ErrorReportError table instead of evaluating the rules for the whole Organisaatio
+        update_error_report_table()
+        queryset = viewset.get_persisted_queryset()
+        # Objects are serialized one by one so that data of the whole Organisaatio is not kept in memory
+        serializer_data = (
+            viewset.get_serializer(instance).data for instance in queryset.iterator(chunk_size=EXCEL_ITERATOR_CHUNK_SIZE)
+        )
         data_handler_function(worksheet, serializer_data)
 
     def _create_puutteelliset_toimipaikka_report(self, worksheet, data):
@@ -991,7 +1040,7 @@ class ExcelReportGenerator:
         self._write_headers(toimipaikka_sheet, TOIMIPAIKKA_HEADERS)
 
         index = 1
-        for toimipaikka in toimipaikka_qs.iterator(chunk_size=1000):
+        for toimipaikka in toimipaikka_qs.iterator(chunk_size=EXCEL_ITERATOR_CHUNK_SIZE):
             painotus_list = list(toimipaikka.toiminnallisetpainotukset.all()) + list(toimipaikka.kielipainotukset.all())
             if len(painotus_list) == 0:
                 # We want at least one row for toimipaikka
@@ -1553,14 +1602,20 @@ class ExcelReportGenerator:
         return self._get_translation(T.EXCEL_YES) if boolean_value else self._get_translation(T.EXCEL_NO)
 
     def _get_koodisto_with_translations(self, koodisto):
-        return list(
+        """
+        Returns translations of koodisto codes keyed by lowercase code value so that each cell is a dict lookup
+        :param koodisto: name of the koodisto
+        :return: dict {code_value.lower(): name}
+        """
+        code_qs = (
             Z2_Code.objects.filter(Q(koodisto__name=koodisto) & Q(translations__language__iexact=self.language))
             .annotate(name=F("translations__name"))
-            .values(
-                "code_value",
-                "name",
-            )
+            .values_list("code_value", "name")
         )
+        translation_dict = {}
+        for code_value, name in code_qs:
+            translation_dict.setdefault(code_value.lower(), name)
+        return translation_dict
 
     def _generate_filename(self):
         default_name = self.report.report_type
@@ -1611,17 +1666,17 @@ class ExcelReportGenerator:
                     worksheet.write(row, index, value)
 
 
-def _get_code_translation(code_list, code):
+def _get_code_translation(code_dict, code):
     if not code:
         return None
-    for code_list_item in code_list:
-        if code_list_item.get("code_value").lower() == code.lower():
-            return f'{code_list_item.get("name")} ({code.lower()})'
+    code_lower = code.lower()
+    if code_lower in code_dict:
+        return f"{code_dict[code_lower]} ({code_lower})"
     return code
 
 
-def _get_multiple_code_translations(code_list, code_value_list):
-    return ", ".join([_get_code_translation(code_list, code_value) for code_value in code_value_list])
+def _get_multiple_code_translations(code_dict, code_value_list):
+    return ", ".join([_get_code_translation(code_dict, code_value) for code_value in code_value_list])
 
 
 def _get_dates_for_model_and_id(model_name, model_id):
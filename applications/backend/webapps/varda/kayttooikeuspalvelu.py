@@ -1,12 +1,11 @@
 import logging
 
 from django.conf import settings
-from django.contrib.auth.models import User
-from django.db import IntegrityError, transaction
-from django.db.models import Q
+from django.contrib.auth.models import Group, User
+from django.db import transaction
 from rest_framework.exceptions import AuthenticationFailed
 
-from varda.cache import delete_object_ids_user_has_permissions
+from varda.cache import delete_related_organisaatio_cache
 from varda.clients import organisaatio_client
 from varda.enums.error_messages import ErrorMessages
 from varda.enums.kayttajatyyppi import Kayttajatyyppi
@@ -17,8 +16,17 @@ from varda.misc import get_json_from_external_service, get_reply_json
 from varda.models import Toimipaikka, Organisaatio, Z3_AdditionalCasUserFields, Z4_CasKayttoOikeudet, LoginCertificate
 from varda.oppijanumerorekisteri import fetch_yhteystieto_data_for_henkilo_oid_list, get_user_data
 from varda.organisaatiopalvelu import create_toimipaikka_using_oid, create_organization_using_oid
-from varda.permission_groups import get_permission_group
-from varda.permissions import delete_all_user_permissions, get_related_organisaatio_for_user, is_oph_staff
+from varda.permission_groups import (
+    get_oph_yllapitaja_group_name,
+    get_organisaatio_oid_from_group_name,
+    get_permission_group,
+)
+from varda.permissions import (
+    delete_all_user_permissions,
+    delete_user_object_permissions,
+    get_related_organisaatio_for_user,
+    is_oph_staff,
+)
 
 
 logger = logging.getLogger(__name__)
@@ -108,33 +116,72 @@ def set_user_kayttooikeudet(henkilo_oid, user):
     if is_oph_staff(user) and is_oph_yllapitaja:
         return None
 
-    delete_all_user_permissions(user, delete_henkilo_permissions=False)
-
-    # After removal, let's set the user permissions.
+    kayttooikeus_list = []
     for permissions_by_organization in permissions_by_organization_list:
-        fetch_permissions_roles_for_organization(
-            user.id, henkilo_oid, permissions_by_organization["organization_data"], permissions_by_organization["permissions"]
-        )
+        organization_data = permissions_by_organization["organization_data"]
+        permission_list = permissions_by_organization["permissions"]
+        roles = fetch_permissions_roles_for_organization(henkilo_oid, organization_data, permission_list)
+        kayttooikeus_list.extend((organization_data["oid"], role) for role in roles)
+
+    # Only changed permissions are deleted or created, user specific object permissions are always deleted
+    update_user_kayttooikeudet(user, kayttooikeus_list)
+    delete_user_object_permissions(user, delete_henkilo_permissions=False)
 
     if is_oph_yllapitaja:
         update_oph_staff_to_vakajarjestaja_groups.delay(user_id=user.id)
 
 
-def set_user_permissions(user, organisation, role):
-    organization_oid = organisation["oid"]
-    try:
-        Z4_CasKayttoOikeudet.objects.create(user=user, organisaatio_oid=organization_oid, kayttooikeus=role)
-    except IntegrityError:
-        logger.warning("User with id: " + str(user.id) + " is hitting an IntegrityError.")
-        return None  # Shouldn't ever come here unless several people are using the same credentials.
+@transaction.atomic
+def update_user_kayttooikeudet(user, kayttooikeus_list):
+    """
+    Update Z4_CasKayttoOikeudet objects and permission groups of user so that only changed permissions are deleted or
+    created.
+    :param user: User object
+    :param kayttooikeus_list: list of (organisaatio_oid, kayttooikeus) tuples
+    """
+    kayttooikeus_list = list(dict.fromkeys(kayttooikeus_list))
+    kayttooikeus_set = set(kayttooikeus_list)
+
+    existing_kayttooikeus_set = set()
+    deleted_id_list = []
+    for kayttooikeus_id, organisaatio_oid, kayttooikeus in Z4_CasKayttoOikeudet.objects.filter(user=user).values_list(
+        "id", "organisaatio_oid", "kayttooikeus"
+    ):
+        key = (organisaatio_oid, kayttooikeus)
+        if key in kayttooikeus_set and key not in existing_kayttooikeus_set:
+            existing_kayttooikeus_set.add(key)
+        else:
+            # Permission has been removed or is a duplicate
+            deleted_id_list.append(kayttooikeus_id)
+    Z4_CasKayttoOikeudet.objects.filter(id__in=deleted_id_list).delete()
+    Z4_CasKayttoOikeudet.objects.bulk_create(
+        [
+            Z4_CasKayttoOikeudet(user=user, organisaatio_oid=organisaatio_oid, kayttooikeus=kayttooikeus)
+            for organisaatio_oid, kayttooikeus in kayttooikeus_list
+            if (organisaatio_oid, kayttooikeus) not in existing_kayttooikeus_set
+        ]
+    )
 
-    organization_specific_permission_group = get_permission_group(role, organization_oid)
-    if organization_specific_permission_group is not None:
-        organization_specific_permission_group.user_set.add(user)  # Assign the user to this permission_group
+    group_name_list = [f"{kayttooikeus}_{organisaatio_oid}" for organisaatio_oid, kayttooikeus in kayttooikeus_list]
+    group_list = list(Group.objects.filter(name__in=group_name_list))
+    for missing_group_name in set(group_name_list).difference(group.name for group in group_list):
+        logger.error("Did not find permission_group with name: " + missing_group_name)
 
+    # set only adds and removes changed groups, active groups are resolved before setting user.groups so that groups
+    # are not first set to all groups and then narrowed down
+    active_group_id_list = None
+    if cas_fields := user.additional_cas_user_fields:
+        cas_fields.all_groups.set(group_list)
+        active_group_id_list = get_active_group_id_list(user, cas_fields)
+    user.groups.set(group_list if active_group_id_list is None else active_group_id_list)
+    delete_related_organisaatio_cache(user.id)
 
-def fetch_permissions_roles_for_organization(user_id, henkilo_oid, organisation, permission_group_list):
-    user = User.objects.get(id=user_id)
+
+def fetch_permissions_roles_for_organization(henkilo_oid, organisation, permission_group_list):
+    """
+    Return Varda permission roles of user in organisation, organisation is created if it does not exist yet
+    :return: list of Z4_CasKayttoOikeudet.KAYTTOOIKEUSROOLIT values
+    """
     organization_oid = organisation["oid"]
     """
     User might have multiple of VARDA-permissions to one single organization. We take into account only the 'highest' permission the user has.
@@ -234,7 +281,7 @@ def fetch_permissions_roles_for_organization(user_id, henkilo_oid, organisation,
         roles.append(Z4_CasKayttoOikeudet.YLLAPITAJA)
 
     if all(role is None for role in roles):
-        return None
+        return []
 
     """
     We know the organization is either vakajarjestaja or vaka-toimipaikka,
@@ -246,9 +293,9 @@ def fetch_permissions_roles_for_organization(user_id, henkilo_oid, organisation,
         logger.warning(
             "Organisaatio {0} creation failed for henkilo {1}. Skipping role creation.".format(organization_oid, henkilo_oid)
         )
-        return None
+        return []
 
-    [set_user_permissions(user, organisation, role) for role in roles if role is not None]
+    return [role for role in roles if role is not None]
 
 
 def create_organization_or_toimipaikka_if_needed(organization):
@@ -479,6 +526,9 @@ def set_active_groups_for_user(user, organisaatio_obj=None):
     :param user: User object
     :param organisaatio_obj: Organisaatio object
     """
+    # Permission groups of user may have changed before this function was called (e.g. on login)
+    delete_related_organisaatio_cache(user.id)
+
     if user.is_superuser or is_oph_staff(user):
         # Skip for admin and OPH users
         return None
@@ -491,9 +541,32 @@ def set_active_groups_for_user(user, organisaatio_obj=None):
         # all_groups has not been set yet, initialize groups
         cas_fields.all_groups.set(user.groups.all())
 
-    organisaatio_qs = get_related_organisaatio_for_user(user, groups=cas_fields.all_groups)
+    active_group_id_list = get_active_group_id_list(user, cas_fields, organisaatio_obj=organisaatio_obj)
+    if active_group_id_list is None:
+        # No need to reset permission groups
+        return None
+
+    user.groups.set(active_group_id_list)
+    delete_related_organisaatio_cache(user.id)
+
+
+def get_active_group_id_list(user, cas_fields, organisaatio_obj=None):
+    """
+    Resolve permission groups that are active for user, so that User only has active permissions to one organization
+    at a time.
+    :param user: User object
+    :param cas_fields: Z3_AdditionalCasUserFields object of user
+    :param organisaatio_obj: Organisaatio object, defaults to the first Organisaatio of user
+    :return: list of Group IDs, or None if all permission groups of user are active
+    """
+    all_group_qs = cas_fields.all_groups.all()
+    if user.is_superuser or all_group_qs.filter(name=get_oph_yllapitaja_group_name()).exists():
+        # Admin and OPH users have all permission groups active
+        return None
+
+    organisaatio_qs = get_related_organisaatio_for_user(user, groups=all_group_qs)
     if organisaatio_qs.count() == 1:
-        # User only has permissions to a single Organisaatio, no need to reset permission groups
+        # User only has permissions to a single Organisaatio
         return None
 
     # Set default Organisaatio if one was not provided
@@ -503,19 +576,22 @@ def set_active_groups_for_user(user, organisaatio_obj=None):
         logger.warning(f"Could not determine Organisaatio for User with ID {user.id}")
         return None
 
-    group_filter = Q(name__endswith=organisaatio_obj.organisaatio_oid)
-    toimipaikka_oid_list = (
-        Toimipaikka.objects.filter(vakajarjestaja=organisaatio_obj)
-        .exclude(organisaatio_oid="")
-        .values_list("organisaatio_oid", flat=True)
+    # Resolve organisaatio_oid of each permission group of user, and check which of them belong to selected or default
+    # Organisaatio with a single lookup, instead of matching group names against every Toimipaikka of Organisaatio
+    group_oid_dict = {
+        group_id: organisaatio_oid
+        for group_id, group_name in all_group_qs.values_list("id", "name")
+        if (organisaatio_oid := get_organisaatio_oid_from_group_name(group_name))
+    }
+    organisaatio_oid_set = set(
+        Toimipaikka.objects.filter(
+            vakajarjestaja=organisaatio_obj, organisaatio_oid__in=set(group_oid_dict.values())
+        ).values_list("organisaatio_oid", flat=True)
     )
-    for organisaatio_oid in toimipaikka_oid_list:
-        group_filter |= Q(name__endswith=organisaatio_oid)
+    organisaatio_oid_set.add(organisaatio_obj.organisaatio_oid)
 
-    # Get all permission groups that are related to selected or default Organisaatio and set them as active groups
-    group_qs = cas_fields.all_groups.filter(group_filter)
-    user.groups.set(group_qs)
-    delete_object_ids_user_has_permissions(user.id)
+    # All permission groups that are related to selected or default Organisaatio are active groups
+    return [group_id for group_id, organisaatio_oid in group_oid_dict.items() if organisaatio_oid in organisaatio_oid_set]
 
 
 def get_all_paakayttaja_users():
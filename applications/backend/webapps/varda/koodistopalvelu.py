@@ -4,7 +4,7 @@ import logging
 from django.db import transaction
 from django.db.models import Q
 
-from varda.cache import delete_cache_keys_related_model
+from varda.cache import delete_cache_keys_related_model, delete_koodisto_index
 from varda.clients import koodistopalvelu_client
 from varda.enums.koodistot import Koodistot
 from varda.enums.supported_language import SupportedLanguage
@@ -106,3 +106,4 @@ def parse_koodistopalvelu_datetime(input_datetime):
 def delete_koodisto_cache():
     for language in SupportedLanguage.list():
         delete_cache_keys_related_model("koodistot", language)
+    delete_koodisto_index()
@@ -0,0 +1,69 @@
+import django.contrib.postgres.fields.ranges
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import BtreeGistExtension
+from django.db import migrations, models
+
+
+def forwards_func(apps, schema_editor):
+    from varda.misc_operations import rebuild_history_interval_table
+
+    db_alias = schema_editor.connection.alias
+    # Populate Z13_HistoryInterval from existing history, new rows are created when historical records are created
+    for model_name in (
+        "organisaatio",
+        "vuokrattuhenkilosto",
+        "toimipaikka",
+        "toiminnallinenpainotus",
+        "kielipainotus",
+        "lapsi",
+        "varhaiskasvatuspaatos",
+        "varhaiskasvatussuhde",
+        "maksutieto",
+        "tyontekija",
+        "tutkinto",
+        "palvelussuhde",
+        "tyoskentelypaikka",
+        "pidempipoissaolo",
+        "taydennyskoulutus",
+        "taydennyskoulutustyontekija",
+    ):
+        history_model = apps.get_model("varda", f"historical{model_name}")
+        rebuild_history_interval_table(model_name, history_model._meta.db_table, using=db_alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("varda", "0095_alter_historicaltoimipaikka_postinumero_and_more"),
+    ]
+
+    operations = [
+        # Required for GiST index with model_name column
+        BtreeGistExtension(),
+        migrations.CreateModel(
+            name="Z13_HistoryInterval",
+            fields=[
+                ("id", models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("model_name", models.CharField(max_length=200)),
+                ("instance_id", models.IntegerField()),
+                ("history_id", models.IntegerField()),
+                ("history_type", models.CharField(max_length=1)),
+                ("valid_period", django.contrib.postgres.fields.ranges.DateTimeRangeField()),
+            ],
+            options={
+                "verbose_name_plural": "History intervals",
+                "indexes": [
+                    django.contrib.postgres.indexes.GistIndex(
+                        fields=["model_name", "valid_period"],
+                        include=["instance_id", "history_id", "history_type"],
+                        name="varda_z13_mod_period_gist",
+                    ),
+                    models.Index(fields=["model_name", "instance_id"], name="varda_z13_mod_instance_idx"),
+                ],
+                "constraints": [
+                    models.UniqueConstraint(fields=("model_name", "history_id"), name="model_name_history_id_unique_constraint")
+                ],
+            },
+        ),
+        migrations.RunPython(forwards_func, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("varda", "0096_z13_historyinterval"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="z8_excelreportlog",
+            name="data_access_log_duration",
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("varda", "0097_z8_excelreportlog_data_access_log_duration"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="z8_excelreportlog",
+            name="rows_per_second",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="z8_excelreportlog",
+            name="peak_memory_usage",
+            field=models.IntegerField(default=0),
+        ),
+    ]
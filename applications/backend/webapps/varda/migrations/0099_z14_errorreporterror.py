@@ -0,0 +1,31 @@
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("varda", "0098_z8_excelreportlog_rows_per_second_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Z14_ErrorReportError",
+            fields=[
+                ("id", models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("model_name", models.CharField(max_length=200)),
+                ("instance_id", models.IntegerField()),
+                ("error_code", models.CharField(max_length=10)),
+                ("model_id_list", django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), size=None)),
+            ],
+            options={
+                "verbose_name_plural": "Error report errors",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("model_name", "instance_id", "error_code"),
+                        name="model_name_instance_id_error_code_unique_constraint",
+                    )
+                ],
+            },
+        ),
+    ]
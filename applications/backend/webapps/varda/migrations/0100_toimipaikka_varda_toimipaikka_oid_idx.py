@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("varda", "0099_z14_errorreporterror"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="toimipaikka",
+            index=models.Index(fields=["organisaatio_oid"], name="varda_toimipaikka_oid_idx"),
+        ),
+    ]
@@ -0,0 +1,17 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("varda", "0100_toimipaikka_varda_toimipaikka_oid_idx"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="z6_requestlog",
+            name="timestamp",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,53 @@
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("varda", "0101_alter_z6_requestlog_timestamp"),
+    ]
+
+    operations = [
+        # Merge rows that were considered distinct by the old constraint because of NULL values
+        migrations.RunSQL(
+            """
+            WITH last_request AS (
+                SELECT id,
+                    ROW_NUMBER() OVER w AS row_number,
+                    MAX(last_successful) OVER w AS last_successful,
+                    MAX(last_unsuccessful) OVER w AS last_unsuccessful
+                FROM varda_z6_lastrequest
+                WINDOW w AS (
+                    PARTITION BY COALESCE(user_id, -1), COALESCE(vakajarjestaja_id, -1), COALESCE(lahdejarjestelma, ''),
+                        COALESCE(data_category, '')
+                    ORDER BY id ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING
+                )
+            ), updated_last_request AS (
+                UPDATE varda_z6_lastrequest lr
+                SET last_successful = last_request.last_successful, last_unsuccessful = last_request.last_unsuccessful
+                FROM last_request
+                WHERE lr.id = last_request.id AND last_request.row_number = 1
+            )
+            DELETE FROM varda_z6_lastrequest
+            WHERE id IN (SELECT id FROM last_request WHERE row_number > 1);
+            """,
+            migrations.RunSQL.noop,
+        ),
+        migrations.RemoveConstraint(
+            model_name="z6_lastrequest",
+            name="last_request_user_vakaj_lahdej_data_categ_unique_constraint",
+        ),
+        migrations.AddConstraint(
+            model_name="z6_lastrequest",
+            constraint=models.UniqueConstraint(
+                django.db.models.functions.comparison.Coalesce("user", models.Value(-1), output_field=models.IntegerField()),
+                django.db.models.functions.comparison.Coalesce(
+                    "vakajarjestaja", models.Value(-1), output_field=models.IntegerField()
+                ),
+                django.db.models.functions.comparison.Coalesce("lahdejarjestelma", models.Value("")),
+                django.db.models.functions.comparison.Coalesce("data_category", models.Value("")),
+                name="last_request_user_vakaj_lahdej_data_categ_coalesce_unique",
+            ),
+        ),
+    ]
@@ -0,0 +1,22 @@
+import django.db.models.functions.datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("varda", "0102_z6_lastrequest_coalesce_unique"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="z9_relatedobjectchanged",
+            name="inserted_timestamp",
+            field=models.DateTimeField(db_default=django.db.models.functions.datetime.Now(), db_index=True),
+        ),
+        # Existing rows get the time of the migration, run full update of error report table instead of processing them
+        migrations.RunSQL(
+            "DELETE FROM varda_aikaleima WHERE avain = 'ERROR_REPORT_LAST_UPDATE';",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -10,6 +10,7 @@ import random
 import requests
 import secrets
 import sys
+import threading
 import time
 
 from calendar import monthrange
@@ -35,7 +36,13 @@ from varda.enums.error_messages import ErrorMessages
 from varda.enums.koodistot import Koodistot
 from varda.helper_functions import hide_hetu
 from varda.models import Henkilo, Toimipaikka, Z2_CodeTranslation, Tukipaatos
-from varda.oph_yhteiskayttopalvelu_autentikaatio import get_authentication_header, get_contenttype_header
+from varda.oph_yhteiskayttopalvelu_autentikaatio import (
+    clear_authenticated_session,
+    get_authentication_header,
+    get_contenttype_header,
+    get_session,
+    has_authenticated_session,
+)
 from webapps.celery import app as celery_app
 
 
@@ -44,6 +51,10 @@ logger = logging.getLogger(__name__)
 CHECK_KEYS = "0123456789ABCDEFHJKLMNPRSTUVWXY"
 CENTURIES = {"18": "+", "19": "-", "20": "A"}
 
+# Request counters of external services, see update_external_service_statistics
+_external_service_statistics = {}
+_external_service_statistics_lock = threading.Lock()
+
 
 class CustomServerErrorException(APIException):
     default_detail = {"errors": [ErrorMessages.MI016.value]}
@@ -211,9 +222,10 @@ def decode_json_msg(reply_type, response, service_name):
     return json_msg
 
 
-def send_request_get_response(service_name, http_url_suffix, headers, request_type, data_json, large_query):
+def send_request_get_response(service_name, http_url_suffix, headers, request_type, data_json, large_query, allow_redirects=True):
     """
     Request timeout: https://requests.readthedocs.io/en/master/user/advanced/#timeouts
+    Requests are made using pooled session of the service, see oph_yhteiskayttopalvelu_autentikaatio.get_session
     """
     DEFAULT_CONNECT_TIMEOUT = 7  # seconds
     DEFAULT_READ_TIMEOUT = 60  # seconds
@@ -224,25 +236,61 @@ def send_request_get_response(service_name, http_url_suffix, headers, request_ty
         DEFAULT_TIMEOUT_TUPLE = (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT)
     response = None
 
+    session = get_session(service_name)
+    start_time = time.perf_counter()
     try:
         http_complete_url = settings.OPINTOPOLKU_DOMAIN + "/" + service_name + http_url_suffix
-        if request_type == "get":
-            response = requests.get(http_complete_url, headers=headers, timeout=DEFAULT_TIMEOUT_TUPLE)
-        elif request_type == "post":
-            response = requests.post(http_complete_url, headers=headers, data=data_json, timeout=DEFAULT_TIMEOUT_TUPLE)
-        else:  # put
-            response = requests.put(http_complete_url, headers=headers, data=data_json, timeout=DEFAULT_TIMEOUT_TUPLE)
+        response = session.request(
+            request_type.upper(),
+            http_complete_url,
+            headers=headers,
+            data=None if request_type == "get" else data_json,
+            timeout=DEFAULT_TIMEOUT_TUPLE,
+            allow_redirects=allow_redirects,
+        )
     except (RequestException, ConnectionError, Timeout) as e:
         logger.error("Failed to make a request. Url: {}, Error: {}".format(http_complete_url, e))
 
+    update_external_service_statistics(
+        service_name, time.perf_counter() - start_time, response is None or response.status_code >= 400
+    )
     return response
 
 
+def update_external_service_statistics(service_name, duration, is_error):
+    """
+    Updates request count, error count and latency counters of the service. Counters are process specific and they
+    are logged and reset after each Celery task, see custom_signal_handlers.celery_task_postrun_signal_handler
+    :param service_name: name of the service
+    :param duration: duration of the request in seconds
+    :param is_error: True if request failed
+    """
+    with _external_service_statistics_lock:
+        statistics = _external_service_statistics.setdefault(
+            service_name, {"count": 0, "error_count": 0, "duration": 0.0, "max_duration": 0.0}
+        )
+        statistics["count"] += 1
+        statistics["error_count"] += int(is_error)
+        statistics["duration"] += duration
+        statistics["max_duration"] = max(statistics["max_duration"], duration)
+
+
+def pop_external_service_statistics():
+    """
+    Returns and resets request counters of services
+    :return: dict, e.g. {"oppijanumerorekisteri-service": {"count": 2, "error_count": 0, "duration": 0.5, ...}}
+    """
+    with _external_service_statistics_lock:
+        statistics_dict = dict(_external_service_statistics)
+        _external_service_statistics.clear()
+    return statistics_dict
+
+
 def _log_failed_request_hide_hetu(service_name, http_url_suffix, headers, response):
     url_possible_hetu_hidden = hide_hetu(service_name + http_url_suffix)
     logger.error(
         "{}: Authentication issue. Status_code: {}. Url: {}. Service-ticket: {}.".format(
-            service_name, response.status_code, url_possible_hetu_hidden, headers["CasSecurityTicket"]
+            service_name, response.status_code, url_possible_hetu_hidden, headers.get("CasSecurityTicket")
         )
     )
 
@@ -259,12 +307,23 @@ def send_request_to_external_service(
     number_of_attempt = 0
     while number_of_attempt < MAX_NO_OF_ATTEMPS:
         number_of_attempt += 1
+        # Service ticket is not needed if session of the service has already been authenticated
+        is_session_reused = auth and has_authenticated_session(service_name)
         headers = (
             get_authentication_header(service_name, external_request=False, force_new_tgt=force_new_tgt)
-            if auth
+            if auth and not is_session_reused
             else get_contenttype_header()
         )
-        response = send_request_get_response(service_name, http_url_suffix, headers, request_type, data_json, large_query)
+        # Expired session is redirected to CAS login, do not follow redirect
+        response = send_request_get_response(
+            service_name,
+            http_url_suffix,
+            headers,
+            request_type,
+            data_json,
+            large_query,
+            allow_redirects=not is_session_reused,
+        )
         if response is None:
             logger.error("Could not get a response: {}, {}, {}".format(request_type, service_name, http_url_suffix))
             sleep_if_not_test(2)
@@ -277,9 +336,15 @@ def send_request_to_external_service(
             response.close()
             sleep_if_not_test(2)
             continue
+        elif is_session_reused and (response.status_code == status.HTTP_401_UNAUTHORIZED or response.is_redirect):
+            # Session has expired, authenticate again with a new service ticket
+            clear_authenticated_session(service_name)
+            response.close()
+            continue
         elif response.status_code == status.HTTP_401_UNAUTHORIZED:
             if number_of_attempt == MAX_NO_OF_ATTEMPS:
                 _log_failed_request_hide_hetu(service_name, http_url_suffix, headers, response)
+            clear_authenticated_session(service_name)
             response.close()
             sleep_if_not_test(2)
             force_new_tgt = True
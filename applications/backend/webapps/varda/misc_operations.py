@@ -1,31 +1,40 @@
 import logging
+from functools import partial
 
-from django.db import transaction
-from django.db.models import Q
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Q, prefetch_related_objects
+from django.utils import timezone
+from psycopg import sql
 from rest_framework.exceptions import ValidationError
 
+from varda.cache import invalidate_cache_many
 from varda.enums.error_messages import ErrorMessages
 from varda.enums.hallinnointijarjestelma import Hallinnointijarjestelma
 from varda.models import (
     KieliPainotus,
+    Lapsi,
     Maksutieto,
+    PaosOikeus,
     Palvelussuhde,
     ToiminnallinenPainotus,
     Toimipaikka,
     Tyoskentelypaikka,
     Varhaiskasvatuspaatos,
     Varhaiskasvatussuhde,
+    Z10_KelaVarhaiskasvatussuhde,
+    Z13_HistoryInterval,
 )
+from varda.permissions import delete_object_permissions
 
 logger = logging.getLogger(__name__)
 
+BULK_OPERATION_BATCH_SIZE = 1000
 
-def save_paattymis_pvm(instance, paattymis_pvm):
+
+def validate_paattymis_pvm(instance, paattymis_pvm):
     if instance.alkamis_pvm > paattymis_pvm:
         logger.error(f"Could not update paattymis_pvm for {instance._meta.model.__name__} with id {instance.id}.")
         raise ValidationError({"paattymis_pvm": [ErrorMessages.MI004.value]})
-    instance.paattymis_pvm = paattymis_pvm
-    instance.save()
 
 
 def set_paattymis_pvm_for_vakajarjestaja_data(vakajarjestaja, paattymis_pvm):
@@ -65,9 +74,169 @@ def set_paattymis_pvm_for_vakajarjestaja_data(vakajarjestaja, paattymis_pvm):
 
         result_dict = {}
         for qs in qs_list:
-            index = 0
-            for instance in qs.iterator():
-                save_paattymis_pvm(instance, paattymis_pvm)
-                index += 1
-            result_dict[qs.model.get_name()] = index
+            instance_list = list(qs)
+            for instance in instance_list:
+                validate_paattymis_pvm(instance, paattymis_pvm)
+                instance.paattymis_pvm = paattymis_pvm
+            bulk_update_objects(instance_list, ["paattymis_pvm"])
+            result_dict[qs.model.get_name()] = len(instance_list)
         return result_dict
+
+
+def rebuild_history_interval_table(model_name, history_table_name, using=DEFAULT_DB_ALIAS):
+    """
+    Rebuilds Z13_HistoryInterval rows of a model from its history table. Validity interval of a historical row ends
+    when the next historical row of the same instance begins.
+    :param model_name: name of the model, e.g. lapsi
+    :param history_table_name: name of the history table, e.g. varda_historicallapsi
+    :param using: database alias
+    """
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        # PostgreSQL specific functionality (tstzrange, window function)
+        interval_table = sql.Identifier(Z13_HistoryInterval._meta.db_table)
+        cursor.execute(sql.SQL("DELETE FROM {} WHERE model_name = %s;").format(interval_table), [model_name])
+        cursor.execute(
+            sql.SQL(
+                """
+                INSERT INTO {} (model_name, instance_id, history_id, history_type, valid_period)
+                SELECT %s, id, history_id, history_type,
+                    tstzrange(history_date, LEAD(history_date) OVER (PARTITION BY id ORDER BY history_date, history_id), '[)')
+                FROM {};
+            """
+            ).format(interval_table, sql.Identifier(history_table_name)),
+            [model_name],
+        )
+
+
+def bulk_create_objects(instance_list, batch_size=BULK_OPERATION_BATCH_SIZE):
+    """
+    Creates objects of the same model with bulk_create. post_save signal is not sent, instead historical records,
+    Z13_HistoryInterval, Z9_RelatedObjectChanged and Z10_KelaVarhaiskasvatussuhde objects are created and cache is
+    invalidated in bulk, so that the end result is the same as if objects were saved one by one. Object permissions
+    are not assigned.
+    :param instance_list: list of unsaved objects
+    :param batch_size: batch size of bulk_create
+    :return: list of created objects
+    """
+    if not instance_list:
+        return []
+
+    model = type(instance_list[0])
+    _set_paos_kytkin(model, instance_list)
+    with transaction.atomic():
+        model.objects.bulk_create(instance_list, batch_size=batch_size)
+        _handle_bulk_operation(model, instance_list, "+", batch_size)
+    return instance_list
+
+
+def bulk_update_objects(instance_list, field_list, batch_size=BULK_OPERATION_BATCH_SIZE):
+    """
+    Updates objects of the same model with bulk_update. post_save signal is not sent, instead historical records,
+    Z13_HistoryInterval, Z9_RelatedObjectChanged and Z10_KelaVarhaiskasvatussuhde objects are created and cache is
+    invalidated in bulk, so that the end result is the same as if objects were saved one by one.
+    :param instance_list: list of modified objects
+    :param field_list: list of updated field names
+    :param batch_size: batch size of bulk_update
+    :return: number of updated objects
+    """
+    if not instance_list:
+        return 0
+
+    model = type(instance_list[0])
+    field_set = set(field_list)
+    # bulk_update does not set auto_now fields (e.g. muutos_pvm)
+    now = timezone.now()
+    for field in model._meta.concrete_fields:
+        if getattr(field, "auto_now", False):
+            field_set.add(field.name)
+            for instance in instance_list:
+                setattr(instance, field.attname, now)
+    if _set_paos_kytkin(model, instance_list):
+        field_set.add("paos_kytkin")
+
+    with transaction.atomic():
+        update_count = model.objects.bulk_update(instance_list, list(field_set), batch_size=batch_size)
+        _handle_bulk_operation(model, instance_list, "~", batch_size)
+    return update_count
+
+
+def bulk_delete_objects(queryset, batch_size=BULK_OPERATION_BATCH_SIZE):
+    """
+    Deletes objects of a QuerySet with a single delete query. pre_delete and post_delete signals are not sent, instead
+    object permissions are deleted, historical records, Z13_HistoryInterval, Z9_RelatedObjectChanged and
+    Z10_KelaVarhaiskasvatussuhde objects are created and cache is invalidated in bulk. on_delete rules of related
+    objects are not applied, deletion fails if objects are still referenced.
+    :param queryset: QuerySet of deleted objects
+    :param batch_size: batch size of bulk_create of related objects
+    :return: number of deleted objects
+    """
+    model = queryset.model
+    with transaction.atomic():
+        instance_list = list(queryset)
+        if not instance_list:
+            return 0
+
+        delete_qs = model.objects.filter(id__in=[instance.id for instance in instance_list])
+        delete_object_permissions(delete_qs)
+        _handle_bulk_operation(model, instance_list, "-", batch_size)
+        return delete_qs._raw_delete(delete_qs.db)
+
+
+def _set_paos_kytkin(model, instance_list):
+    """
+    paos_kytkin of Lapsi is set in apps.receiver_save, set it before bulk operation instead
+    :return: True if paos_kytkin was set
+    """
+    if model is not Lapsi:
+        return False
+    for instance in instance_list:
+        instance.paos_kytkin = instance.paos_organisaatio_id is not None
+    return True
+
+
+def _handle_bulk_operation(model, instance_list, history_type, batch_size):
+    """
+    Bulk equivalent of apps.receiver_save, apps.receiver_pre_delete, apps.receiver_post_delete and historical record
+    creation of simple_history.
+    """
+    from varda.apps import get_kela_varhaiskasvatussuhde, handle_related_object_change, update_history_intervals
+    from varda.tasks import change_paos_tallentaja_organization_task
+
+    model_name = model.get_name()
+    history_date = timezone.now()
+    invalidate_cache_many(model_name, [instance.id for instance in instance_list])
+
+    if model is Varhaiskasvatussuhde:
+        prefetch_related_objects(instance_list, "varhaiskasvatuspaatos__lapsi__henkilo")
+        Z10_KelaVarhaiskasvatussuhde.objects.bulk_create(
+            [get_kela_varhaiskasvatussuhde(instance, history_type, history_date=history_date) for instance in instance_list],
+            batch_size=batch_size,
+        )
+    elif model is PaosOikeus:
+        # tallentaja_organisaatio has been changed or PaosOikeus has been deleted, run permission changes after commit
+        for organisaatio_id_pair in {
+            (instance.jarjestaja_kunta_organisaatio_id, instance.tuottaja_organisaatio_id) for instance in instance_list
+        }:
+            transaction.on_commit(partial(change_paos_tallentaja_organization_task.delay, *organisaatio_id_pair))
+
+    # Z9_RelatedObjectChanged objects are saved with a single bulk_create when transaction is committed
+    for instance in instance_list:
+        handle_related_object_change(instance, history_type)
+
+    if hasattr(model, "history"):
+        history_model = model.history.model
+        # Resolve history user (e.g. varda_system) only once
+        history_user = history_model.get_default_history_user(instance_list[0])
+        history_instance_list = history_model.objects.bulk_create(
+            [
+                history_model(
+                    history_date=history_date,
+                    history_user=history_user,
+                    history_type=history_type,
+                    **{field.attname: getattr(instance, field.attname) for field in history_model.tracked_fields},
+                )
+                for instance in instance_list
+            ],
+            batch_size=batch_size,
+        )
+        update_history_intervals(model_name, history_instance_list)
@@ -6,7 +6,7 @@ from django.contrib.auth.models import Group
 from django.contrib.postgres.aggregates import ArrayAgg
 from django.core.cache import cache
 from django.db import connections
-from django.db.models import OuterRef, Q, Subquery
+from django.db.models import Exists, OuterRef, Q, Subquery
 from django.db.models.functions import Lower
 from django.utils import timezone
 from guardian.shortcuts import get_objects_for_group
@@ -25,6 +25,7 @@ from varda.models import (
     Z2_Code,
     Z4_CasKayttoOikeudet,
     Z9_RelatedObjectChanged,
+    Z13_HistoryInterval,
 )
 
 
@@ -56,9 +57,21 @@ def get_paos_toimipaikat(vakajarjestaja_obj, is_only_active_paostoiminta_include
     return PaosToiminta.objects.filter(paostoiminta_condition).values_list("paos_toimipaikka", flat=True)
 
 
-def get_related_object_changed_id_qs(model_name, datetime_gt, datetime_lte, additional_filters=Q(), return_value="instance_id"):
-    return (
-        Z9_RelatedObjectChanged.objects.values("model_name", "instance_id", "trigger_model_name", "trigger_instance_id")
+def get_related_object_changed_id_qs(
+    model_name, datetime_gt, datetime_lte, additional_filters=Q(), return_value="instance_id", partition_field=None
+):
+    """
+    Get IDs of objects that have been changed during the time window (excluding objects that have been both created
+    and deleted during the time window)
+    :param partition_field: if provided, changes are evaluated separately for each value of the field and
+        (partition_field value, return_value value) pairs are returned (e.g. for all parent objects of a page at once)
+    """
+    values_list = ["model_name", "instance_id", "trigger_model_name", "trigger_instance_id"]
+    if partition_field and partition_field not in values_list:
+        values_list.append(partition_field)
+
+    id_qs = (
+        Z9_RelatedObjectChanged.objects.values(*values_list)
         .filter(
             Q(model_name=model_name)
             & Q(changed_timestamp__gt=datetime_gt)
@@ -67,9 +80,32 @@ def get_related_object_changed_id_qs(model_name, datetime_gt, datetime_lte, addi
         )
         .annotate(history_type_array=ArrayAgg("history_type", distinct=True))
         .exclude(history_type_array__contains=["+", "-"])
-        .values_list(return_value, flat=True)
-        .distinct()
     )
+    if partition_field:
+        return id_qs.values_list(partition_field, return_value).distinct()
+    return id_qs.values_list(return_value, flat=True).distinct()
+
+
+def get_history_interval_id_qs(model, datetime_lte, datetime_gt=None, additional_filters=Q()):
+    """
+    Get history_id values of the latest historical rows of objects at datetime_lte using Z13_HistoryInterval
+    (range index scan instead of DISTINCT ON over the history table)
+    :param model: model class, e.g. Lapsi
+    :param datetime_lte: point in time
+    :param datetime_gt: if provided, only objects that have been changed during the time window are included
+        (excluding objects that have been both created and deleted during the time window)
+    :param additional_filters: additional filters, e.g. Q(instance_id__in=id_qs)
+    :return: QuerySet of history_id values
+    """
+    interval_qs = Z13_HistoryInterval.objects.filter(
+        Q(model_name=model.get_name()) & Q(valid_period__contains=datetime_lte) & additional_filters
+    )
+    if datetime_gt is not None:
+        created_subquery = model.history.filter(id=OuterRef("instance_id"), history_type="+", history_date__gt=datetime_gt)
+        interval_qs = interval_qs.filter(valid_period__startswith__gt=datetime_gt).exclude(
+            Q(history_type="-") & Exists(created_subquery)
+        )
+    return interval_qs.values("history_id")
 
 
 def _execute_yearly_report_query(
@@ -659,8 +695,7 @@ def get_top_results(request, queryset, permission_group_list, oid_list):
     :return: List of object URIs
     """
     # Import locally to avoid circular import
-    from varda.cache import get_object_ids_user_has_permissions
-    from varda.permissions import is_oph_staff, user_permission_groups_in_organizations
+    from varda.permissions import get_object_id_qs_user_has_permissions, is_oph_staff, user_permission_groups_in_organizations
 
     items_to_show = 3
     user = request.user
@@ -669,8 +704,8 @@ def get_top_results(request, queryset, permission_group_list, oid_list):
     permission_group_qs = user_permission_groups_in_organizations(user, oid_list, permission_group_list)
     if not user.is_superuser and not is_oph_staff(user) and not permission_group_qs.exists():
         # User is not superuser, OPH user and does not belong to correct permission groups
-        id_list = get_object_ids_user_has_permissions(user, queryset.model)
-        queryset = queryset.filter(id__in=id_list)
+        id_qs = get_object_id_qs_user_has_permissions(user, queryset.model)
+        queryset = queryset.filter(id__in=id_qs)
     queryset = queryset.order_by("id")[:items_to_show].values("pk")
     return [
         reverse(viewname=f"{queryset_model_name}-detail", kwargs={"pk": instance["pk"]}, request=request) for instance in queryset
@@ -686,6 +721,31 @@ def get_history_value_subquery(model, field_name, datetime_param):
     )
 
 
+def get_history_instances_by_id(model, id_list, datetime_lte, fallback_to_current=False):
+    """
+    Get last historical instances of multiple objects as of datetime_lte with a single DISTINCT ON query
+    :param model: Model class that has history
+    :param id_list: list of object IDs
+    :param datetime_lte: datetime
+    :param fallback_to_current: if True, objects that do not exist in history table are fetched from actual table
+        (history is incomplete in test environments)
+    :return: dict of object ID and instance pairs
+    """
+    id_set = {object_id for object_id in id_list if object_id is not None}
+    if not id_set:
+        return {}
+
+    instance_dict = {
+        instance.id: instance
+        for instance in model.history.filter(id__in=id_set, history_date__lte=datetime_lte)
+        .distinct("id")
+        .order_by("id", "-history_date")
+    }
+    if fallback_to_current and (missing_id_set := id_set - instance_dict.keys()):
+        instance_dict.update(model.objects.in_bulk(missing_id_set))
+    return instance_dict
+
+
 def get_active_filter(target_date, target_date_secondary=None, prefix=""):
     """
     Get Q filter for getting only objects that are currently active. Optionally use prefix to filter on related data.
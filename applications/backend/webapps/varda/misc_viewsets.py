@@ -1,15 +1,16 @@
 import datetime
+import json
 
-from django.http import Http404
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.exceptions import ValidationError
 from rest_framework.mixins import ListModelMixin
 
-from varda.cache import get_object_ids_user_has_permissions
 from varda.custom_swagger import OidIdSchema, TunnisteIdSchema
 from varda.enums.error_messages import ErrorMessages
-from varda.permissions import is_oph_staff
+from varda.permissions import get_object_id_qs_user_has_permissions, is_oph_staff
 from webapps.api_throttles import SustainedModifyRateThrottle, BurstRateThrottle
 
 
@@ -252,5 +253,37 @@ class PermissionListMixin(ListModelMixin):
         user = request.user
         if not user.is_superuser and not is_oph_staff(user):
             # Get permission filtered results for non admin users
-            self.queryset = self.queryset.filter(id__in=get_object_ids_user_has_permissions(user, self.queryset.model))
+            self.queryset = self.queryset.filter(id__in=get_object_id_qs_user_has_permissions(user, self.queryset.model))
         return super().list(request, *args, **kwargs)
+
+
+class StreamingListMixin:
+    """
+    Mixin that returns all list results as newline delimited JSON if stream=true query parameter is provided.
+    Queryset is executed only once and results are serialized in chunks, so that a large result can be fetched
+    in a single pass without paginating (and re-executing) the query.
+    @DynamicAttrs
+    """
+
+    stream_query_param = "stream"
+    stream_chunk_size = 1000
+
+    def list(self, request, *args, **kwargs):
+        if parse_query_parameter(request.query_params, self.stream_query_param, bool):
+            queryset = self.filter_queryset(self.get_queryset())
+            return StreamingHttpResponse(self._stream_queryset(queryset), content_type="application/x-ndjson")
+        return super().list(request, *args, **kwargs)
+
+    def _stream_queryset(self, queryset):
+        chunk = []
+        for instance in queryset.iterator():
+            chunk.append(instance)
+            if len(chunk) >= self.stream_chunk_size:
+                yield self._serialize_chunk(chunk)
+                chunk = []
+        if chunk:
+            yield self._serialize_chunk(chunk)
+
+    def _serialize_chunk(self, chunk):
+        serializer = self.get_serializer(chunk, many=True)
+        return "".join(f"{json.dumps(item, cls=DjangoJSONEncoder)}\n" for item in serializer.data)
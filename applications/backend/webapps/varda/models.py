@@ -3,10 +3,12 @@ from datetime import datetime, timedelta, timezone
 
 import django.utils.timezone
 from django.contrib.auth.models import Group, User
-from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.fields import ArrayField, DateTimeRangeField
+from django.contrib.postgres.indexes import GistIndex
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import IntegrityError, models
-from django.db.models import CheckConstraint, F, Index, Q, UniqueConstraint
+from django.db.models import CheckConstraint, F, Index, Q, UniqueConstraint, Value
+from django.db.models.functions import Coalesce, Now
 from rest_framework.exceptions import ValidationError
 from simple_history.models import HistoricalRecords
 
@@ -201,6 +203,10 @@ class Toimipaikka(UniqueLahdejarjestelmaTunnisteMixin, HistoryAbstractModel):
                 name="toimipaikka_lahdejarjestelma_tunniste_unique_constraint",
             ),
         ]
+        indexes = [
+            # Used in kayttooikeuspalvelu.set_active_groups_for_user to resolve active permission groups
+            Index(fields=["organisaatio_oid"], name="varda_toimipaikka_oid_idx"),
+        ]
 
 
 class ToiminnallinenPainotus(UniqueLahdejarjestelmaTunnisteMixin, HistoryAbstractModel):
@@ -1083,7 +1089,8 @@ class Z6_RequestLog(AbstractModel):
     vakajarjestaja = models.ForeignKey(Organisaatio, related_name="request_log", on_delete=models.PROTECT, null=True)
     data_category = models.CharField(max_length=200, null=True)
     user = models.ForeignKey(User, related_name="request_log", on_delete=models.PROTECT, null=True)
-    timestamp = models.DateTimeField(auto_now=True)
+    # Time of the request, set explicitly because Z6_RequestLog objects are saved in a background task
+    timestamp = models.DateTimeField(default=django.utils.timezone.now)
 
     class Meta:
         indexes = [
@@ -1106,9 +1113,14 @@ class Z6_LastRequest(AbstractModel):
     class Meta:
         verbose_name_plural = "Last requests"
         constraints = [
+            # Fields can be NULL, so unique index is created on COALESCE'd values (NULL values are considered equal),
+            # used in tasks.update_last_request_table_task (ON CONFLICT)
             models.UniqueConstraint(
-                fields=["user", "vakajarjestaja", "lahdejarjestelma", "data_category"],
-                name="last_request_user_vakaj_lahdej_data_categ_unique_constraint",
+                Coalesce("user", Value(-1), output_field=models.IntegerField()),
+                Coalesce("vakajarjestaja", Value(-1), output_field=models.IntegerField()),
+                Coalesce("lahdejarjestelma", Value("")),
+                Coalesce("data_category", Value("")),
+                name="last_request_user_vakaj_lahdej_data_categ_coalesce_unique",
             )
         ]
 
@@ -1208,6 +1220,10 @@ class Z8_ExcelReportLog(AbstractModel):
     file_size = models.IntegerField()
     number_of_rows = ArrayField(models.IntegerField(), validators=[validators.validate_arrayfield])
     encryption_duration = models.IntegerField(default=0)
+    data_access_log_duration = models.IntegerField(default=0)
+    rows_per_second = models.IntegerField(default=0)
+    # Peak memory allocated during report generation in kilobytes
+    peak_memory_usage = models.IntegerField(default=0)
 
     class Meta:
         verbose_name_plural = "Excel report logs"
@@ -1226,6 +1242,8 @@ class Z9_RelatedObjectChanged(AbstractModel):
     trigger_instance_id = models.IntegerField()
     changed_timestamp = models.DateTimeField()
     history_type = models.CharField(max_length=1)
+    # Assigned by the database when row is inserted, used to process changes incrementally (error_report)
+    inserted_timestamp = models.DateTimeField(db_default=Now(), db_index=True)
 
     class Meta:
         indexes = [
@@ -1307,3 +1325,71 @@ class Z12_DataAccessLog(AbstractModel):
     class Meta:
         verbose_name_plural = "Data access logs"
         indexes = [Index(fields=["timestamp"])]
+
+
+class Z13_HistoryInterval(AbstractModel):
+    """
+    Validity interval [history_date, next history_date) of each historical row of models used in reporting APIs,
+    so that "state at time T" and "changed between T1 and T2" can be resolved with a range index scan instead of
+    sorting whole history tables (DISTINCT ON).
+    """
+
+    MODEL_NAME_LIST = (
+        Organisaatio.get_name(),
+        VuokrattuHenkilosto.get_name(),
+        Toimipaikka.get_name(),
+        ToiminnallinenPainotus.get_name(),
+        KieliPainotus.get_name(),
+        Lapsi.get_name(),
+        Varhaiskasvatuspaatos.get_name(),
+        Varhaiskasvatussuhde.get_name(),
+        Maksutieto.get_name(),
+        Tyontekija.get_name(),
+        Tutkinto.get_name(),
+        Palvelussuhde.get_name(),
+        Tyoskentelypaikka.get_name(),
+        PidempiPoissaolo.get_name(),
+        Taydennyskoulutus.get_name(),
+        TaydennyskoulutusTyontekija.get_name(),
+    )
+
+    model_name = models.CharField(max_length=200)
+    instance_id = models.IntegerField()
+    history_id = models.IntegerField()
+    history_type = models.CharField(max_length=1)
+    valid_period = DateTimeRangeField()
+
+    class Meta:
+        indexes = [
+            # Used to get history rows valid at specific time, PostgreSQL specific functionality (GiST, btree_gist)
+            GistIndex(
+                name="varda_z13_mod_period_gist",
+                fields=["model_name", "valid_period"],
+                include=["instance_id", "history_id", "history_type"],
+            ),
+            # Used when closing the open interval of an instance and to check if instance was created during time window
+            Index(name="varda_z13_mod_instance_idx", fields=["model_name", "instance_id"]),
+        ]
+        constraints = [UniqueConstraint(fields=["model_name", "history_id"], name="model_name_history_id_unique_constraint")]
+        verbose_name_plural = "History intervals"
+
+
+class Z14_ErrorReportError(AbstractModel):
+    """
+    Persisted results of error report rules (viewsets_reporting.AbstractErrorReportViewSet), one row per object and
+    error code. Updated incrementally by error_report.update_error_report_table.
+    """
+
+    model_name = models.CharField(max_length=200)
+    instance_id = models.IntegerField()
+    error_code = models.CharField(max_length=10)
+    model_id_list = ArrayField(models.IntegerField())
+
+    class Meta:
+        constraints = [
+            # Also used to get errors of specific objects
+            UniqueConstraint(
+                fields=["model_name", "instance_id", "error_code"], name="model_name_instance_id_error_code_unique_constraint"
+            )
+        ]
+        verbose_name_plural = "Error report errors"
@@ -1,8 +1,10 @@
 import logging
 import os
 import requests
+import threading
 
 from django.conf import settings
+from http.cookiejar import DefaultCookiePolicy
 from time import sleep
 from urllib.parse import urlencode
 
@@ -12,11 +14,48 @@ from varda.models import Z1_OphAuthentication
 
 logger = logging.getLogger(__name__)
 
+# Session cookie set by CAS protected Opintopolku services after a service ticket has been validated
+CAS_SESSION_COOKIE_NAME = "JSESSIONID"
+
+# requests.Session is not guaranteed to be thread safe, so sessions are stored per thread
+_session_local = threading.local()
+
 """
 Example taken from: https://github.com/Opetushallitus/tarjonta-api-dokumentaatio/blob/master/lib/authenticate.js
 """
 
 
+def get_session(service_name, store_cookies=True):
+    """
+    Returns requests.Session of the service. Session keeps connections to the service alive (connection pool) and
+    stores session cookie of the service, so that a new service ticket is not needed for every request.
+    :param service_name: name of the service, e.g. oppijanumerorekisteri-service
+    :param store_cookies: if False, cookies are not stored in the session
+    :return: requests.Session object
+    """
+    session_dict = getattr(_session_local, "session_dict", None)
+    if session_dict is None:
+        session_dict = _session_local.session_dict = {}
+    if (session := session_dict.get(service_name)) is None:
+        session = session_dict[service_name] = requests.Session()
+        if not store_cookies:
+            session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    return session
+
+
+def _get_cas_session():
+    # CAS is also used to authenticate external users (palvelukayttajat), so cookies must not be shared
+    return get_session("cas", store_cookies=False)
+
+
+def has_authenticated_session(service_name):
+    return CAS_SESSION_COOKIE_NAME in get_session(service_name).cookies
+
+
+def clear_authenticated_session(service_name):
+    get_session(service_name).cookies.clear()
+
+
 def get_new_ticketing_granting_ticket(username, password, external_request):
     """
     Ticketing granting ticket should be long lasting, therefore we save it to DB:
@@ -32,7 +71,7 @@ def get_new_ticketing_granting_ticket(username, password, external_request):
     headers = {"Content-Type": "application/x-www-form-urlencoded", **OPINTOPOLKU_HEADERS}
 
     try:
-        r = requests.post(settings.OPINTOPOLKU_DOMAIN + "/cas/v1/tickets", data=credentials, headers=headers)
+        r = _get_cas_session().post(settings.OPINTOPOLKU_DOMAIN + "/cas/v1/tickets", data=credentials, headers=headers)
     except requests.exceptions.RequestException as e:
         logger.error(f"RequestException for /cas/v1/tickets. Error: {e}.")
         return None
@@ -71,7 +110,7 @@ def get_service_ticket(service_suffix, username, password, external_request, for
             break
 
         try:
-            r = requests.post(ticket_granting_ticket_location, data=service_ticket_url, headers=headers)
+            r = _get_cas_session().post(ticket_granting_ticket_location, data=service_ticket_url, headers=headers)
         except requests.exceptions.RequestException as e:
             logger.error(f"RequestException for ticket_granting_ticket_location. Error: {e}.")
             sleep(2)
@@ -1,9 +1,11 @@
 import datetime
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from django.conf import settings
-from django.db import models, IntegrityError, transaction
-from django.db.models import Q
+from django.db import connection, models, IntegrityError, transaction
+from django.db.models import Exists, OuterRef, Q
 from django.utils.dateparse import parse_date, parse_datetime
 from pytz import timezone
 from requests import RequestException
@@ -11,6 +13,7 @@ from rest_framework.exceptions import NotFound, APIException
 from simple_history.utils import update_change_reason
 
 from varda.clients.oppijanumerorekisteri_client import (
+    fetch_henkilo_data_for_oid_list,
     fetch_yhteystiedot,
     get_henkilo_data_by_oid,
     fetch_changed_henkilot,
@@ -20,13 +23,18 @@ from varda.enums.aikaleima_avain import AikaleimaAvain
 from varda.enums.batcherror_type import BatchErrorType
 from varda.enums.yhteystieto import Yhteystietoryhmatyyppi, YhteystietoAlkupera, YhteystietoTyyppi
 from varda.misc import CustomServerErrorException, encrypt_string, get_json_from_external_service, hash_string, list_to_chunks
-from varda.models import Henkilo, Huoltaja, Huoltajuussuhde, Lapsi, Aikaleima, BatchError
+from varda.misc_operations import bulk_create_objects, bulk_update_objects
+from varda.models import Henkilo, Huoltaja, Huoltajuussuhde, Lapsi, Aikaleima, BatchError, Tyontekija
 
 
 logger = logging.getLogger(__name__)
 
 
 SERVICE_NAME = "oppijanumerorekisteri-service"
+# Number of henkilot fetched with a single request from oppijanumerorekisteri
+HENKILO_BATCH_SIZE = 1000
+# Number of threads used to fetch huoltajat of children (one request per child) from oppijanumerorekisteri
+HUOLTAJAT_MAX_WORKERS = 4
 
 
 def batch_error_decorator(batch_error_type):
@@ -63,8 +71,16 @@ def check_henkilot_without_vtj_yksilointi():
     count = henkilo_id_oid_tuples.count()
     logger.info(f"Loop through henkilot without vtj-yksilointi. Current count: {count}.")
 
-    for henkilo_id, henkilo_oid in henkilo_id_oid_tuples:
-        _fetch_henkilo_data_by_oid(henkilo_oid, henkilo_id, reason=simple_history_reason, return_not_throw_error=True)
+    for henkilo_id_oid_chunk in list_to_chunks(list(henkilo_id_oid_tuples), HENKILO_BATCH_SIZE):
+        henkilo_data_dict = get_henkilo_data_dict([henkilo_oid for henkilo_id, henkilo_oid in henkilo_id_oid_chunk])
+        for henkilo_id, henkilo_oid in henkilo_id_oid_chunk:
+            _fetch_henkilo_data_by_oid(
+                henkilo_oid,
+                henkilo_id,
+                henkilo_data=henkilo_data_dict.get(henkilo_oid),
+                reason=simple_history_reason,
+                return_not_throw_error=True,
+            )
 
     end_count = Henkilo.objects.filter(
         Q(vtj_yksiloity=False), Q(luonti_pvm__lt=cutoff_time), ~Q(henkilo_oid=""), Q(henkilo_oid__isnull=False)
@@ -72,15 +88,31 @@ def check_henkilot_without_vtj_yksilointi():
     logger.info(f"Loop through henkilot without vtj-yksilointi. End count: {end_count}.")
 
 
+def _get_henkilo_with_roles_qs():
+    """
+    Annotate Henkilo objects with their roles so that they can be resolved without additional queries
+    :return: Henkilo queryset with is_tyontekija, is_huoltaja and is_lapsi annotations
+    """
+    return Henkilo.objects.annotate(
+        is_tyontekija=Exists(Tyontekija.objects.filter(henkilo=OuterRef("id"))),
+        is_huoltaja=Exists(Huoltaja.objects.filter(henkilo=OuterRef("id"))),
+        is_lapsi=Exists(Lapsi.objects.filter(henkilo=OuterRef("id"))),
+    )
+
+
 @transaction.atomic
-def save_henkilo_to_db(henkilo_id, henkilo_json, reason=None, return_not_throw_error=False):
-    henkilo = Henkilo.objects.get(id=henkilo_id)
+def save_henkilo_to_db(henkilo_id, henkilo_json, reason=None, return_not_throw_error=False, henkilo=None):
+    """
+    :param henkilo: Prefetched Henkilo object from _get_henkilo_with_roles_qs, fetched by henkilo_id if not provided
+    """
+    if not henkilo:
+        henkilo = _get_henkilo_with_roles_qs().get(id=henkilo_id)
     changes = {"has_changes": False}
 
     set_if_changed = _create_change_detector(changes)
 
-    only_tyontekija = henkilo.tyontekijat.exists() and not hasattr(henkilo, "huoltaja") and not henkilo.lapsi.exists()
-    only_huoltaja = hasattr(henkilo, "huoltaja") and not henkilo.tyontekijat.exists() and not henkilo.lapsi.exists()
+    only_tyontekija = henkilo.is_tyontekija and not henkilo.is_huoltaja and not henkilo.is_lapsi
+    only_huoltaja = henkilo.is_huoltaja and not henkilo.is_tyontekija and not henkilo.is_lapsi
 
     if only_huoltaja and henkilo.syntyma_pvm is not None:
         set_if_changed(henkilo, "syntyma_pvm", None)  # Clear syntyma_pvm from huoltaja
@@ -300,8 +332,63 @@ def _set_address_to_henkilo(henkilo_json, henkilo):
 
 
 @batch_error_decorator(BatchErrorType.HENKILOTIETO_UPDATE)
-def fetch_henkilo_data_by_oid(henkilo_oid, henkilo_id):
-    _fetch_henkilo_data_by_oid(henkilo_oid, henkilo_id)
+def fetch_henkilo_data_by_oid(henkilo_oid, henkilo_id, henkilo_data=None):
+    _fetch_henkilo_data_by_oid(henkilo_oid, henkilo_id, henkilo_data=henkilo_data)
+
+
+def get_henkilo_data_dict(henkilo_oid_list):
+    """
+    Fetch henkilo data of multiple henkilot from oppijanumerorekisteri with a single request. Data of duplicate henkilot
+    is not returned, because their master data must be fetched separately.
+    :param henkilo_oid_list: list of henkilo_oid values
+    :return: dict where key is henkilo_oid and value is henkilo data
+    """
+    return {
+        henkilo_data["oidHenkilo"]: henkilo_data
+        for henkilo_data in fetch_henkilo_data_for_oid_list(henkilo_oid_list)
+        if not henkilo_data.get("duplicate", False)
+    }
+
+
+def update_henkilo_data_by_id_list(henkilo_id_list):
+    """
+    Update master data of multiple henkilot from oppijanumerorekisteri. Data is fetched in batches, master data of
+    henkilot not included in the batch response (e.g. duplicates) is fetched separately. Henkilot of a batch are
+    saved in a single transaction, errors are handled per henkilo.
+    :param henkilo_id_list: list of Henkilo IDs
+    """
+    for henkilo_id_chunk in list_to_chunks(henkilo_id_list, HENKILO_BATCH_SIZE):
+        henkilo_list = list(_get_henkilo_with_roles_qs().filter(id__in=henkilo_id_chunk).exclude(henkilo_oid=""))
+        henkilo_data_dict = get_henkilo_data_dict([henkilo.henkilo_oid for henkilo in henkilo_list])
+
+        # Fetch missing master data before opening the transaction
+        error_dict = {}
+        for henkilo in henkilo_list:
+            if henkilo.henkilo_oid in henkilo_data_dict:
+                continue
+            try:
+                if henkilo_data := get_henkilo_data_by_oid(henkilo.henkilo_oid):
+                    henkilo_data_dict[henkilo.henkilo_oid] = henkilo_data
+                else:
+                    raise RequestException(
+                        f"Could not get data from oppijanumerorekisteri for henkilo {henkilo.id} {henkilo.henkilo_oid}"
+                    )
+            except Exception as e:
+                error_dict[henkilo.id] = e
+
+        with transaction.atomic():
+            saved_henkilo_id_list = []
+            for henkilo in henkilo_list:
+                try:
+                    if error := error_dict.get(henkilo.id):
+                        raise error
+                    save_henkilo_to_db(henkilo.id, henkilo_data_dict[henkilo.henkilo_oid], henkilo=henkilo)
+                except Exception as e:
+                    logger.exception("BatchError caught exception")
+                    _create_or_update_henkilo_obj_batch_error(henkilo, e, BatchErrorType.HENKILOTIETO_UPDATE)
+                else:
+                    saved_henkilo_id_list.append(henkilo.id)
+            BatchError.objects.filter(henkilo_id__in=saved_henkilo_id_list, type=BatchErrorType.HENKILOTIETO_UPDATE.name).delete()
 
 
 def _fetch_henkilo_data_by_oid(henkilo_oid, henkilo_id, henkilo_data=None, reason=None, return_not_throw_error=False):
@@ -331,12 +418,12 @@ def fetch_henkilot_with_oid():
     """
     Import here to avoid circular references.
     """
-    from varda.tasks import update_henkilo_data_by_oid
+    from varda.tasks import update_henkilo_data_by_id_list_task
 
-    henkilo_id_oid_tuples = Henkilo.objects.exclude(henkilo_oid="").values_list("id", "henkilo_oid")
-    for henkilo_id, henkilo_oid in henkilo_id_oid_tuples:
-        update_henkilo_data_by_oid.apply_async(
-            args=[henkilo_oid, henkilo_id], kwargs={"is_fetch_huoltajat": True}, queue="low_prio_queue"
+    henkilo_id_list = Henkilo.objects.exclude(henkilo_oid="").order_by("id").values_list("id", flat=True)
+    for henkilo_id_chunk in list_to_chunks(list(henkilo_id_list), HENKILO_BATCH_SIZE):
+        update_henkilo_data_by_id_list_task.apply_async(
+            args=[henkilo_id_chunk], kwargs={"is_fetch_huoltajat": True}, queue="low_prio_queue"
         )
 
 
@@ -365,7 +452,7 @@ def fetch_and_update_modified_henkilot():
     """
     Import here to avoid circular references.
     """
-    from varda.tasks import update_henkilo_data_by_oid
+    from varda.tasks import update_henkilo_data_by_id_list_task
 
     aikaleima, created = Aikaleima.objects.get_or_create(avain=AikaleimaAvain.HENKILOMUUTOS_LAST_UPDATE.name)
 
@@ -380,23 +467,32 @@ def fetch_and_update_modified_henkilot():
     ).values_list("henkilo__henkilo_oid", flat=True)
 
     if changed_henkilo_oids["is_ok"]:
-        for oppijanumero in changed_henkilo_oids["json_msg"] + list(retry_henkilo_oids):
-            try:
-                henkilo = Henkilo.objects.get(henkilo_oid=oppijanumero)
-            except Henkilo.DoesNotExist:
-                continue  # This is ok. No further actions needed.
-            except Henkilo.MultipleObjectsReturned as e:  # This should never be possible
-                logger.error("Multiple of henkilot was found with henkilo_oid: " + oppijanumero)
+        oppijanumero_set = set(changed_henkilo_oids["json_msg"]) | set(retry_henkilo_oids)
+        # Resolve Henkilo objects of all changed oppijanumerot with a single query
+        henkilo_id_oid_list = list(
+            Henkilo.objects.filter(henkilo_oid__in=oppijanumero_set).order_by("id").values_list("id", "henkilo_oid")
+        )
+
+        henkilo_id_oid_dict = {}
+        for henkilo_id, henkilo_oid in henkilo_id_oid_list:
+            henkilo_id_oid_dict.setdefault(henkilo_oid, []).append(henkilo_id)
+        for henkilo_oid, henkilo_id_list in henkilo_id_oid_dict.items():
+            if len(henkilo_id_list) > 1:  # This should never be possible
+                logger.error("Multiple of henkilot was found with henkilo_oid: " + henkilo_oid)
+                error = Henkilo.MultipleObjectsReturned(f"Multiple of henkilot was found with henkilo_oid: {henkilo_oid}")
                 [
-                    _create_or_update_henkilo_obj_batch_error(henkilo, e, BatchErrorType.HENKILOTIETO_UPDATE)
-                    for henkilo in Henkilo.objects.filter(henkilo_oid=oppijanumero)
+                    _create_or_update_henkilo_obj_batch_error(henkilo, error, BatchErrorType.HENKILOTIETO_UPDATE)
+                    for henkilo in Henkilo.objects.filter(id__in=henkilo_id_list)
                 ]
-                continue
 
-            """
-            We have a match. Finally update henkilo-data using the oppijanumero.
-            """
-            update_henkilo_data_by_oid.apply_async(args=[oppijanumero, henkilo.id], queue="low_prio_queue")
+        """
+        We have a match. Finally update henkilo-data using the oppijanumerot, one task per batch of henkilot.
+        """
+        unique_henkilo_id_list = [
+            henkilo_id_list[0] for henkilo_id_list in henkilo_id_oid_dict.values() if len(henkilo_id_list) == 1
+        ]
+        for henkilo_id_chunk in list_to_chunks(unique_henkilo_id_list, HENKILO_BATCH_SIZE):
+            update_henkilo_data_by_id_list_task.apply_async(args=[henkilo_id_chunk], queue="low_prio_queue")
 
         aikaleima.aikaleima = end_datetime
         aikaleima.save()
@@ -417,6 +513,9 @@ def update_huoltajuussuhteet():
     start_datetime = aikaleima.aikaleima.astimezone(helsinki).strftime("%Y-%m-%dT%H:%M:%S%z")
     datetime_end = datetime.datetime.now(tz=datetime.timezone.utc)
 
+    start_time = time.perf_counter()
+    updated_count = 0
+
     # With zero we fetch items 0-4999, offset 5000 -> items 5000 - 9999.
     offset = 0
     # This is how many lapsi_oids are fetched with one GET-request (max).
@@ -430,8 +529,7 @@ def update_huoltajuussuhteet():
             return None
 
         changed_lapsi_oid_list = response_dict["json_msg"]
-        for changed_lapsi_oid in changed_lapsi_oid_list:
-            update_huoltajuussuhde(changed_lapsi_oid)
+        updated_count += update_huoltajuussuhde_list(changed_lapsi_oid_list)
 
         offset += amount
         loop_index += 1
@@ -446,13 +544,18 @@ def update_huoltajuussuhteet():
     oids_to_retry = BatchError.objects.filter(
         retry_time__lte=datetime.datetime.now(datetime.timezone.utc), type=BatchErrorType.LAPSI_HUOLTAJUUSSUHDE_UPDATE.name
     ).values_list("henkilo__henkilo_oid", flat=True)
-    for lapsi_oid in oids_to_retry:
-        update_huoltajuussuhde(lapsi_oid)
+    updated_count += update_huoltajuussuhde_list(list(oids_to_retry))
 
     # Update Aikaleima
     aikaleima.aikaleima = datetime_end
     aikaleima.save()
 
+    duration = time.perf_counter() - start_time
+    logger.info(
+        f"Huoltajuussuhteet updated for {updated_count} lapset in {duration:.1f} seconds "
+        f"({updated_count / max(duration, 1):.1f} lapset/second)."
+    )
+
 
 def _create_or_update_henkilo_obj_batch_error(henkilo_obj, error, batch_error_type):
     batch_error, is_new = BatchError.objects.get_or_create(henkilo=henkilo_obj, type=batch_error_type.name)
@@ -482,7 +585,93 @@ def update_huoltajuussuhde(henkilo_oid):
         logger.info(f"Skipped huoltajuussuhde update for child with OID {henkilo_oid} since he was not added to Varda")
 
 
+def update_huoltajuussuhde_list(lapsi_oid_list):
+    """
+    Update huoltajasuhteet for multiple children. Huoltajat of each child are fetched separately (concurrently, see
+    _get_huoltajat_dict), but master data of huoltajat is fetched in batches and huoltajuussuhteet are saved in bulk.
+    :param lapsi_oid_list: list of henkilo oids of the children
+    :return: number of children whose huoltajuussuhteet were updated
+    """
+    updated_count = 0
+    henkilo_id_oid_list = list(
+        Henkilo.objects.filter(henkilo_oid__in=lapsi_oid_list).exclude(lapsi=None).distinct().values_list("id", "henkilo_oid")
+    )
+    # Henkilot that are not lapsi (anymore) are skipped, so clear their BatchErrors here, BatchErrors of processed lapset
+    # are cleared by batch_error_decorator
+    BatchError.objects.filter(
+        henkilo__henkilo_oid__in=lapsi_oid_list, type=BatchErrorType.LAPSI_HUOLTAJUUSSUHDE_UPDATE.name
+    ).exclude(henkilo_id__in=[henkilo_id for henkilo_id, henkilo_oid in henkilo_id_oid_list]).delete()
+    for henkilo_id_oid_chunk in list_to_chunks(henkilo_id_oid_list, HENKILO_BATCH_SIZE):
+        huoltaja_oid_list_dict = {}
+        huoltajat_dict = _get_huoltajat_dict([henkilo_oid for henkilo_id, henkilo_oid in henkilo_id_oid_chunk])
+        for henkilo_id, henkilo_oid in henkilo_id_oid_chunk:
+            huoltajat = huoltajat_dict[henkilo_oid]
+            if isinstance(huoltajat, Exception):
+                logger.error("BatchError caught exception", exc_info=huoltajat)
+                _create_or_update_henkilo_obj_batch_error(
+                    Henkilo.objects.get(id=henkilo_id), huoltajat, BatchErrorType.LAPSI_HUOLTAJUUSSUHDE_UPDATE
+                )
+                continue
+            huoltaja_oid_list_dict[henkilo_oid] = [huoltaja["oidHenkilo"] for huoltaja in huoltajat]
+
+        huoltaja_oid_set = {huoltaja_oid for oid_list in huoltaja_oid_list_dict.values() for huoltaja_oid in oid_list}
+        huoltaja_data_dict = {}
+        for huoltaja_oid_chunk in list_to_chunks(list(huoltaja_oid_set), HENKILO_BATCH_SIZE):
+            huoltaja_data_dict.update(get_henkilo_data_dict(huoltaja_oid_chunk))
+
+        for henkilo_oid, huoltaja_oid_list in huoltaja_oid_list_dict.items():
+            # Master data of huoltajat not included in batch response (e.g. duplicates) is fetched separately
+            huoltajat_master_data = [
+                huoltaja_data_dict.get(huoltaja_oid) or get_henkilo_data_by_oid(huoltaja_oid)
+                for huoltaja_oid in huoltaja_oid_list
+            ]
+            _save_lapsen_huoltajat_batch_error(henkilo_oid, huoltajat_master_data)
+            updated_count += 1
+    return updated_count
+
+
+@batch_error_decorator(BatchErrorType.LAPSI_HUOLTAJUUSSUHDE_UPDATE)
+def _save_lapsen_huoltajat_batch_error(henkilo_oid, huoltajat_master_data):
+    _save_lapsen_huoltajat(Henkilo.objects.get(henkilo_oid=henkilo_oid).id, huoltajat_master_data)
+
+
+def _get_huoltajat_dict(henkilo_oid_list):
+    """
+    Fetch huoltajat of multiple children from oppijanumerorekisteri with HUOLTAJAT_MAX_WORKERS threads. Each thread uses
+    its own pooled and authenticated session (see oph_yhteiskayttopalvelu_autentikaatio.get_session). Threads access
+    the database only for authentication (TGT), and use their own connections that are closed when the thread is done.
+    :param henkilo_oid_list: list of henkilo oids of the children
+    :return: dict {henkilo_oid: list of huoltajat, or Exception if fetching failed}
+    """
+    # Connections of other threads do not see uncommitted data of test transactions, so do not use threads in tests
+    if HUOLTAJAT_MAX_WORKERS <= 1 or settings.TESTING:
+        return {henkilo_oid: _get_huoltajat_or_exception(henkilo_oid) for henkilo_oid in henkilo_oid_list}
+
+    with ThreadPoolExecutor(max_workers=HUOLTAJAT_MAX_WORKERS) as executor:
+        result_list = executor.map(_get_huoltajat_or_exception_in_thread, henkilo_oid_list)
+        return dict(zip(henkilo_oid_list, result_list))
+
+
+def _get_huoltajat_or_exception(henkilo_oid):
+    try:
+        return _get_huoltajat_from_onr_by_oid(henkilo_oid)
+    except Exception as e:
+        return e
+
+
+def _get_huoltajat_or_exception_in_thread(henkilo_oid):
+    try:
+        return _get_huoltajat_or_exception(henkilo_oid)
+    finally:
+        # Django opens a separate database connection for each thread
+        connection.close()
+
+
 def _get_huoltajat_from_onr(henkilo_id):
+    return _get_huoltajat_from_onr_by_oid(Henkilo.objects.get(id=henkilo_id).henkilo_oid)
+
+
+def _get_huoltajat_from_onr_by_oid(henkilo_oid):
     """
     We can run this in test environment only with a few selected oppijanumerot.
     """
@@ -514,16 +703,13 @@ def _get_huoltajat_from_onr(henkilo_id):
         "1.2.246.562.24.68116330800",
         "1.2.246.562.24.27514703229",
     ]
-    henkilo_lapsi_obj = Henkilo.objects.get(id=henkilo_id)
-    if henkilo_lapsi_obj.henkilo_oid == "" or (
-        not settings.PRODUCTION_ENV and henkilo_lapsi_obj.henkilo_oid not in test_lapsi_oids
-    ):
+    if henkilo_oid == "" or (not settings.PRODUCTION_ENV and henkilo_oid not in test_lapsi_oids):
         return []
 
-    huoltajat_url = "/henkilo/" + henkilo_lapsi_obj.henkilo_oid + "/huoltajat"
+    huoltajat_url = "/henkilo/" + henkilo_oid + "/huoltajat"
     reply_msg = get_json_from_external_service(SERVICE_NAME, huoltajat_url)
     if not reply_msg["is_ok"]:
-        raise APIException("Could not fetch huoltajat from oppijanumerorekisteri for henkilo {}".format(henkilo_id))
+        raise APIException("Could not fetch huoltajat from oppijanumerorekisteri for henkilo {}".format(henkilo_oid))
     return reply_msg["json_msg"]
 
 
@@ -554,18 +740,57 @@ def _fetch_lapsen_huoltajat(henkilo_id):
     :param henkilo_id: Henkilo object id
     :return: None
     """
-    lapsi_id_list = Henkilo.objects.filter(id=henkilo_id).exclude(lapsi=None).values_list("lapsi__id", flat=True)
     huoltajat = _get_huoltajat_from_onr(henkilo_id)
     huoltajat_master_data = [get_henkilo_data_by_oid(huoltaja["oidHenkilo"]) for huoltaja in huoltajat]
+    _save_lapsen_huoltajat(henkilo_id, huoltajat_master_data)
+
+
+def _save_lapsen_huoltajat(henkilo_id, huoltajat_master_data):
+    """
+    Update huoltajat of henkilo and set huoltajuussuhteet of all lapsi objects henkilo has. Only huoltajuussuhteet
+    that have changed are saved. Throws exception on error.
+    :param henkilo_id: Henkilo object id of the child
+    :param huoltajat_master_data: list of master data of huoltajat from oppijanumerorekisteri
+    :return: None
+    """
+    if None in huoltajat_master_data:
+        raise APIException(f"Could not fetch huoltaja master data from oppijanumerorekisteri for henkilo {henkilo_id}")
+
+    lapsi_id_list = list(Lapsi.objects.filter(henkilo_id=henkilo_id).values_list("id", flat=True))
+    if not lapsi_id_list:
+        return None
+
     with transaction.atomic():
-        # Invalidate all current huoltajuussuhde and set ones returned valid
-        [Lapsi.objects.get(id=lapsi_id).huoltajuussuhteet.update(voimassa_kytkin=False) for lapsi_id in lapsi_id_list]
-        [_update_lapsi_huoltaja(lapsi_id, huoltaja) for lapsi_id in lapsi_id_list for huoltaja in huoltajat_master_data]
+        huoltaja_id_set = {_update_huoltaja(huoltaja_master_data) for huoltaja_master_data in huoltajat_master_data}
+
+        # ONR returns only valid huoltajat, invalidate other huoltajuussuhteet
+        updated_huoltajuussuhde_list = []
+        existing_lapsi_huoltaja_set = set()
+        for huoltajuussuhde in Huoltajuussuhde.objects.filter(lapsi_id__in=lapsi_id_list):
+            existing_lapsi_huoltaja_set.add((huoltajuussuhde.lapsi_id, huoltajuussuhde.huoltaja_id))
+            voimassa_kytkin = huoltajuussuhde.huoltaja_id in huoltaja_id_set
+            if huoltajuussuhde.voimassa_kytkin != voimassa_kytkin:
+                huoltajuussuhde.voimassa_kytkin = voimassa_kytkin
+                updated_huoltajuussuhde_list.append(huoltajuussuhde)
+        bulk_update_objects(updated_huoltajuussuhde_list, ["voimassa_kytkin"])
+
+        bulk_create_objects(
+            [
+                Huoltajuussuhde(lapsi_id=lapsi_id, huoltaja_id=huoltaja_id, voimassa_kytkin=True)
+                for lapsi_id in lapsi_id_list
+                for huoltaja_id in huoltaja_id_set
+                if (lapsi_id, huoltaja_id) not in existing_lapsi_huoltaja_set
+            ]
+        )
 
 
 @transaction.atomic
-def _update_lapsi_huoltaja(lapsi_id, huoltaja_master_data):
-    lapsi_obj = Lapsi.objects.get(id=lapsi_id)
+def _update_huoltaja(huoltaja_master_data):
+    """
+    Create or update Henkilo and Huoltaja objects of huoltaja
+    :param huoltaja_master_data: master data of huoltaja from oppijanumerorekisteri
+    :return: ID of Huoltaja object
+    """
     # Oid should be used alone as unique identifier in query since hetu can change
     oid = huoltaja_master_data["oidHenkilo"]
     default_henkilo = {"henkilo_oid": oid}
@@ -577,13 +802,7 @@ def _update_lapsi_huoltaja(lapsi_id, huoltaja_master_data):
     _fetch_henkilo_data_by_oid(oid, henkilo_huoltaja_obj.id, huoltaja_master_data)
 
     huoltaja_obj, huoltaja_created = Huoltaja.objects.get_or_create(henkilo=henkilo_huoltaja_obj)
-
-    Huoltajuussuhde.objects.update_or_create(
-        lapsi=lapsi_obj,
-        huoltaja=huoltaja_obj,
-        # ONR returns only valid huoltaja
-        defaults={"voimassa_kytkin": True},
-    )
+    return huoltaja_obj.id
 
 
 def get_user_data(henkilo_oid):
@@ -15,6 +15,7 @@ from varda.models import (
     VuokrattuHenkilosto,
     MaksutietoHuoltajuussuhde,
 )
+from varda.misc_operations import bulk_update_objects
 from varda.permission_groups import get_all_permission_groups_for_organization
 from varda.permissions import (
     assign_taydennyskoulutus_permissions,
@@ -63,17 +64,18 @@ def _verify_transfer_is_supported(new_vakajarjestaja, old_vakajarjestaja):
 
 def _transfer_toimipaikka_permissions_to_new_vakajarjestaja(new_vakajarjestaja, old_vakajarjestaja):
     toimipaikka_id_list = old_vakajarjestaja.toimipaikat.values_list("id", flat=True)
-    toimipaikka_qs = Toimipaikka.objects.filter(id__in=toimipaikka_id_list)
+    toimipaikka_list = list(Toimipaikka.objects.filter(id__in=toimipaikka_id_list))
 
-    for toimipaikka in toimipaikka_qs:
+    # Change Organisaatio reference of Toimipaikka objects
+    for toimipaikka in toimipaikka_list:
+        toimipaikka.vakajarjestaja = new_vakajarjestaja
+    bulk_update_objects(toimipaikka_list, ["vakajarjestaja"])
+
+    for toimipaikka in toimipaikka_list:
         # Disassociate all users from Toimipaikka specific permission groups
         for group in get_all_permission_groups_for_organization(toimipaikka.organisaatio_oid):
             group.user_set.clear()
 
-        # Change Organisaatio reference of Toimipaikka
-        toimipaikka.vakajarjestaja = new_vakajarjestaja
-        toimipaikka.save()
-
         # Reassign permissions
         assign_toimipaikka_permissions(toimipaikka, reassign=True)
 
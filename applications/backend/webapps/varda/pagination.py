@@ -1,7 +1,17 @@
+import base64
+import binascii
+import datetime
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.exceptions import ValidationError
 from rest_framework.pagination import CursorPagination, PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 from collections import OrderedDict
 
+from varda.enums.error_messages import ErrorMessages
+
 
 class ChangeablePageSizeCursorPagination(CursorPagination):
     """
@@ -92,6 +102,120 @@ class ChangeableReportingPageSizePagination(PageNumberPagination):
     page_size_query_param = "page_size"
 
 
+class RawKeysetPaginationMixin:
+    """
+    Keyset (seek) pagination for RawQuerySets. Keyset mode is enabled with keyset=true query parameter or when cursor
+    query parameter is present, otherwise parent pagination is used. Raw query is wrapped in a subquery and filtered
+    with a row comparison against the last returned key, so that fetching a page does not require counting the
+    whole result or skipping earlier rows with OFFSET.
+
+    Cursor condition is not pushed into the raw query: PostgreSQL cannot push it through aggregates and set returning
+    functions (e.g. generate_series) of the raw query, so the whole raw query is still evaluated for every page and
+    paging through all results costs O(pages * rows). Keyset mode only removes the count query and keeps pages stable
+    while data changes. Clients that need all results of a time window should use streaming instead (stream=true in
+    KelaBaseViewSet), which evaluates the raw query once.
+
+    View must define keyset_fields, a tuple of (SQL expression, type) pairs that uniquely identify a row. Expressions
+    reference output columns of the raw query and must not evaluate to NULL (use COALESCE). Supported types are int
+    and datetime.date, cursor values are validated against them before they are used as query parameters.
+    """
+
+    cursor_query_param = "cursor"
+    keyset_query_param = "keyset"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.is_keyset = False
+        self.next_position = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.is_keyset = (
+            self.cursor_query_param in request.query_params
+            or request.query_params.get(self.keyset_query_param, "").lower() == "true"
+        )
+        if not self.is_keyset:
+            return super().paginate_queryset(queryset, request, view=view)
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        keyset_fields = view.keyset_fields
+        position = self.decode_cursor(request, [field_type for field, field_type in keyset_fields])
+
+        key_columns = ", ".join(f"{field} AS keyset_{index}" for index, (field, field_type) in enumerate(keyset_fields))
+        key_aliases = ", ".join(f"keyset_{index}" for index in range(len(keyset_fields)))
+        position_filter = f"WHERE ({key_aliases}) > ({', '.join(['%s'] * len(position))})" if position else ""
+        raw_query = queryset.raw_query.strip().rstrip(";")
+        keyset_query = f"""
+            SELECT * FROM (
+                SELECT keyset_source.*, {key_columns} FROM ({raw_query}) keyset_source
+            ) keyset_page
+            {position_filter}
+            ORDER BY {key_aliases}
+            LIMIT %s
+        """
+        params = [*queryset.params, *position, page_size + 1]
+
+        page = list(queryset.model.objects.using(queryset.db).raw(keyset_query, params))
+        if len(page) > page_size:
+            page = page[:page_size]
+            last_instance = page[-1]
+            self.next_position = [getattr(last_instance, f"keyset_{index}") for index in range(len(keyset_fields))]
+        else:
+            self.next_position = None
+        return page
+
+    def decode_cursor(self, request, field_type_list):
+        encoded = request.query_params.get(self.cursor_query_param, None)
+        if not encoded:
+            return []
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode("ascii")).decode("utf-8"))
+            if not isinstance(position, list) or len(position) != len(field_type_list):
+                raise ValueError("Invalid cursor length")
+            return [_parse_cursor_value(value, field_type) for value, field_type in zip(position, field_type_list)]
+        except (binascii.Error, UnicodeError, ValueError):
+            raise ValidationError({self.cursor_query_param: [ErrorMessages.GE028.value]})
+
+    def encode_cursor(self, position):
+        encoded = base64.urlsafe_b64encode(json.dumps(position, cls=DjangoJSONEncoder).encode("utf-8")).decode("ascii")
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.is_keyset:
+            return super().get_next_link()
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(self.next_position)
+
+    def get_paginated_response(self, data):
+        if not self.is_keyset:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([("next", self.get_next_link()), ("results", data)]))
+
+
+def _parse_cursor_value(value, field_type):
+    """
+    Cast JSON decoded cursor value to the type of keyset field, so that invalid values are not passed to the database
+    :param value: JSON decoded cursor value
+    :param field_type: int or datetime.date
+    :return: value of field_type
+    """
+    # Values are compared with integer or bigint columns
+    if field_type is int and isinstance(value, int) and not isinstance(value, bool) and -(2**63) <= value < 2**63:
+        return value
+    if field_type is datetime.date and isinstance(value, str):
+        return datetime.date.fromisoformat(value)
+    raise ValueError(f"Invalid cursor value {value}")
+
+
+class ChangeablePageSizeKeysetPagination(RawKeysetPaginationMixin, ChangeablePageSizePagination):
+    pass
+
+
+class ChangeableReportingPageSizeKeysetPagination(RawKeysetPaginationMixin, ChangeableReportingPageSizePagination):
+    pass
+
+
 # Testing
 class TestMaksutietoOrderCursorPagination(ChangeablePageSizeCursorPagination):
     ordering = ("perheen_koko", "id")
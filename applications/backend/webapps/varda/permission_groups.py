@@ -1,4 +1,5 @@
 import logging
+import re
 
 from django.conf import settings
 from django.contrib.auth.models import Group
@@ -13,6 +14,9 @@ from varda.models import Organisaatio, Z4_CasKayttoOikeudet
 
 logger = logging.getLogger(__name__)
 
+# Matches permission group names, <NAME>_<OID> e.g. VARDA-TALLENTAJA_1.2.246.562.10.93957375488
+PERMISSION_GROUP_NAME_PATTERN = re.compile(r".*_([\d\.]*)")
+
 
 def get_organization_type(organisaatio_oid):
     """
@@ -135,6 +139,16 @@ def create_permission_groups_for_organisaatio(organisaatio_oid, organisaatiotyyp
                 )
 
 
+def get_organisaatio_oid_from_group_name(group_name):
+    """
+    Return organisaatio_oid of permission group
+    :param group_name: name of the permission group, e.g. VARDA-TALLENTAJA_1.2.246.562.10.93957375488
+    :return: organisaatio_oid or None if group is not related to an organisation
+    """
+    match = PERMISSION_GROUP_NAME_PATTERN.fullmatch(group_name)
+    return match.group(1) if match and match.group(1) else None
+
+
 def get_permission_group(role, organisaatio_oid):
     """
     Return permission group
@@ -1,20 +1,24 @@
 import logging
-import re
 from functools import wraps
 
 from django.conf import settings
 from django.contrib.auth.models import AnonymousUser, Group
 from django.contrib.contenttypes.models import ContentType
 from django.db import transaction, IntegrityError
-from django.db.models import F, IntegerField, Q, Model, QuerySet, Value
+from django.db.models import CharField, F, IntegerField, OuterRef, Q, Model, QuerySet, Value
 from django.db.models.functions import Cast
 from django.forms import model_to_dict
+from django.utils import timezone
 from guardian.models import UserObjectPermission, GroupObjectPermission
 from guardian.shortcuts import assign_perm, remove_perm
 from rest_framework import permissions
 from rest_framework.exceptions import PermissionDenied, ValidationError
 
-from varda.cache import delete_object_ids_user_has_permissions
+from varda.cache import (
+    delete_related_organisaatio_cache,
+    get_related_organisaatio_id_list_cache,
+    set_related_organisaatio_id_list_cache,
+)
 from varda.custom_celery import custom_shared_task
 from varda.enums.error_messages import ErrorMessages
 from varda.misc_queries import (
@@ -29,6 +33,7 @@ from varda.models import (
     Toimipaikka,
     Lapsi,
     Tutkinto,
+    Varhaiskasvatuspaatos,
     Varhaiskasvatussuhde,
     PaosToiminta,
     PaosOikeus,
@@ -40,7 +45,7 @@ from varda.models import (
     Tyoskentelypaikka,
     TaydennyskoulutusTyontekija,
 )
-from varda.permission_groups import get_oph_yllapitaja_group_name
+from varda.permission_groups import get_oph_yllapitaja_group_name, get_organisaatio_oid_from_group_name
 
 
 logger = logging.getLogger(__name__)
@@ -84,6 +89,8 @@ GENERAL_GROUPS = (
     Z4_CasKayttoOikeudet.YLLAPITAJA,
 )
 
+OBJECT_PERMISSION_BATCH_SIZE = 5000
+
 
 # https://github.com/rpkilby/django-rest-framework-guardian
 class CustomModelPermissions(permissions.DjangoModelPermissions):
@@ -186,7 +193,7 @@ class RaportitPermissions(permissions.BasePermission):
         return (
             user.is_superuser
             or is_oph_staff(user)
-            or user.groups.filter(name__startswith=Z4_CasKayttoOikeudet.RAPORTTIEN_KATSELIJA).exists()
+            or get_user_group_qs(user).filter(name__startswith=Z4_CasKayttoOikeudet.RAPORTTIEN_KATSELIJA).exists()
         )
 
 
@@ -201,7 +208,7 @@ class ClientCertPermissions(permissions.BasePermission):
         return (
             user.is_superuser
             or is_oph_staff(user)
-            or user.groups.filter(name__startswith=Z4_CasKayttoOikeudet.LUOVUTUSPALVELU).exists()
+            or get_user_group_qs(user).filter(name__startswith=Z4_CasKayttoOikeudet.LUOVUTUSPALVELU).exists()
         )
 
 
@@ -215,7 +222,7 @@ class FrontendAccessOnly(permissions.BasePermission):
 
 
 def _is_user_group_permissions(accepted_permissions, user):
-    return user.is_superuser or user.groups.filter(permissions__codename__in=accepted_permissions).exists()
+    return user.is_superuser or get_user_group_qs(user).filter(permissions__codename__in=accepted_permissions).exists()
 
 
 def _user_has_certificate_access(user, request):
@@ -296,7 +303,7 @@ def user_has_tallentaja_permission_in_organization(organisaatio_oid, user):
     if user.is_superuser:
         return True
 
-    user_groups_query = user.groups.all()
+    user_groups_query = get_user_group_qs(user)
     for user_group in user_groups_query:
         if user_group.name in acceptable_group_names:
             return True  # User has permissions to add/change/delete
@@ -361,7 +368,7 @@ def is_user_permission(user, permission_group_name):
     :param permission_group_name: name of the permission requested
     :return: boolean
     """
-    return user.is_superuser or user.groups.filter(name=permission_group_name).exists()
+    return user.is_superuser or get_user_group_qs(user).filter(name=permission_group_name).exists()
 
 
 def check_if_user_has_paakayttaja_permissions(vakajarjestaja_organisaatio_oid, user):
@@ -389,17 +396,17 @@ def user_has_huoltajatieto_tallennus_permissions_to_correct_organization(
 
     if user_details.kayttajatyyppi == "PALVELU":
         group_vakajarjestaja_palvelukayttaja = "VARDA-PALVELUKAYTTAJA_" + vakajarjestaja_organisaatio_oid
-        if user.groups.filter(name=group_vakajarjestaja_palvelukayttaja).exists():
+        if get_user_group_qs(user).filter(name=group_vakajarjestaja_palvelukayttaja).exists():
             return True
 
     if user_details.kayttajatyyppi == "VIRKAILIJA":
         group_vakajarjestaja_huoltaja_tallentaja = "HUOLTAJATIETO_TALLENNUS_" + vakajarjestaja_organisaatio_oid
-        if user.groups.filter(name=group_vakajarjestaja_huoltaja_tallentaja).exists():
+        if get_user_group_qs(user).filter(name=group_vakajarjestaja_huoltaja_tallentaja).exists():
             return True
 
     for toimipaikka in toimipaikka_qs or []:
         group_toimipaikka_huoltaja_tallentaja = "HUOLTAJATIETO_TALLENNUS_" + toimipaikka.organisaatio_oid
-        if user.groups.filter(name=group_toimipaikka_huoltaja_tallentaja).exists():
+        if get_user_group_qs(user).filter(name=group_toimipaikka_huoltaja_tallentaja).exists():
             return True
     return False
 
@@ -413,6 +420,35 @@ def object_ids_organization_has_permissions_to(organisaatio_oid, model):
     )
 
 
+def get_object_id_qs_user_has_permissions(user, model):
+    """
+    Get IDs of objects user has view permissions to, either via active permission groups or user specific
+    permissions. IDs are returned as a QuerySet so that they are evaluated as a subquery in the database,
+    e.g. Lapsi.objects.filter(id__in=get_object_id_qs_user_has_permissions(user, Lapsi))
+    :param user: User object
+    :param model: Django model
+    :return: QuerySet of IDs
+    """
+    if user.is_superuser:
+        return model.objects.values("id")
+
+    permission_filter = {
+        "content_type": ContentType.objects.get_for_model(model),
+        "permission__codename": f"view_{model.get_name()}",
+    }
+    group_permission_qs = (
+        GroupObjectPermission.objects.filter(group__in=get_user_group_qs(user), **permission_filter)
+        .annotate(object_pk_as_int=Cast("object_pk", IntegerField()))
+        .values("object_pk_as_int")
+    )
+    user_permission_qs = (
+        UserObjectPermission.objects.filter(user=user, **permission_filter)
+        .annotate(object_pk_as_int=Cast("object_pk", IntegerField()))
+        .values("object_pk_as_int")
+    )
+    return model.objects.filter(Q(id__in=group_permission_qs) | Q(id__in=user_permission_qs)).values("id")
+
+
 def get_tyontekija_and_toimipaikka_lists_for_taydennyskoulutus(taydennyskoulutus_tyontekija_list):
     """
     :param taydennyskoulutus_tyontekija_list: list of TaydennyskoulutusTyontekija objects or similar dict objects
@@ -553,7 +589,7 @@ def get_organisaatio_oids_from_groups(user, *group_name_prefixes):
     for group_name_prefix in group_name_prefixes:
         group_condition = Q(name__startswith=group_name_prefix)
         filter_condition = filter_condition | group_condition
-    group_names = user.groups.filter(filter_condition).values_list("name", flat=True)
+    group_names = get_user_group_qs(user).filter(filter_condition).values_list("name", flat=True)
     return [group_name.split("_")[-1] for group_name in group_names]
 
 
@@ -573,12 +609,12 @@ def user_permission_groups_in_organization(user, organisaatio_oid, permission_gr
 
 def user_permission_groups_in_organizations(user, oid_list, permission_group_list):
     group_name_list = [f"{group}_{oid}" for oid in oid_list if oid for group in permission_group_list]
-    return user.groups.filter(name__in=group_name_list)
+    return get_user_group_qs(user).filter(name__in=group_name_list)
 
 
 def toimipaikka_tallentaja_pidempipoissaolo_has_perm_to_add(user, vakajarjestaja_oid, validated_data):
     # toimipaikka tallentaja can't create a pidempipoissaolo if there is no corresponding tyoskentelypaikka
-    if user.is_superuser or user.groups.filter(name="HENKILOSTO_TYONTEKIJA_TALLENTAJA_{}".format(vakajarjestaja_oid)):
+    if user.is_superuser or get_user_group_qs(user).filter(name="HENKILOSTO_TYONTEKIJA_TALLENTAJA_{}".format(vakajarjestaja_oid)):
         return True
     else:
         user_perm_oids = get_organisaatio_oids_from_groups(user, "HENKILOSTO_TYONTEKIJA_TALLENTAJA")
@@ -658,7 +694,7 @@ def is_oph_staff(user):
     :param user: User object
     :return: boolean
     """
-    return user.groups.filter(name=get_oph_yllapitaja_group_name()).exists()
+    return get_user_group_qs(user).filter(name=get_oph_yllapitaja_group_name()).exists()
 
 
 def parse_toimipaikka_id_list(user, toimipaikka_ids_string, required_permission_groups, include_paos=False):
@@ -678,7 +714,7 @@ def parse_toimipaikka_id_list(user, toimipaikka_ids_string, required_permission_
         if not toimipaikka_id.isdigit():
             continue
         toimipaikka = Toimipaikka.objects.filter(pk=toimipaikka_id).first()
-        if not toimipaikka or not user.has_perm("view_toimipaikka", toimipaikka):
+        if not toimipaikka or not user_has_object_permission(user, "view_toimipaikka", toimipaikka):
             continue
 
         oid_list = [toimipaikka.organisaatio_oid, toimipaikka.vakajarjestaja.organisaatio_oid]
@@ -716,7 +752,12 @@ def delete_all_user_permissions(user, delete_henkilo_permissions=True):
     user.groups.clear()
     if cas_fields := user.additional_cas_user_fields:
         cas_fields.all_groups.clear()
+    delete_related_organisaatio_cache(user.id)
+
+    delete_user_object_permissions(user, delete_henkilo_permissions=delete_henkilo_permissions)
+
 
+def delete_user_object_permissions(user, delete_henkilo_permissions=True):
     # Delete user specific permissions (e.g. to Henkilo objects)
     user_permission_qs = UserObjectPermission.objects.filter(user=user)
     if not delete_henkilo_permissions:
@@ -729,18 +770,28 @@ def delete_all_user_permissions(user, delete_henkilo_permissions=True):
 def delete_object_permissions(instance):
     """
     Delete object permissions explicitly
-    :param instance: object instance
+    :param instance: object instance or QuerySet
     """
-    content_type = ContentType.objects.get_for_model(type(instance))
-    filters = {"content_type": content_type, "object_pk": instance.id}
+    if isinstance(instance, QuerySet):
+        content_type = ContentType.objects.get_for_model(instance.model)
+        filters = {"content_type": content_type, "object_pk__in": _get_object_pk_subquery(instance)}
+    else:
+        content_type = ContentType.objects.get_for_model(type(instance))
+        filters = {"content_type": content_type, "object_pk": instance.id}
     UserObjectPermission.objects.filter(**filters).delete()
     GroupObjectPermission.objects.filter(**filters).delete()
 
 
+def _get_object_pk_subquery(queryset):
+    # object_pk of guardian permission models is a CharField
+    return queryset.annotate(pk_as_str=Cast("pk", CharField())).values("pk_as_str")
+
+
 def assign_or_remove_object_permissions(instance, oid_list, permission_groups, view_only=False, assign=False):
     """
-    Assign or remove object permissions for instance
-    :param instance: object instance
+    Assign or remove object permissions for instance or QuerySet of instances. All (group, permission, object) rows
+    are written with a single bulk insert or removed with a single delete.
+    :param instance: object instance or QuerySet
     :param oid_list: list of organisaatio_oid values of Organisaatio or Toimipaikka objects
     :param permission_groups: list of Z4_CasKayttoOikeudet values
     :param view_only: assign only view-permissions
@@ -748,21 +799,84 @@ def assign_or_remove_object_permissions(instance, oid_list, permission_groups, v
     """
     # Get list of group names in the format '{group_name}_{organisaatio_oid}'
     group_name_list = [f"{group}_{oid}" for oid in oid_list if oid for group in permission_groups]
-    group_qs = Group.objects.filter(name__in=group_name_list)
+    if not group_name_list:
+        return None
 
-    instance_model = instance.model if isinstance(instance, QuerySet) else type(instance)
+    is_queryset = isinstance(instance, QuerySet)
+    instance_model = instance.model if is_queryset else type(instance)
     content_type = ContentType.objects.get_for_model(instance_model)
-    for group in group_qs:
-        # Get all permissions that group has for this type of object (view, add, change, delete)
-        model_specific_permissions_for_group = group.permissions.filter(content_type=content_type)
-        for permission in model_specific_permissions_for_group:
-            if view_only and not permission.codename.startswith("view_"):
-                # view_only parameter is True and permission is not view-permission, so continue to next permission
-                continue
-            if assign:
-                assign_perm(permission, group, obj=instance)
-            else:
-                remove_perm(permission, group, obj=instance)
+
+    # Get all permissions that groups have for this type of object (view, add, change, delete) with a single query
+    group_permission_qs = Group.permissions.through.objects.filter(
+        group__name__in=group_name_list, permission__content_type=content_type
+    )
+    if view_only:
+        group_permission_qs = group_permission_qs.filter(permission__codename__startswith="view_")
+
+    if assign:
+        group_permission_list = list(group_permission_qs.values_list("group_id", "permission_id"))
+        if not group_permission_list:
+            return None
+        object_pk_list = [str(pk) for pk in instance.values_list("pk", flat=True)] if is_queryset else [str(instance.pk)]
+        GroupObjectPermission.objects.bulk_create(
+            [
+                GroupObjectPermission(group_id=group_id, permission_id=permission_id, content_type=content_type, object_pk=pk)
+                for pk in object_pk_list
+                for group_id, permission_id in group_permission_list
+            ],
+            batch_size=OBJECT_PERMISSION_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+    else:
+        if is_queryset:
+            object_pk_filter = Q(object_pk__in=_get_object_pk_subquery(instance))
+        else:
+            object_pk_filter = Q(object_pk=str(instance.pk))
+        GroupObjectPermission.objects.filter(
+            object_pk_filter,
+            content_type=content_type,
+            group__name__in=group_name_list,
+            permission__in=group_permission_qs.filter(group_id=OuterRef("group_id")).values("permission_id"),
+        ).delete()
+
+
+def assign_object_permissions_by_oid(model, id_oid_list, permission_groups, view_only=False):
+    """
+    Assign object permissions for multiple objects that are related to different organizations
+    (e.g. Toimipaikka level permissions) with a single bulk insert
+    :param model: Django model
+    :param id_oid_list: list of (object ID, organisaatio_oid) tuples
+    :param permission_groups: list of Z4_CasKayttoOikeudet values
+    :param view_only: assign only view-permissions
+    """
+    id_oid_list = [(object_id, oid) for object_id, oid in id_oid_list if oid]
+    group_name_list = {f"{group}_{oid}" for object_id, oid in id_oid_list for group in permission_groups}
+    if not group_name_list:
+        return None
+
+    content_type = ContentType.objects.get_for_model(model)
+    group_permission_qs = Group.permissions.through.objects.filter(
+        group__name__in=group_name_list, permission__content_type=content_type
+    )
+    if view_only:
+        group_permission_qs = group_permission_qs.filter(permission__codename__startswith="view_")
+
+    # Group name is in the format '{group_name}_{organisaatio_oid}'
+    group_permission_dict = {}
+    for group_name, group_id, permission_id in group_permission_qs.values_list("group__name", "group_id", "permission_id"):
+        group_permission_dict.setdefault(group_name.rsplit("_", 1)[-1], []).append((group_id, permission_id))
+
+    GroupObjectPermission.objects.bulk_create(
+        [
+            GroupObjectPermission(
+                group_id=group_id, permission_id=permission_id, content_type=content_type, object_pk=str(object_id)
+            )
+            for object_id, oid in id_oid_list
+            for group_id, permission_id in group_permission_dict.get(oid, ())
+        ],
+        batch_size=OBJECT_PERMISSION_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
 
 
 def assign_general_object_permissions(instance, oid_list, view_only=False):
@@ -922,7 +1036,7 @@ def assign_henkilo_permissions(henkilo, user):
     :param henkilo: Henkilo instance
     :param user: User object
     """
-    if not user.has_perm("view_henkilo", henkilo):
+    if not user_has_object_permission(user, "view_henkilo", henkilo):
         # Don't assign user specific permissions if user already has a permission via permission group
         assign_perm("view_henkilo", user, henkilo)
 
@@ -1243,10 +1357,58 @@ def reassign_paos_permissions(jarjestaja_organisaatio_id, tuottaja_organisaatio_
     If voimassa_kytkin is False -> Remove tallentaja-permissions from the current tallentaja-organization.
     I.e. both of the organizations will have katselija-permissions.
     This can happen e.g. if paos_agreement is not active anymore.
+
+    Permissions of all PAOS Lapsi objects and related objects are reassigned with set based queries, resulting in
+    the same permissions as calling reassign_all_lapsi_permissions for each Lapsi.
     """
+    start_timestamp = timezone.now()
     lapsi_qs = Lapsi.objects.filter(oma_organisaatio_id=jarjestaja_organisaatio_id, paos_organisaatio_id=tuottaja_organisaatio_id)
-    for lapsi in lapsi_qs:
-        reassign_all_lapsi_permissions(lapsi)
+    lapsi_count = lapsi_qs.count()
+    if not lapsi_count:
+        return None
+
+    jarjestaja_oid = Organisaatio.objects.get(id=jarjestaja_organisaatio_id).organisaatio_oid
+    tuottaja_oid = Organisaatio.objects.get(id=tuottaja_organisaatio_id).organisaatio_oid
+    paos_oikeus = PaosOikeus.objects.filter(
+        jarjestaja_kunta_organisaatio_id=jarjestaja_organisaatio_id,
+        tuottaja_organisaatio_id=tuottaja_organisaatio_id,
+        voimassa_kytkin=True,
+    ).first()
+    tallentaja_oid = paos_oikeus.tallentaja_organisaatio.organisaatio_oid if paos_oikeus else None
+    is_not_tuottaja_tallentaja = tuottaja_oid != tallentaja_oid
+    is_not_jarjestaja_tallentaja = jarjestaja_oid != tallentaja_oid
+
+    henkilo_qs = Henkilo.objects.filter(lapsi__in=lapsi_qs).distinct("id").order_by("id")
+    vakapaatos_qs = Varhaiskasvatuspaatos.objects.filter(lapsi__in=lapsi_qs)
+    vakasuhde_qs = Varhaiskasvatussuhde.objects.filter(varhaiskasvatuspaatos__lapsi__in=lapsi_qs)
+    maksutieto_qs = Maksutieto.objects.filter(huoltajuussuhteet__lapsi__in=lapsi_qs).distinct("id").order_by("id")
+
+    # Henkilo permissions are not removed, Henkilo may be related to other Lapsi objects
+    for queryset in (lapsi_qs, vakapaatos_qs, vakasuhde_qs, maksutieto_qs):
+        delete_object_permissions(queryset)
+
+    # Organisaatio level permissions for Lapsi, Henkilo, Varhaiskasvatuspaatos and Varhaiskasvatussuhde objects
+    for queryset in (lapsi_qs, henkilo_qs, vakapaatos_qs, vakasuhde_qs):
+        assign_vaka_object_permissions(queryset, (tuottaja_oid,), view_only=is_not_tuottaja_tallentaja, paos_tuottaja=True)
+        assign_vaka_object_permissions(queryset, (jarjestaja_oid,), view_only=is_not_jarjestaja_tallentaja)
+    # Only oma_organisaatio (PAOS järjestäjä) has permissions to Maksutieto objects
+    assign_vaka_object_permissions(maksutieto_qs, (jarjestaja_oid,))
+
+    # Toimipaikka level permissions for Varhaiskasvatussuhde, Varhaiskasvatuspaatos, Lapsi and Henkilo objects
+    for model, id_field in (
+        (Varhaiskasvatussuhde, "id"),
+        (Varhaiskasvatuspaatos, "varhaiskasvatuspaatos_id"),
+        (Lapsi, "varhaiskasvatuspaatos__lapsi_id"),
+        (Henkilo, "varhaiskasvatuspaatos__lapsi__henkilo_id"),
+    ):
+        id_oid_list = vakasuhde_qs.values_list(id_field, "toimipaikka__organisaatio_oid").distinct()
+        assign_object_permissions_by_oid(model, id_oid_list, VAKA_LAPSI_GROUPS, view_only=is_not_tuottaja_tallentaja)
+
+    duration = (timezone.now() - start_timestamp).total_seconds()
+    logger.info(
+        f"Reassigned PAOS permissions of {lapsi_count} Lapsi objects (jarjestaja: {jarjestaja_organisaatio_id}, "
+        f"tuottaja: {tuottaja_organisaatio_id}) in {duration} seconds"
+    )
 
 
 @transaction.atomic
@@ -1480,21 +1642,46 @@ def get_related_organisaatio_for_user(user, groups=None):
     """
     Determine which Organisaatio objects user has permissions in
     :param user: User object
-    :param groups: Group QuerySet (defaults to user.groups)
+    :param groups: Group QuerySet (defaults to effective permission groups of user)
     :return: Organisaatio QuerySet
     """
+    if groups:
+        # Groups are explicitly provided (e.g. all groups of user), cache is only used for active groups
+        return _get_related_organisaatio_qs(user, groups)
+
+    return Organisaatio.objects.filter(id__in=get_related_organisaatio_id_list_for_user(user)).order_by("id")
+
+
+def get_related_organisaatio_id_list_for_user(user):
+    """
+    Determine IDs of Organisaatio objects user has permissions in (based on active permission groups). Result is cached
+    per user and cache is invalidated when permission groups of user are modified.
+    :param user: User object
+    :return: list of Organisaatio IDs
+    """
+    if get_permission_group_override(user) is not None:
+        # Permission groups are overridden for this request only, cache is only used for active groups
+        return list(_get_related_organisaatio_qs(user).values_list("id", flat=True))
+
+    organisaatio_id_list = get_related_organisaatio_id_list_cache(user.id)
+    if organisaatio_id_list is None:
+        organisaatio_id_list = list(_get_related_organisaatio_qs(user).values_list("id", flat=True))
+        set_related_organisaatio_id_list_cache(user.id, organisaatio_id_list)
+    return organisaatio_id_list
+
+
+def _get_related_organisaatio_qs(user, groups=None):
     if user.is_superuser or is_oph_staff(user):
         return Organisaatio.objects.filter(organisaatio_oid=settings.OPETUSHALLITUS_ORGANISAATIO_OID)
 
     if not groups:
-        groups = user.groups
+        groups = get_user_group_qs(user)
 
     user_group_names = groups.values_list("name", flat=True)
-
-    # Matches permission group names, <NAME>_<OID> e.g. VARDA-TALLENTAJA_1.2.246.562.10.93957375488
-    regex_pattern = re.compile(r".*_([\d\.]*)")
     organisaatio_oid_set = {
-        match.group(1) for group_name in user_group_names if (match := regex_pattern.fullmatch(group_name)) and match.group(1)
+        organisaatio_oid
+        for group_name in user_group_names
+        if (organisaatio_oid := get_organisaatio_oid_from_group_name(group_name))
     }
 
     # organisaatio_oid might be that of Vakajarjestaja or Toimipaikka
@@ -1507,14 +1694,65 @@ def get_related_organisaatio_for_user(user, groups=None):
     )
 
 
+PERMISSION_GROUP_OVERRIDE_ATTRIBUTE = "_varda_permission_group_override"
+
+
+def get_permission_group_override(user):
+    """
+    Return permission groups that override active permission groups of user for the duration of current request
+    :param user: User object
+    :return: Group QuerySet or None if permission groups are not overridden
+    """
+    return getattr(user, PERMISSION_GROUP_OVERRIDE_ATTRIBUTE, None)
+
+
+def get_user_group_qs(user):
+    """
+    Return permission groups that are effective for user in current request, by default active permission groups of
+    user, or all permission groups of user if request is handled with activate_all_permissions_decorator
+    :param user: User object
+    :return: Group QuerySet
+    """
+    group_qs = get_permission_group_override(user)
+    return group_qs if group_qs is not None else user.groups.all()
+
+
+def user_has_object_permission(user, permission, instance):
+    """
+    Check if user has object permission to instance, permission groups that are overridden for the request
+    (activate_all_permissions_decorator) are taken into account
+    :param user: User object
+    :param permission: permission codename, e.g. view_organisaatio
+    :param instance: object instance
+    :return: boolean
+    """
+    group_qs = get_permission_group_override(user)
+    if group_qs is None or user.is_superuser:
+        return user.has_perm(permission, instance)
+
+    if not user.is_active:
+        return False
+
+    permission_filter = {
+        "content_type": ContentType.objects.get_for_model(type(instance)),
+        "object_pk": str(instance.pk),
+        "permission__codename": permission.rpartition(".")[2],
+    }
+    return (
+        GroupObjectPermission.objects.filter(group__in=group_qs, **permission_filter).exists()
+        or UserObjectPermission.objects.filter(user=user, **permission_filter).exists()
+    )
+
+
 def activate_all_permissions_decorator(function):
     """
-    Decorate ViewSet action so that User is temporarily added to all permission groups available to it
+    Decorate ViewSet action so that all permission groups available to User are effective during the request.
+    Permission groups are overridden only on the User instance of the request (see get_user_group_qs and
+    user_has_object_permission), so user.groups and cached permissions are not modified.
     :return: decorated function
     """
 
     @wraps(function)
-    @transaction.atomic
     def _activate_all_permissions_wrapper(*args, **kwargs):
         request = args[1]
 
@@ -1525,19 +1763,18 @@ def activate_all_permissions_decorator(function):
             # User is anonymous, admin or OPH user, or cas_fields are missing, do not modify groups
             return function(*args, **kwargs)
 
-        original_groups = list(user.groups.all())
-        # Add User to all permission groups available to it
-        user.groups.set(list(cas_fields.all_groups.all()) + original_groups)
-        # Handle request in try block, exceptions are raised after permissions are rolled back
+        if get_permission_group_override(user) is not None:
+            # Permission groups are already overridden (nested decorated function)
+            return function(*args, **kwargs)
+
+        # All permission groups available to User, including active groups
+        group_qs = Group.objects.filter(Q(id__in=cas_fields.all_groups.values("id")) | Q(id__in=user.groups.values("id")))
+        setattr(user, PERMISSION_GROUP_OVERRIDE_ATTRIBUTE, group_qs)
         try:
-            # Delete object id cache for user before running the function
-            delete_object_ids_user_has_permissions(user.id)
-            response = function(*args, **kwargs)
+            return function(*args, **kwargs)
         finally:
             # Reset permission groups to original ones
-            user.groups.set(original_groups)
-
-        return response
+            delattr(user, PERMISSION_GROUP_OVERRIDE_ATTRIBUTE)
 
     return _activate_all_permissions_wrapper
 
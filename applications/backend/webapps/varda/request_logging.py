@@ -4,21 +4,28 @@ import re
 from functools import wraps
 from json import JSONDecodeError
 
+from django.core.cache import cache
 from django.core.serializers.json import DjangoJSONEncoder
 from django.db.models import QuerySet
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.exceptions import ValidationError
 
+from varda.cache import get_redis_client
 from varda.enums.data_category import DataCategory
 from varda.helper_functions import hide_hetu
 from varda.misc import path_parse
 from varda.models import Z12_DataAccessLog, Z5_AuditLog, Z6_RequestLog
-from varda.permissions import get_related_organisaatio_for_user
+from varda.permissions import get_related_organisaatio_id_list_for_user
 from varda.validators import validate_lahdejarjestelma_koodi
 
 
 logger = logging.getLogger(__name__)
 
+DATA_ACCESS_LOG_BATCH_SIZE = 1000
+REQUEST_LOG_BUFFER_KEY = "request_log_buffer"
+REQUEST_LOG_BATCH_SIZE = 1000
+
 
 def request_log_viewset_decorator_factory(target_path=None, log_anonymous=False):
     def _request_log_viewset_decorator(cls):
@@ -47,6 +54,7 @@ def _request_log_dispatch_decorator(function, target_path, log_anonymous):
 
         # Parse body and lahdejarjestelma from request
         request_body, lahdejarjestelma = _parse_request_body(request.body)
+        timestamp = timezone.now()
 
         response = function(*args, **kwargs)
 
@@ -56,23 +64,21 @@ def _request_log_dispatch_decorator(function, target_path, log_anonymous):
             # Do not log anonymous requests by default
             return response
 
-        # Run this after request has been processed so that user attribute is correctly set
-        vakajarjestaja = _get_vakajarjestaja_for_user(user) if user else None
-
-        # Parse data from response
-        response_body = _parse_response_body(response.data)
-
-        request_log_object = Z6_RequestLog(
-            request_url=request.path,
-            request_method=request.method,
-            request_body=request_body,
-            lahdejarjestelma=lahdejarjestelma,
-            response_code=response.status_code,
-            response_body=response_body,
-            user=user,
-            vakajarjestaja=vakajarjestaja,
-            data_category=_get_data_category(request.path),
-        )
+        # Request log is built (and henkilotunnus is hidden) during the request, so that only the final row is buffered
+        request_log_data = {
+            "timestamp": timestamp.isoformat(),
+            "request_url": request.path,
+            "request_method": request.method,
+            "request_body": request_body,
+            "lahdejarjestelma": lahdejarjestelma,
+            "response_code": response.status_code,
+            "response_body": _parse_response_body(response.data),
+            "user_id": getattr(user, "id", None),
+            "vakajarjestaja_id": _get_vakajarjestaja_id_for_user(user) if user else None,
+            "data_category": _get_data_category(request.path),
+            "target_model": None,
+            "target_id": None,
+        }
 
         # If request is not POST and response is 200 or 400, we can save the request target.
         # It is difficult to determine the target if the request is POST, as the object does not yet exist
@@ -80,20 +86,68 @@ def _request_log_dispatch_decorator(function, target_path, log_anonymous):
         # (for example, if response is 404 or 403, user might not have permissions to the target,
         # in case of 204 the object has already been deleted, and 405 signifies an invalid method).
         target_valid_status_codes = [status.HTTP_200_OK, status.HTTP_400_BAD_REQUEST]
-        if request.method != "POST" and response.status_code in target_valid_status_codes and target_path is not None:
-            target_object = viewset.get_object()
+        # Object has already been fetched with get_object during request, so lookup value is the ID of the object
+        # (lahdejarjestelma:tunniste is replaced with ID in ObjectByTunnisteMixin.get_object)
+        lookup_value = str(viewset.kwargs.get(viewset.lookup_url_kwarg or viewset.lookup_field, ""))
+        if (
+            request.method != "POST"
+            and response.status_code in target_valid_status_codes
+            and target_path
+            and lookup_value.isdigit()
+        ):
+            target_object = viewset.queryset.model.objects.filter(id=lookup_value).first()
             for attribute in target_path:
-                target_object = getattr(target_object, attribute)
-                request_log_object.target_model = target_object.__class__.__name__
-                request_log_object.target_id = target_object.id
+                target_object = getattr(target_object, attribute, None)
+            if target_object is not None:
+                request_log_data["target_model"] = target_object.__class__.__name__
+                request_log_data["target_id"] = target_object.id
 
-        request_log_object.save()
+        try:
+            buffer_request_log(request_log_data)
+        except Exception as error:
+            # Logging must not fail the request
+            logger.error(f"Could not save request log: {error}, request url: {request.path}")
 
         return response
 
     return decorator
 
 
+def buffer_request_log(request_log_data):
+    """
+    Add request log data built in _request_log_dispatch_decorator to Redis list. Buffered rows are saved in batches by
+    save_request_log_buffer_task, so that logging does not increase response time. If Redis is not used as cache
+    (e.g. in unit tests), Z6_RequestLog instance is created immediately.
+    :param request_log_data: dict of Z6_RequestLog field values, henkilotunnus has already been hidden
+    """
+    redis_client = get_redis_client()
+    if not redis_client:
+        Z6_RequestLog.objects.create(**request_log_data)
+        return
+    redis_client.rpush(cache.make_key(REQUEST_LOG_BUFFER_KEY), json.dumps(request_log_data, cls=DjangoJSONEncoder))
+
+
+def save_request_log_buffer():
+    """
+    Create Z6_RequestLog instances from request log data buffered in Redis list. Rows are removed from the list only
+    after they have been saved, so rows are not lost if saving fails. Must not be run concurrently.
+    :return: number of created Z6_RequestLog instances
+    """
+    redis_client = get_redis_client()
+    if not redis_client:
+        return 0
+
+    key = cache.make_key(REQUEST_LOG_BUFFER_KEY)
+    count = 0
+    while request_log_data_list := redis_client.lrange(key, 0, REQUEST_LOG_BATCH_SIZE - 1):
+        Z6_RequestLog.objects.bulk_create(
+            [Z6_RequestLog(**json.loads(request_log_data)) for request_log_data in request_log_data_list]
+        )
+        redis_client.ltrim(key, len(request_log_data_list), -1)
+        count += len(request_log_data_list)
+    return count
+
+
 def _parse_request_body(request_body):
     """
     Return text representation of request_body, and lahdejarjestelma code if it can be determined from request
@@ -154,15 +208,15 @@ def _get_data_category(request_path):
     return DataCategory.OTHER.value
 
 
-def _get_vakajarjestaja_for_user(user):
-    vakajarjestaja_qs = get_related_organisaatio_for_user(user)
-    if not vakajarjestaja_qs.exists() or vakajarjestaja_qs.count() > 1:
+def _get_vakajarjestaja_id_for_user(user):
+    vakajarjestaja_id_list = get_related_organisaatio_id_list_for_user(user)
+    if len(vakajarjestaja_id_list) != 1:
         # User has permissions to multiple Vakajarjestaja or has no permissions at all
         logger.warning(f"Could not determine Vakajarjestaja for user: {user}")
         return None
 
     # A single Organisaatio can be determined for User
-    return vakajarjestaja_qs.first()
+    return vakajarjestaja_id_list[0]
 
 
 def save_audit_log(user, url):
@@ -223,23 +277,29 @@ def save_data_access_log(user, access_type, henkilo_obj=None, henkilo_id_oid_lis
     :param henkilo_obj: Henkilo instance
     :param henkilo_id_oid_list: list of tuples e.g. [(henkilo_id, henkilo_oid,)]
     """
-    organisaatio_qs = get_related_organisaatio_for_user(user)
-    if organisaatio_qs.count() != 1:
+    organisaatio_id_list = get_related_organisaatio_id_list_for_user(user)
+    if len(organisaatio_id_list) != 1:
         logger.error(f"Could not determine related Organisaatio for User with ID {user.id}")
     elif henkilo_obj:
         Z12_DataAccessLog.objects.create(
             henkilo_id=henkilo_obj.id,
             henkilo_oid=henkilo_obj.henkilo_oid,
             user=user,
-            organisaatio=organisaatio_qs.first(),
+            organisaatio_id=organisaatio_id_list[0],
             access_type=access_type,
         )
     elif henkilo_id_oid_list:
-        for henkilo_id, henkilo_oid in henkilo_id_oid_list:
-            Z12_DataAccessLog.objects.create(
-                henkilo_id=henkilo_id,
-                henkilo_oid=henkilo_oid,
-                user=user,
-                organisaatio=organisaatio_qs.first(),
-                access_type=access_type,
-            )
+        # Excel reports may contain tens of thousands of Henkilo objects, so create data access logs in batches
+        Z12_DataAccessLog.objects.bulk_create(
+            [
+                Z12_DataAccessLog(
+                    henkilo_id=henkilo_id,
+                    henkilo_oid=henkilo_oid,
+                    user=user,
+                    organisaatio_id=organisaatio_id_list[0],
+                    access_type=access_type,
+                )
+                for henkilo_id, henkilo_oid in henkilo_id_oid_list
+            ],
+            batch_size=DATA_ACCESS_LOG_BATCH_SIZE,
+        )
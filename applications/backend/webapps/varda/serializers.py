@@ -46,7 +46,11 @@ from varda.models import (
     Tukipaatos,
     TukipaatosAikavali,
 )
-from varda.permissions import check_if_oma_organisaatio_and_paos_organisaatio_have_paos_agreement, is_oph_staff
+from varda.permissions import (
+    check_if_oma_organisaatio_and_paos_organisaatio_have_paos_agreement,
+    get_user_group_qs,
+    is_oph_staff,
+)
 from varda.related_object_validations import (
     check_if_immutable_object_is_changed,
     check_toimipaikka_and_vakajarjestaja_have_oids,
@@ -213,7 +217,7 @@ class ActiveUserSerializer(serializers.ModelSerializer):
     @swagger_serializer_method(serializer_or_field=ActiveUserKayttooikeusSerializer(many=True))
     def get_kayttooikeudet(self, user):
         kayttooikeudet = []
-        user_groups = user.groups.filter(
+        user_groups = get_user_group_qs(user).filter(
             Q(name__startswith="VARDA-")
             | Q(name__startswith="HUOLTAJATIETO_")
             | Q(name__startswith="HENKILOSTO_")
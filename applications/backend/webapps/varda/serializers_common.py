@@ -3,7 +3,7 @@ from rest_framework.exceptions import ValidationError
 
 from varda.enums.error_messages import ErrorMessages
 from varda.models import Organisaatio, Toimipaikka, Henkilo
-from varda.permissions import user_belongs_to_correct_groups
+from varda.permissions import user_belongs_to_correct_groups, user_has_object_permission
 from varda.validators import validate_organisaatio_oid
 
 
@@ -172,7 +172,7 @@ class AbstractCustomRelatedField(serializers.Field):
 
             check_permission = getattr(parent_field, "check_permission", None)
             if (
-                check_permission and not user.has_perm(check_permission, referenced_object)
+                check_permission and not user_has_object_permission(user, check_permission, referenced_object)
             ) or not user_belongs_to_correct_groups(
                 user,
                 referenced_object,
@@ -291,7 +291,7 @@ class PermissionCheckedHLFieldMixin:
         hlfield_object = super(PermissionCheckedHLFieldMixin, self).get_object(view_name, view_args, view_kwargs)
         user = self.context["request"].user
 
-        if not user.has_perm(self.check_permission, hlfield_object) or not user_belongs_to_correct_groups(
+        if not user_has_object_permission(user, self.check_permission, hlfield_object) or not user_belongs_to_correct_groups(
             user,
             hlfield_object,
             permission_groups=getattr(self, "permission_groups", ()),
@@ -5,7 +5,7 @@ from drf_yasg.utils import swagger_serializer_method
 from rest_framework import serializers
 
 from varda import validators
-from varda.cache import caching_to_representation, get_object_ids_user_has_permissions
+from varda.cache import caching_to_representation
 from varda.constants import TEHTAVANIMIKE_KOODI_VAKA_AVUSTAJA
 from varda.enums.error_messages import ErrorMessages
 from varda.misc_viewsets import ViewSetValidator
@@ -29,6 +29,7 @@ from varda.permissions import (
     user_permission_groups_in_organization,
     is_oph_staff,
     get_available_tehtavanimike_codes_for_user,
+    get_object_id_qs_user_has_permissions,
 )
 from varda.related_object_validations import (
     create_date_range,
@@ -1064,7 +1065,7 @@ def _get_permission_checked_henkilosto_tyontekija_objects(serializer_instance, q
         [Z4_CasKayttoOikeudet.HENKILOSTO_TYONTEKIJA_KATSELIJA, Z4_CasKayttoOikeudet.HENKILOSTO_TYONTEKIJA_TALLENTAJA],
     )
     if not user.is_superuser and not is_oph_staff(user) and not tyontekija_groups_qs.exists():
-        queryset = queryset.filter(id__in=get_object_ids_user_has_permissions(user, queryset.model))
+        queryset = queryset.filter(id__in=get_object_id_qs_user_has_permissions(user, queryset.model))
 
     filtered_list = []
     for instance in queryset.all().order_by("-alkamis_pvm"):
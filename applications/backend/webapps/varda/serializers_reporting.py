@@ -6,7 +6,7 @@ from django.conf import settings
 from django.contrib.postgres.aggregates import StringAgg
 from django.core.exceptions import ObjectDoesNotExist
 from django.db import connections
-from django.db.models import OuterRef, Q, Subquery, Sum
+from django.db.models import F, OuterRef, Q, Subquery, Sum
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_serializer_method
 from rest_framework import serializers
@@ -23,7 +23,12 @@ from varda.enums.error_messages import ErrorMessages
 from varda.enums.organisaatiotyyppi import Organisaatiotyyppi
 from varda.excel_export import ExcelReportSubtype, ReportStatus, ExcelReportType, get_s3_object_name
 from varda.misc import CustomServerErrorException, decrypt_excel_report_password, decrypt_henkilotunnus
-from varda.misc_queries import get_active_filter, get_history_value_subquery, get_related_object_changed_id_qs
+from varda.misc_queries import (
+    get_active_filter,
+    get_history_instances_by_id,
+    get_history_value_subquery,
+    get_related_object_changed_id_qs,
+)
 from varda.models import (
     Henkilo,
     Huoltajuussuhde,
@@ -59,27 +64,37 @@ from varda.serializers_common import OidRelatedField
 logger = logging.getLogger(__name__)
 
 
-class KelaBaseSerializer(serializers.Serializer):
-    kotikunta_koodi = serializers.CharField(source="henkilo_instance.kotikunta_koodi")
-    henkilotunnus = serializers.SerializerMethodField()
+class KelaListSerializer(serializers.ListSerializer):
+    """
+    Resolves related instances for all rows of the page with a few bulk queries (see prefetch_instances of child
+    serializer) instead of querying them separately for each row
+    """
+
+    def to_representation(self, data):
+        instance_list = list(data)
+        self.child.prefetch_instances(instance_list)
+        return super().to_representation(instance_list)
 
+
+class AbstractKelaSerializer(serializers.Serializer):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         if "view" in self.context:
             # view is not present in context in Swagger
             self.datetime_lte = self.context["view"].datetime_lte
+        self.henkilo_dict = None
 
-    def to_representation(self, instance):
+    def prefetch_instances(self, instance_list):
         # Get henkilo data from history table or actual table (history is incomplete in test environments)
-        henkilo = (
-            Henkilo.history.filter(id=instance.henkilo_id, history_date__lte=self.datetime_lte)
-            .distinct("id")
-            .order_by("id", "-history_date")
-            .first()
+        self.henkilo_dict = get_history_instances_by_id(
+            Henkilo, [instance.henkilo_id for instance in instance_list], self.datetime_lte, fallback_to_current=True
         )
-        if not henkilo:
-            henkilo = Henkilo.objects.filter(id=instance.henkilo_id).first()
-        instance.henkilo_instance = henkilo
+
+    def to_representation(self, instance):
+        if self.henkilo_dict is None:
+            # Serializer is used without KelaListSerializer
+            self.prefetch_instances([instance])
+        instance.henkilo_instance = self.henkilo_dict.get(instance.henkilo_id)
 
         return super().to_representation(instance)
 
@@ -89,7 +104,12 @@ class KelaBaseSerializer(serializers.Serializer):
         return decrypt_henkilotunnus(henkilotunnus, henkilo_id=henkilo_id, raise_error=False)
 
 
-class KelaBaseV2Serializer(serializers.Serializer):
+class KelaBaseSerializer(AbstractKelaSerializer):
+    kotikunta_koodi = serializers.CharField(source="henkilo_instance.kotikunta_koodi")
+    henkilotunnus = serializers.SerializerMethodField()
+
+
+class KelaBaseV2Serializer(AbstractKelaSerializer):
     vakasuhde_id = serializers.IntegerField(source="varhaiskasvatussuhde_id")
     kotikunta_koodi = serializers.CharField(source="henkilo_instance.kotikunta_koodi")
     tallentajakunta_koodi = serializers.SerializerMethodField()
@@ -98,62 +118,58 @@ class KelaBaseV2Serializer(serializers.Serializer):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        if "view" in self.context:
-            # view is not present in context in Swagger
-            self.datetime_lte = self.context["view"].datetime_lte
+        self.lapsi_organisaatio_dict = None
 
-    def to_representation(self, instance):
-        # Get henkilo data from history table or actual table (history is incomplete in test environments)
-        henkilo = (
-            Henkilo.history.filter(id=instance.henkilo_id, history_date__lte=self.datetime_lte)
-            .distinct("id")
-            .order_by("id", "-history_date")
-            .first()
-        )
-        if not henkilo:
-            henkilo = Henkilo.objects.filter(id=instance.henkilo_id).first()
-        instance.henkilo_instance = henkilo
+    def prefetch_instances(self, instance_list):
+        super().prefetch_instances(instance_list)
 
         # tallentajakunta_koodi
-        try:
-            lapsi = Lapsi.objects.get(id=instance.lapsi_id)
-        except Lapsi.DoesNotExist:
-            lapsi = (
-                Lapsi.history.filter(id=instance.lapsi_id, history_date__lte=self.datetime_lte)
-                .distinct("id")
-                .order_by("id", "-history_date")
-                .first()
-            )
+        lapsi_id_set = {instance.lapsi_id for instance in instance_list}
+        lapsi_dict = Lapsi.objects.in_bulk(lapsi_id_set)
+        lapsi_dict.update(get_history_instances_by_id(Lapsi, lapsi_id_set - lapsi_dict.keys(), self.datetime_lte))
 
-        if lapsi.paos_kytkin:
-            organisaatio_instance = lapsi.oma_organisaatio
-        else:
-            organisaatio_instance = lapsi.vakatoimija
-        instance.organisaatio_instance = organisaatio_instance
+        lapsi_organisaatio_id_dict = {
+            lapsi.id: lapsi.oma_organisaatio_id if lapsi.paos_kytkin else lapsi.vakatoimija_id for lapsi in lapsi_dict.values()
+        }
+        organisaatio_dict = Organisaatio.objects.in_bulk(set(lapsi_organisaatio_id_dict.values()) - {None})
+        self.lapsi_organisaatio_dict = {
+            lapsi_id: organisaatio_dict.get(organisaatio_id) for lapsi_id, organisaatio_id in lapsi_organisaatio_id_dict.items()
+        }
+
+    def to_representation(self, instance):
+        if self.henkilo_dict is None:
+            # Serializer is used without KelaListSerializer
+            self.prefetch_instances([instance])
+        instance.organisaatio_instance = self.lapsi_organisaatio_dict.get(instance.lapsi_id)
 
         return super().to_representation(instance)
 
     def get_tallentajakunta_koodi(self, instance):
         return getattr(instance.organisaatio_instance, "kunta_koodi", None)
 
-    def get_henkilotunnus(self, instance):
-        henkilotunnus = getattr(instance.henkilo_instance, "henkilotunnus", None)
-        henkilo_id = getattr(instance.henkilo_instance, "id", None)
-        return decrypt_henkilotunnus(henkilotunnus, henkilo_id=henkilo_id, raise_error=False)
-
 
 class KelaBaseV2KPSerializer(KelaBaseV2Serializer):
     vakasuhde_muutos_pvm = serializers.SerializerMethodField()
 
-    def get_vakasuhde_muutos_pvm(self, instance):
-        return (
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.deleted_history_date_dict = None
+
+    def prefetch_instances(self, instance_list):
+        super().prefetch_instances(instance_list)
+        self.deleted_history_date_dict = dict(
             Z10_KelaVarhaiskasvatussuhde.objects.filter(
-                varhaiskasvatussuhde_id=instance.varhaiskasvatussuhde_id, history_type="-"
+                varhaiskasvatussuhde_id__in={instance.varhaiskasvatussuhde_id for instance in instance_list},
+                history_type="-",
             )
-            .last()
-            .history_date
+            .distinct("varhaiskasvatussuhde_id")
+            .order_by("varhaiskasvatussuhde_id", "-id")
+            .values_list("varhaiskasvatussuhde_id", "history_date")
         )
 
+    def get_vakasuhde_muutos_pvm(self, instance):
+        return self.deleted_history_date_dict.get(instance.varhaiskasvatussuhde_id)
+
 
 class KelaEtuusmaksatusAloittaneetSerializer(KelaBaseSerializer, serializers.ModelSerializer):
     tietue = serializers.CharField(default="A", initial="A")
@@ -161,6 +177,7 @@ class KelaEtuusmaksatusAloittaneetSerializer(KelaBaseSerializer, serializers.Mod
 
     class Meta:
         model = Z10_KelaVarhaiskasvatussuhde
+        list_serializer_class = KelaListSerializer
         fields = ("kotikunta_koodi", "henkilotunnus", "tietue", "vakasuhde_alkamis_pvm")
 
 
@@ -170,6 +187,7 @@ class KelaEtuusmaksatusAloittaneetV2Serializer(KelaBaseV2Serializer, serializers
 
     class Meta:
         model = Z10_KelaVarhaiskasvatussuhde
+        list_serializer_class = KelaListSerializer
         fields = (
             "vakasuhde_id",
             "kotikunta_koodi",
@@ -188,6 +206,7 @@ class KelaEtuusmaksatusMaaraaikaisetSerializer(KelaBaseSerializer, serializers.M
 
     class Meta:
         model = Z10_KelaVarhaiskasvatussuhde
+        list_serializer_class = KelaListSerializer
         fields = ("kotikunta_koodi", "henkilotunnus", "tietue", "vakasuhde_alkamis_pvm", "vakasuhde_paattymis_pvm")
 
 
@@ -198,6 +217,7 @@ class KelaEtuusmaksatusMaaraaikaisetV2Serializer(KelaBaseV2Serializer, serialize
 
     class Meta:
         model = Z10_KelaVarhaiskasvatussuhde
+        list_serializer_class = KelaListSerializer
         fields = (
             "vakasuhde_id",
             "kotikunta_koodi",
@@ -216,11 +236,15 @@ class KelaEtuusmaksatusLopettaneetSerializer(serializers.Serializer):
     tietue = serializers.CharField(default="L", initial="L")
     vakasuhde_paattymis_pvm = serializers.DateField(source="paattymis_pvm")
 
+    def prefetch_instances(self, instance_list):
+        pass
+
     def get_henkilotunnus(self, instance):
-        return decrypt_henkilotunnus(instance.henkilotunnus)
+        return decrypt_henkilotunnus(instance.henkilotunnus, henkilo_id=instance.henkilo_id)
 
     class Meta:
         model = Varhaiskasvatussuhde
+        list_serializer_class = KelaListSerializer
         fields = ["henkilotunnus", "kotikunta_koodi", "tietue", "vakasuhde_paattymis_pvm"]
 
 
@@ -233,22 +257,29 @@ class KelaEtuusmaksatusLopettaneetV2Serializer(serializers.Serializer):
     vakasuhde_paattymis_pvm = serializers.DateField(source="paattymis_pvm")
     vakasuhde_muutos_pvm = serializers.DateTimeField(source="muutos_pvm")
 
-    def get_tallentajakunta_koodi(self, instance):
-        if instance.paos_kytkin:
-            organisaatio_id = instance.oma_organisaatio_id
-        else:
-            organisaatio_id = instance.vakatoimija_id
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.kunta_koodi_dict = None
 
-        try:
-            return Organisaatio.objects.get(id=organisaatio_id).kunta_koodi
-        except Organisaatio.DoesNotExist:
-            return None
+    def prefetch_instances(self, instance_list):
+        organisaatio_id_set = {self._get_organisaatio_id(instance) for instance in instance_list}
+        self.kunta_koodi_dict = dict(Organisaatio.objects.filter(id__in=organisaatio_id_set).values_list("id", "kunta_koodi"))
+
+    def _get_organisaatio_id(self, instance):
+        return instance.oma_organisaatio_id if instance.paos_kytkin else instance.vakatoimija_id
+
+    def get_tallentajakunta_koodi(self, instance):
+        if self.kunta_koodi_dict is None:
+            # Serializer is used without KelaListSerializer
+            self.prefetch_instances([instance])
+        return self.kunta_koodi_dict.get(self._get_organisaatio_id(instance))
 
     def get_henkilotunnus(self, instance):
-        return decrypt_henkilotunnus(instance.henkilotunnus)
+        return decrypt_henkilotunnus(instance.henkilotunnus, henkilo_id=instance.henkilo_id)
 
     class Meta:
         model = Varhaiskasvatussuhde
+        list_serializer_class = KelaListSerializer
         fields = (
             "vakasuhde_id",
             "henkilotunnus",
@@ -269,6 +300,7 @@ class KelaEtuusmaksatusKorjaustiedotSerializer(KelaBaseSerializer, serializers.M
 
     class Meta:
         model = Z10_KelaVarhaiskasvatussuhde
+        list_serializer_class = KelaListSerializer
         fields = (
             "kotikunta_koodi",
             "henkilotunnus",
@@ -308,6 +340,7 @@ class KelaEtuusmaksatusKorjaustiedotV2Serializer(KelaBaseV2Serializer, serialize
 
     class Meta:
         model = Z10_KelaVarhaiskasvatussuhde
+        list_serializer_class = KelaListSerializer
         fields = (
             "vakasuhde_id",
             "kotikunta_koodi",
@@ -350,6 +383,7 @@ class KelaEtuusmaksatusKorjaustiedotPoistetutSerializer(KelaBaseSerializer, seri
 
     class Meta:
         model = Z10_KelaVarhaiskasvatussuhde
+        list_serializer_class = KelaListSerializer
         fields = (
             "kotikunta_koodi",
             "henkilotunnus",
@@ -373,6 +407,7 @@ class KelaEtuusmaksatusKorjaustiedotPoistetutV2Serializer(KelaBaseV2KPSerializer
 
     class Meta:
         model = Z10_KelaVarhaiskasvatussuhde
+        list_serializer_class = KelaListSerializer
         fields = (
             "vakasuhde_id",
             "kotikunta_koodi",
@@ -811,6 +846,7 @@ class HistoricalBaseSerializer(serializers.Serializer):
             self.datetime_gt = self.context["view"].datetime_gt
             self.datetime_lte = self.context["view"].datetime_lte
         self.secondary_muutos_pvm = None
+        self.prefetched_dict = None
 
     def get_action(self, instance):
         if instance.history_type == "-":
@@ -832,19 +868,107 @@ class HistoricalBaseSerializer(serializers.Serializer):
 
         return ChangeType.UNCHANGED.value
 
+    def prefetch_instances(self, instance_list):
+        """
+        Load related data of all instances of the page with bulk queries, so that the number of queries does not
+        depend on the number of instances. Subclasses store the data in prefetched_dict.
+        :param instance_list: list of historical instances
+        """
+        self.prefetched_dict = {}
+
+    def get_prefetched(self, key, instance):
+        if self.prefetched_dict is None:
+            # Serializer is used without TkListSerializer
+            self.prefetch_instances([instance])
+        return self.prefetched_dict[key]
+
+    def set_prefetched_nested(self, key, serializer_class, instance_dict, **prefetch_kwargs):
+        """
+        Store nested instances grouped by parent, and prefetch related data of all nested instances at once
+        :param key: name of the nested field
+        :param serializer_class: serializer class of nested instances (uses TkListSerializer)
+        :param instance_dict: dict of parent key and list of nested instances pairs
+        :param prefetch_kwargs: additional arguments passed to prefetch_instances of nested serializer
+        """
+        list_serializer = serializer_class(many=True, context=self.context)
+        list_serializer.prefetch(
+            [nested_instance for nested_list in instance_dict.values() for nested_instance in nested_list], **prefetch_kwargs
+        )
+        self.prefetched_dict[key] = (list_serializer, instance_dict)
+
+    def set_prefetched_nested_by_parent_field(self, key, serializer_class, model, parent_field, parent_id_list):
+        """
+        Store nested instances that have been changed during the time window and are related to parent with parent_field
+        """
+        nested_qs = (
+            model.history.filter(
+                **{f"{parent_field}__in": parent_id_list},
+                history_date__gt=self.datetime_gt,
+                history_date__lte=self.datetime_lte,
+            )
+            .distinct(parent_field, "id")
+            .order_by(parent_field, "id", "-history_date")
+        )
+        self.set_prefetched_nested(key, serializer_class, _group_instances(nested_qs, parent_field))
+
+    def get_prefetched_nested_data(self, key, instance, parent_key=None):
+        list_serializer, instance_dict = self.get_prefetched(key, instance)
+        return list_serializer.to_representation(instance_dict.get(instance.id if parent_key is None else parent_key, []))
+
+
+def _group_instances(instance_iterable, parent_field, id_pair_set=None):
+    """
+    Group instances by parent
+    :param instance_iterable: iterable of instances
+    :param parent_field: name of the parent ID attribute, or tuple of names for a composite key
+    :param id_pair_set: if provided, only instances with (parent ID, instance ID) pair in the set are included
+    :return: dict of parent key and list of instances pairs
+    """
+    instance_dict = {}
+    for instance in instance_iterable:
+        if isinstance(parent_field, tuple):
+            parent_key = tuple(getattr(instance, field) for field in parent_field)
+        else:
+            parent_key = getattr(instance, parent_field)
+        if id_pair_set is None or (parent_key, instance.id) in id_pair_set:
+            instance_dict.setdefault(parent_key, []).append(instance)
+    return instance_dict
+
+
+class TkListSerializer(serializers.ListSerializer):
+    """
+    Prefetches related data of all instances with bulk queries before serializing them
+    (see HistoricalBaseSerializer.prefetch_instances)
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.is_prefetched = False
+
+    def get_instance_list(self, data):
+        return list(data)
+
+    def prefetch(self, data, **kwargs):
+        self.child.prefetch_instances(self.get_instance_list(data), **kwargs)
+        self.is_prefetched = True
 
-class TkBaseListSerializer(serializers.ListSerializer):
     def to_representation(self, data):
+        instance_list = self.get_instance_list(data)
+        if not self.is_prefetched:
+            self.child.prefetch_instances(instance_list)
+        return super().to_representation(instance_list)
+
+
+class TkBaseListSerializer(TkListSerializer):
+    def get_instance_list(self, data):
         # Remove instances that have been added and deleted during the time range
         datetime_gt = self.context["view"].datetime_gt
-        data = [
+        return [
             instance
             for instance in data
             if instance.history_type != "-" or (instance.history_type == "-" and instance.luonti_pvm < datetime_gt)
         ]
 
-        return super().to_representation(data)
-
 
 class TkToiminnallinenPainotusSerializer(HistoricalBaseSerializer, serializers.ModelSerializer):
     class Meta:
@@ -892,27 +1016,27 @@ class TkToimipaikkaSerializer(HistoricalBaseSerializer, serializers.ModelSeriali
             "kielipainotukset",
         )
 
+    def prefetch_instances(self, instance_list):
+        super().prefetch_instances(instance_list)
+        toimipaikka_id_list = [instance.id for instance in instance_list]
+        self.set_prefetched_nested_by_parent_field(
+            "toiminnalliset_painotukset",
+            TkToiminnallinenPainotusSerializer,
+            ToiminnallinenPainotus,
+            "toimipaikka_id",
+            toimipaikka_id_list,
+        )
+        self.set_prefetched_nested_by_parent_field(
+            "kielipainotukset", TkKielipainotusSerializer, KieliPainotus, "toimipaikka_id", toimipaikka_id_list
+        )
+
     @swagger_serializer_method(serializer_or_field=TkToiminnallinenPainotusSerializer)
     def get_toiminnalliset_painotukset(self, instance):
-        painotus_qs = (
-            ToiminnallinenPainotus.history.filter(
-                toimipaikka_id=instance.id, history_date__gt=self.datetime_gt, history_date__lte=self.datetime_lte
-            )
-            .distinct("id")
-            .order_by("id", "-history_date")
-        )
-        return TkToiminnallinenPainotusSerializer(painotus_qs, many=True, context=self.context).data
+        return self.get_prefetched_nested_data("toiminnalliset_painotukset", instance)
 
     @swagger_serializer_method(serializer_or_field=TkKielipainotusSerializer)
     def get_kielipainotukset(self, instance):
-        painotus_qs = (
-            KieliPainotus.history.filter(
-                toimipaikka_id=instance.id, history_date__gt=self.datetime_gt, history_date__lte=self.datetime_lte
-            )
-            .distinct("id")
-            .order_by("id", "-history_date")
-        )
-        return TkKielipainotusSerializer(painotus_qs, many=True, context=self.context).data
+        return self.get_prefetched_nested_data("kielipainotukset", instance)
 
 
 class TkVuokrattuHenkilostoSerializer(HistoricalBaseSerializer, serializers.ModelSerializer):
@@ -928,6 +1052,7 @@ class TkOrganisaatiotSerializer(HistoricalBaseSerializer, serializers.ModelSeria
 
     class Meta:
         model = Organisaatio
+        list_serializer_class = TkListSerializer
         fields = (
             "id",
             "action",
@@ -952,37 +1077,64 @@ class TkOrganisaatiotSerializer(HistoricalBaseSerializer, serializers.ModelSeria
             "tilapainen_henkilosto",
         )
 
-    @swagger_serializer_method(serializer_or_field=TkToimipaikkaSerializer)
-    def get_toimipaikat(self, instance):
-        id_qs = get_related_object_changed_id_qs(
-            Toimipaikka.get_name(), self.datetime_gt, self.datetime_lte, additional_filters=Q(parent_instance_id=instance.id)
-        )
+    def prefetch_instances(self, instance_list):
+        super().prefetch_instances(instance_list)
+        organisaatio_id_list = [instance.id for instance in instance_list]
 
+        # toimipaikat
+        id_pair_set = set(
+            get_related_object_changed_id_qs(
+                Toimipaikka.get_name(),
+                self.datetime_gt,
+                self.datetime_lte,
+                additional_filters=Q(parent_instance_id__in=organisaatio_id_list),
+                partition_field="parent_instance_id",
+            )
+        )
         last_parent_subquery = get_history_value_subquery(Toimipaikka, "vakajarjestaja_id", self.datetime_lte)
         previous_parent_subquery = get_history_value_subquery(Toimipaikka, "vakajarjestaja_id", self.datetime_gt)
         toimipaikka_qs = (
-            Toimipaikka.history.filter(id__in=Subquery(id_qs), vakajarjestaja_id=instance.id, history_date__lte=self.datetime_lte)
+            Toimipaikka.history.filter(
+                id__in={id_pair[1] for id_pair in id_pair_set},
+                vakajarjestaja_id__in=organisaatio_id_list,
+                history_date__lte=self.datetime_lte,
+            )
             .annotate(last_parent_id=last_parent_subquery, previous_parent_id=previous_parent_subquery)
-            .filter(last_parent_id=instance.id)
-            .distinct("id")
-            .order_by("id", "-history_date")
+            .filter(last_parent_id=F("vakajarjestaja_id"))
+            .distinct("vakajarjestaja_id", "id")
+            .order_by("vakajarjestaja_id", "id", "-history_date")
+        )
+        self.set_prefetched_nested(
+            "toimipaikat", TkToimipaikkaSerializer, _group_instances(toimipaikka_qs, "vakajarjestaja_id", id_pair_set)
         )
-        return TkToimipaikkaSerializer(toimipaikka_qs, many=True, context=self.context).data
 
-    @swagger_serializer_method(serializer_or_field=TkVuokrattuHenkilostoSerializer)
-    def get_tilapainen_henkilosto(self, instance):
+        # tilapainen_henkilosto
         last_parent_subquery = get_history_value_subquery(VuokrattuHenkilosto, "vakajarjestaja_id", self.datetime_lte)
         previous_parent_subquery = get_history_value_subquery(VuokrattuHenkilosto, "vakajarjestaja_id", self.datetime_gt)
         vuokrattu_henkilosto_qs = (
             VuokrattuHenkilosto.history.filter(
-                vakajarjestaja_id=instance.id, history_date__gt=self.datetime_gt, history_date__lte=self.datetime_lte
+                vakajarjestaja_id__in=organisaatio_id_list,
+                history_date__gt=self.datetime_gt,
+                history_date__lte=self.datetime_lte,
             )
             .annotate(last_parent_id=last_parent_subquery, previous_parent_id=previous_parent_subquery)
-            .filter(last_parent_id=instance.id)
-            .distinct("id")
-            .order_by("id", "-history_date")
+            .filter(last_parent_id=F("vakajarjestaja_id"))
+            .distinct("vakajarjestaja_id", "id")
+            .order_by("vakajarjestaja_id", "id", "-history_date")
+        )
+        self.set_prefetched_nested(
+            "tilapainen_henkilosto",
+            TkVuokrattuHenkilostoSerializer,
+            _group_instances(vuokrattu_henkilosto_qs, "vakajarjestaja_id"),
         )
-        return TkVuokrattuHenkilostoSerializer(vuokrattu_henkilosto_qs, many=True, context=self.context).data
+
+    @swagger_serializer_method(serializer_or_field=TkToimipaikkaSerializer)
+    def get_toimipaikat(self, instance):
+        return self.get_prefetched_nested_data("toimipaikat", instance)
+
+    @swagger_serializer_method(serializer_or_field=TkVuokrattuHenkilostoSerializer)
+    def get_tilapainen_henkilosto(self, instance):
+        return self.get_prefetched_nested_data("tilapainen_henkilosto", instance)
 
 
 class TkVakasuhdeSerializer(HistoricalBaseSerializer, serializers.ModelSerializer):
@@ -1020,16 +1172,19 @@ class TkVakapaatosSerializer(HistoricalBaseSerializer, serializers.ModelSerializ
             "varhaiskasvatussuhteet",
         )
 
+    def prefetch_instances(self, instance_list):
+        super().prefetch_instances(instance_list)
+        self.set_prefetched_nested_by_parent_field(
+            "varhaiskasvatussuhteet",
+            TkVakasuhdeSerializer,
+            Varhaiskasvatussuhde,
+            "varhaiskasvatuspaatos_id",
+            [instance.id for instance in instance_list],
+        )
+
     @swagger_serializer_method(serializer_or_field=TkVakasuhdeSerializer)
     def get_varhaiskasvatussuhteet(self, instance):
-        vakasuhde_qs = (
-            Varhaiskasvatussuhde.history.filter(
-                varhaiskasvatuspaatos_id=instance.id, history_date__gt=self.datetime_gt, history_date__lte=self.datetime_lte
-            )
-            .distinct("id")
-            .order_by("id", "-history_date")
-        )
-        return TkVakasuhdeSerializer(vakasuhde_qs, many=True, context=self.context).data
+        return self.get_prefetched_nested_data("varhaiskasvatussuhteet", instance)
 
 
 class TkHuoltajuussuhdeSerializer(HistoricalBaseSerializer, serializers.ModelSerializer):
@@ -1056,16 +1211,15 @@ class TkHuoltajuussuhdeSerializer(HistoricalBaseSerializer, serializers.ModelSer
             "postitoimipaikka",
         )
 
-    def to_representation(self, instance):
+    def prefetch_instances(self, instance_list):
+        super().prefetch_instances(instance_list)
         # Get henkilo data from history table or actual table (history is incomplete in test environments)
-        henkilo = (
-            Henkilo.history.filter(id=instance.henkilo_id, history_date__lte=self.datetime_lte)
-            .distinct("id")
-            .order_by("id", "-history_date")
-            .first()
+        self.prefetched_dict["henkilo"] = get_history_instances_by_id(
+            Henkilo, [instance.henkilo_id for instance in instance_list], self.datetime_lte, fallback_to_current=True
         )
-        if not henkilo:
-            henkilo = Henkilo.objects.filter(id=instance.henkilo_id).first()
+
+    def to_representation(self, instance):
+        henkilo = self.get_prefetched("henkilo", instance).get(instance.henkilo_id)
         self.secondary_muutos_pvm = getattr(henkilo, "muutos_pvm", None)
         instance.henkilo_instance = henkilo
 
@@ -1100,37 +1254,44 @@ class TkMaksutietoSerializer(HistoricalBaseSerializer, serializers.ModelSerializ
             "huoltajat",
         )
 
-    @swagger_serializer_method(serializer_or_field=TkMaksutietoHuoltajaSerializer)
-    def get_huoltajat(self, instance):
-        # Get data of Henkilo objects that are related to the Maksutieto object during the time window
+    def prefetch_instances(self, instance_list):
+        super().prefetch_instances(instance_list)
+        # Get data of Henkilo objects that are related to the Maksutieto objects during the time window
         # Get henkilo data from history table or actual table (history is incomplete in test environments)
         # We need to join historical tables so raw SQL query is simpler
+        huoltaja_dict = {}
         with connections[settings.READER_DB].cursor() as cursor:
             cursor.execute(
                 """
-                SELECT DISTINCT ON(hhu.henkilo_id) hhu.henkilo_id, hhe.henkilo_oid, he.henkilo_oid, hhe.henkilotunnus, he.henkilotunnus
+                SELECT DISTINCT ON(hmhs.maksutieto_id, hhu.henkilo_id) hmhs.maksutieto_id, hhu.henkilo_id, hhe.henkilo_oid,
+                    he.henkilo_oid, hhe.henkilotunnus, he.henkilotunnus
                 FROM varda_historicalmaksutietohuoltajuussuhde hmhs
                 LEFT JOIN varda_historicalhuoltajuussuhde hhs ON hmhs.huoltajuussuhde_id = hhs.id
                 LEFT JOIN varda_historicalhuoltaja hhu ON hhs.huoltaja_id = hhu.id
                 LEFT JOIN varda_historicalhenkilo hhe ON hhe.id = hhu.henkilo_id
                 LEFT JOIN varda_henkilo he ON he.id = hhu.henkilo_id
-                WHERE hmhs.maksutieto_id = %s AND hmhs.history_date <= %s
-                ORDER BY hhu.henkilo_id, hhe.history_date DESC;
+                WHERE hmhs.maksutieto_id = ANY(%s) AND hmhs.history_date <= %s
+                ORDER BY hmhs.maksutieto_id, hhu.henkilo_id, hhe.history_date DESC;
             """,
-                [instance.id, self.datetime_lte],
+                [[instance.id for instance in instance_list], self.datetime_lte],
             )
 
-            huoltaja_list = [
-                {
-                    "henkilo_oid": result[1] or result[2],
-                    "henkilotunnus": (
-                        decrypt_henkilotunnus(result[3], henkilo_id=result[0], raise_error=False)
-                        or decrypt_henkilotunnus(result[4], henkilo_id=result[0], raise_error=False)
-                    ),
-                }
-                for result in cursor.fetchall()
-            ]
-            return TkMaksutietoHuoltajaSerializer(huoltaja_list, many=True).data
+            for result in cursor.fetchall():
+                huoltaja_dict.setdefault(result[0], []).append(
+                    {
+                        "henkilo_oid": result[2] or result[3],
+                        "henkilotunnus": (
+                            decrypt_henkilotunnus(result[4], henkilo_id=result[1], raise_error=False)
+                            or decrypt_henkilotunnus(result[5], henkilo_id=result[1], raise_error=False)
+                        ),
+                    }
+                )
+        self.prefetched_dict["huoltajat"] = huoltaja_dict
+
+    @swagger_serializer_method(serializer_or_field=TkMaksutietoHuoltajaSerializer)
+    def get_huoltajat(self, instance):
+        huoltaja_list = self.get_prefetched("huoltajat", instance).get(instance.id, [])
+        return TkMaksutietoHuoltajaSerializer(huoltaja_list, many=True).data
 
 
 class TkVakatiedotSerializer(HistoricalBaseSerializer, serializers.ModelSerializer):
@@ -1175,89 +1336,95 @@ class TkVakatiedotSerializer(HistoricalBaseSerializer, serializers.ModelSerializ
             "maksutiedot",
         )
 
-    def to_representation(self, instance):
+    def prefetch_instances(self, instance_list):
+        super().prefetch_instances(instance_list)
+        lapsi_id_list = [instance.id for instance in instance_list]
+
         # Get henkilo data from history table or actual table (history is incomplete in test environments)
-        henkilo = (
-            Henkilo.history.filter(id=instance.henkilo_id, history_date__lte=self.datetime_lte)
-            .distinct("id")
-            .order_by("id", "-history_date")
-            .first()
+        self.prefetched_dict["henkilo"] = get_history_instances_by_id(
+            Henkilo, [instance.henkilo_id for instance in instance_list], self.datetime_lte, fallback_to_current=True
         )
-        if not henkilo:
-            henkilo = Henkilo.objects.filter(id=instance.henkilo_id).first()
-        self.secondary_muutos_pvm = getattr(henkilo, "muutos_pvm", None)
-        instance.henkilo_instance = henkilo
 
         # varda_historicallapsi does not contain all vakatoimija_id changes because the field has been updated
         # directly in db, so try to get it from varda_lapsi table
-        if not instance.paos_kytkin and not instance.vakatoimija_id:
-            instance.vakatoimija_id = getattr(Lapsi.objects.filter(id=instance.id).first(), "vakatoimija_id", None)
-
-        lapsi = super().to_representation(instance)
-        return lapsi
+        missing_vakatoimija_id_list = [
+            instance.id for instance in instance_list if not instance.paos_kytkin and not instance.vakatoimija_id
+        ]
+        self.prefetched_dict["vakatoimija_id"] = (
+            dict(Lapsi.objects.filter(id__in=missing_vakatoimija_id_list).values_list("id", "vakatoimija_id"))
+            if missing_vakatoimija_id_list
+            else {}
+        )
 
-    def get_henkilotunnus(self, instance):
-        henkilotunnus = getattr(instance.henkilo_instance, "henkilotunnus", None)
-        henkilo_id = getattr(instance.henkilo_instance, "id", None)
-        return decrypt_henkilotunnus(henkilotunnus, henkilo_id=henkilo_id, raise_error=False)
+        self._prefetch_varhaiskasvatuspaatokset(lapsi_id_list)
+        self._prefetch_huoltajat(lapsi_id_list)
+        self._prefetch_maksutiedot(lapsi_id_list)
 
-    @swagger_serializer_method(serializer_or_field=TkVakapaatosSerializer)
-    def get_varhaiskasvatuspaatokset(self, instance):
-        id_qs = get_related_object_changed_id_qs(
-            Varhaiskasvatuspaatos.get_name(),
-            self.datetime_gt,
-            self.datetime_lte,
-            additional_filters=Q(parent_instance_id=instance.id),
+    def _prefetch_varhaiskasvatuspaatokset(self, lapsi_id_list):
+        id_pair_set = set(
+            get_related_object_changed_id_qs(
+                Varhaiskasvatuspaatos.get_name(),
+                self.datetime_gt,
+                self.datetime_lte,
+                additional_filters=Q(parent_instance_id__in=lapsi_id_list),
+                partition_field="parent_instance_id",
+            )
         )
 
         last_parent_subquery = get_history_value_subquery(Varhaiskasvatuspaatos, "lapsi_id", self.datetime_lte)
         previous_parent_subquery = get_history_value_subquery(Varhaiskasvatuspaatos, "lapsi_id", self.datetime_gt)
         vakapaatos_qs = (
             Varhaiskasvatuspaatos.history.filter(
-                id__in=Subquery(id_qs), lapsi_id=instance.id, history_date__lte=self.datetime_lte
+                id__in={id_pair[1] for id_pair in id_pair_set}, lapsi_id__in=lapsi_id_list, history_date__lte=self.datetime_lte
             )
             .annotate(last_parent_id=last_parent_subquery, previous_parent_id=previous_parent_subquery)
-            .filter(last_parent_id=instance.id)
-            .distinct("id")
-            .order_by("id", "-history_date")
+            .filter(last_parent_id=F("lapsi_id"))
+            .distinct("lapsi_id", "id")
+            .order_by("lapsi_id", "id", "-history_date")
+        )
+        self.set_prefetched_nested(
+            "varhaiskasvatuspaatokset", TkVakapaatosSerializer, _group_instances(vakapaatos_qs, "lapsi_id", id_pair_set)
         )
-        return TkVakapaatosSerializer(vakapaatos_qs, many=True, context=self.context).data
 
-    @swagger_serializer_method(serializer_or_field=TkHuoltajuussuhdeSerializer)
-    def get_huoltajat(self, instance):
-        id_list = list(
+    def _prefetch_huoltajat(self, lapsi_id_list):
+        id_pair_set = set(
             get_related_object_changed_id_qs(
                 Lapsi.get_name(),
                 self.datetime_gt,
                 self.datetime_lte,
                 return_value="trigger_instance_id",
-                additional_filters=Q(instance_id=instance.id) & Q(trigger_model_name=Huoltajuussuhde.get_name()),
+                additional_filters=Q(instance_id__in=lapsi_id_list) & Q(trigger_model_name=Huoltajuussuhde.get_name()),
+                partition_field="instance_id",
             )
-        ) or [-1]
+        )
 
         # Get a list of Huoltajuussuhde objects that have been modified, or a related Henkilo object has been modified
         # during the time window
         # We need to join historical tables so raw SQL query is simpler (to get henkilo_id)
         huoltajuussuhde_qs = Huoltajuussuhde.history.raw(
             """
-            SELECT DISTINCT ON (hhs.id) hhs.*, hh.henkilo_id as henkilo_id
+            SELECT DISTINCT ON (hhs.lapsi_id, hhs.id) hhs.*, hh.henkilo_id as henkilo_id
             FROM varda_historicalhuoltajuussuhde hhs
             LEFT JOIN varda_historicalhuoltaja hh ON hh.id = hhs.huoltaja_id
-            WHERE hhs.lapsi_id = %s AND hhs.id = ANY(%s) AND hhs.history_date <= %s
-            ORDER BY hhs.id, hhs.history_date DESC;
+            WHERE hhs.lapsi_id = ANY(%s) AND hhs.id = ANY(%s) AND hhs.history_date <= %s
+            ORDER BY hhs.lapsi_id, hhs.id, hhs.history_date DESC;
         """,
-            [instance.id, id_list, self.datetime_lte],
+            [lapsi_id_list, [id_pair[1] for id_pair in id_pair_set] or [-1], self.datetime_lte],
+        )
+        self.set_prefetched_nested(
+            "huoltajat", TkHuoltajuussuhdeSerializer, _group_instances(huoltajuussuhde_qs, "lapsi_id", id_pair_set)
         )
-        return TkHuoltajuussuhdeSerializer(huoltajuussuhde_qs, many=True, context=self.context).data
 
-    @swagger_serializer_method(serializer_or_field=TkMaksutietoSerializer)
-    def get_maksutiedot(self, instance):
-        id_qs = get_related_object_changed_id_qs(
-            Lapsi.get_name(),
-            self.datetime_gt,
-            self.datetime_lte,
-            return_value="parent_instance_id",
-            additional_filters=Q(instance_id=instance.id) & Q(trigger_model_name=MaksutietoHuoltajuussuhde.get_name()),
+    def _prefetch_maksutiedot(self, lapsi_id_list):
+        id_pair_set = set(
+            get_related_object_changed_id_qs(
+                Lapsi.get_name(),
+                self.datetime_gt,
+                self.datetime_lte,
+                return_value="parent_instance_id",
+                additional_filters=Q(instance_id__in=lapsi_id_list) & Q(trigger_model_name=MaksutietoHuoltajuussuhde.get_name()),
+                partition_field="instance_id",
+            )
         )
 
         last_parent_subquery = Subquery(
@@ -1283,13 +1450,43 @@ class TkVakatiedotSerializer(HistoricalBaseSerializer, serializers.ModelSerializ
             .values("instance_id")
         )
         maksutieto_qs = (
-            Maksutieto.history.filter(id__in=Subquery(id_qs), history_date__lte=self.datetime_lte)
+            Maksutieto.history.filter(id__in={id_pair[1] for id_pair in id_pair_set}, history_date__lte=self.datetime_lte)
             .annotate(last_parent_id=last_parent_subquery, previous_parent_id=previous_parent_subquery)
-            .filter(last_parent_id=instance.id)
+            .filter(last_parent_id__in=lapsi_id_list)
             .distinct("id")
             .order_by("id", "-history_date")
         )
-        return TkMaksutietoSerializer(maksutieto_qs, many=True, context=self.context).data
+        self.set_prefetched_nested(
+            "maksutiedot", TkMaksutietoSerializer, _group_instances(maksutieto_qs, "last_parent_id", id_pair_set)
+        )
+
+    def to_representation(self, instance):
+        henkilo = self.get_prefetched("henkilo", instance).get(instance.henkilo_id)
+        self.secondary_muutos_pvm = getattr(henkilo, "muutos_pvm", None)
+        instance.henkilo_instance = henkilo
+
+        if not instance.paos_kytkin and not instance.vakatoimija_id:
+            instance.vakatoimija_id = self.get_prefetched("vakatoimija_id", instance).get(instance.id)
+
+        lapsi = super().to_representation(instance)
+        return lapsi
+
+    def get_henkilotunnus(self, instance):
+        henkilotunnus = getattr(instance.henkilo_instance, "henkilotunnus", None)
+        henkilo_id = getattr(instance.henkilo_instance, "id", None)
+        return decrypt_henkilotunnus(henkilotunnus, henkilo_id=henkilo_id, raise_error=False)
+
+    @swagger_serializer_method(serializer_or_field=TkVakapaatosSerializer)
+    def get_varhaiskasvatuspaatokset(self, instance):
+        return self.get_prefetched_nested_data("varhaiskasvatuspaatokset", instance)
+
+    @swagger_serializer_method(serializer_or_field=TkHuoltajuussuhdeSerializer)
+    def get_huoltajat(self, instance):
+        return self.get_prefetched_nested_data("huoltajat", instance)
+
+    @swagger_serializer_method(serializer_or_field=TkMaksutietoSerializer)
+    def get_maksutiedot(self, instance):
+        return self.get_prefetched_nested_data("maksutiedot", instance)
 
 
 class TkPidempiPoissaoloSerializer(HistoricalBaseSerializer, serializers.ModelSerializer):
@@ -1340,27 +1537,23 @@ class TkPalvelussuhdeSerializer(HistoricalBaseSerializer, serializers.ModelSeria
             "pidemmat_poissaolot",
         )
 
+    def prefetch_instances(self, instance_list):
+        super().prefetch_instances(instance_list)
+        palvelussuhde_id_list = [instance.id for instance in instance_list]
+        self.set_prefetched_nested_by_parent_field(
+            "tyoskentelypaikat", TkTyoskentelypaikkaSerializer, Tyoskentelypaikka, "palvelussuhde_id", palvelussuhde_id_list
+        )
+        self.set_prefetched_nested_by_parent_field(
+            "pidemmat_poissaolot", TkPidempiPoissaoloSerializer, PidempiPoissaolo, "palvelussuhde_id", palvelussuhde_id_list
+        )
+
     @swagger_serializer_method(serializer_or_field=TkTyoskentelypaikkaSerializer)
     def get_tyoskentelypaikat(self, instance):
-        tyoskentelypaikka_qs = (
-            Tyoskentelypaikka.history.filter(
-                palvelussuhde_id=instance.id, history_date__gt=self.datetime_gt, history_date__lte=self.datetime_lte
-            )
-            .distinct("id")
-            .order_by("id", "-history_date")
-        )
-        return TkTyoskentelypaikkaSerializer(tyoskentelypaikka_qs, many=True, context=self.context).data
+        return self.get_prefetched_nested_data("tyoskentelypaikat", instance)
 
     @swagger_serializer_method(serializer_or_field=TkPidempiPoissaoloSerializer)
     def get_pidemmat_poissaolot(self, instance):
-        pidempi_poissaolo_qs = (
-            PidempiPoissaolo.history.filter(
-                palvelussuhde_id=instance.id, history_date__gt=self.datetime_gt, history_date__lte=self.datetime_lte
-            )
-            .distinct("id")
-            .order_by("id", "-history_date")
-        )
-        return TkPidempiPoissaoloSerializer(pidempi_poissaolo_qs, many=True, context=self.context).data
+        return self.get_prefetched_nested_data("pidemmat_poissaolot", instance)
 
 
 class TkTutkintoSerializer(HistoricalBaseSerializer, serializers.ModelSerializer):
@@ -1389,20 +1582,39 @@ class TkTaydennyskoulutusSerializer(HistoricalBaseSerializer, serializers.ModelS
             "tehtavanimikkeet",
         )
 
-    @swagger_serializer_method(serializer_or_field=serializers.ListField(child=serializers.CharField()))
-    def get_tehtavanimikkeet(self, instance):
-        # Get list of tehtavanimikkeet that are active during the time window
+    def prefetch_instances(self, instance_list, tyontekija_id_list=None):
+        """
+        :param instance_list: list of historical Taydennyskoulutus instances
+        :param tyontekija_id_list: IDs of Tyontekija objects of the page (passed by TkHenkilostotiedotSerializer),
+            by default Tyontekija that is being serialized
+        """
+        super().prefetch_instances(instance_list)
+        if tyontekija_id_list is None:
+            tyontekija_id_list = (self.context["tyontekija_id"],)
+
+        # Get tehtavanimikkeet that are active during the time window for all Tyontekija objects of the page
         # QuerySet may contain duplicates and distinct + annotate is not supported so use set
-        return set(
+        tehtavanimike_qs = (
             TaydennyskoulutusTyontekija.history.values("id")
             .filter(
-                taydennyskoulutus_id=instance.id, tyontekija_id=self.context["tyontekija_id"], history_date__lte=self.datetime_lte
+                taydennyskoulutus_id__in={instance.id for instance in instance_list},
+                tyontekija_id__in=tyontekija_id_list,
+                history_date__lte=self.datetime_lte,
             )
             .annotate(history_type_list=StringAgg("history_type", ","))
             .filter(~(Q(history_type_list__contains="+") & Q(history_type_list__contains="-")))
             .order_by("id")
-            .values_list("tehtavanimike_koodi", flat=True)
+            .values_list("taydennyskoulutus_id", "tyontekija_id", "tehtavanimike_koodi")
         )
+        tehtavanimike_dict = {}
+        for taydennyskoulutus_id, tyontekija_id, tehtavanimike_koodi in tehtavanimike_qs:
+            tehtavanimike_dict.setdefault((taydennyskoulutus_id, tyontekija_id), set()).add(tehtavanimike_koodi)
+        self.prefetched_dict["tehtavanimikkeet"] = tehtavanimike_dict
+
+    @swagger_serializer_method(serializer_or_field=serializers.ListField(child=serializers.CharField()))
+    def get_tehtavanimikkeet(self, instance):
+        tehtavanimike_dict = self.get_prefetched("tehtavanimikkeet", instance)
+        return tehtavanimike_dict.get((instance.id, self.context["tyontekija_id"]), set())
 
 
 class TkHenkilostotiedotSerializer(HistoricalBaseSerializer, serializers.ModelSerializer):
@@ -1436,77 +1648,124 @@ class TkHenkilostotiedotSerializer(HistoricalBaseSerializer, serializers.ModelSe
             "taydennyskoulutukset",
         )
 
-    def to_representation(self, instance):
+    def prefetch_instances(self, instance_list):
+        super().prefetch_instances(instance_list)
+        tyontekija_id_list = [instance.id for instance in instance_list]
+
         # Get henkilo data from history table or actual table (history is incomplete in test environments)
-        henkilo = (
-            Henkilo.history.filter(id=instance.henkilo_id, history_date__lte=self.datetime_lte)
-            .distinct("id")
-            .order_by("id", "-history_date")
-            .first()
+        self.prefetched_dict["henkilo"] = get_history_instances_by_id(
+            Henkilo, [instance.henkilo_id for instance in instance_list], self.datetime_lte, fallback_to_current=True
         )
-        if not henkilo:
-            henkilo = Henkilo.objects.filter(id=instance.henkilo_id).first()
-        instance.henkilo_instance = henkilo
-        self.secondary_muutos_pvm = getattr(henkilo, "muutos_pvm", None)
-        self.context["tyontekija_id"] = instance.id
 
-        return super().to_representation(instance)
+        self._prefetch_tutkinnot(instance_list)
+        self._prefetch_palvelussuhteet(tyontekija_id_list)
+        self._prefetch_taydennyskoulutukset(tyontekija_id_list)
 
-    def get_henkilotunnus(self, instance):
-        henkilotunnus = getattr(instance.henkilo_instance, "henkilotunnus", None)
-        henkilo_id = getattr(instance.henkilo_instance, "id", None)
-        return decrypt_henkilotunnus(henkilotunnus, henkilo_id=henkilo_id, raise_error=False)
-
-    @swagger_serializer_method(serializer_or_field=TkTutkintoSerializer)
-    def get_tutkinnot(self, instance):
+    def _prefetch_tutkinnot(self, instance_list):
         last_parent_subquery = get_history_value_subquery(Tutkinto, "vakajarjestaja_id", self.datetime_lte)
         previous_parent_subquery = get_history_value_subquery(Tutkinto, "vakajarjestaja_id", self.datetime_gt)
         tutkinto_qs = (
             Tutkinto.history.filter(
-                henkilo_id=instance.henkilo_id,
-                vakajarjestaja_id=instance.vakajarjestaja_id,
+                henkilo_id__in={instance.henkilo_id for instance in instance_list},
+                vakajarjestaja_id__in={instance.vakajarjestaja_id for instance in instance_list},
                 history_date__gt=self.datetime_gt,
                 history_date__lte=self.datetime_lte,
             )
             .annotate(last_parent_id=last_parent_subquery, previous_parent_id=previous_parent_subquery)
-            .filter(last_parent_id=instance.vakajarjestaja_id)
-            .distinct("id")
-            .order_by("id", "-history_date")
+            .filter(last_parent_id=F("vakajarjestaja_id"))
+            .distinct("henkilo_id", "vakajarjestaja_id", "id")
+            .order_by("henkilo_id", "vakajarjestaja_id", "id", "-history_date")
+        )
+        self.set_prefetched_nested(
+            "tutkinnot", TkTutkintoSerializer, _group_instances(tutkinto_qs, ("henkilo_id", "vakajarjestaja_id"))
         )
-        return TkTutkintoSerializer(tutkinto_qs, many=True, context=self.context).data
 
-    @swagger_serializer_method(serializer_or_field=TkPalvelussuhdeSerializer)
-    def get_palvelussuhteet(self, instance):
-        id_qs = get_related_object_changed_id_qs(
-            Palvelussuhde.get_name(), self.datetime_gt, self.datetime_lte, additional_filters=Q(parent_instance_id=instance.id)
+    def _prefetch_palvelussuhteet(self, tyontekija_id_list):
+        id_pair_set = set(
+            get_related_object_changed_id_qs(
+                Palvelussuhde.get_name(),
+                self.datetime_gt,
+                self.datetime_lte,
+                additional_filters=Q(parent_instance_id__in=tyontekija_id_list),
+                partition_field="parent_instance_id",
+            )
         )
 
         last_parent_subquery = get_history_value_subquery(Palvelussuhde, "tyontekija_id", self.datetime_lte)
         previous_parent_subquery = get_history_value_subquery(Palvelussuhde, "tyontekija_id", self.datetime_gt)
         palvelussuhde_qs = (
-            Palvelussuhde.history.filter(id__in=Subquery(id_qs), tyontekija_id=instance.id, history_date__lte=self.datetime_lte)
+            Palvelussuhde.history.filter(
+                id__in={id_pair[1] for id_pair in id_pair_set},
+                tyontekija_id__in=tyontekija_id_list,
+                history_date__lte=self.datetime_lte,
+            )
             .annotate(last_parent_id=last_parent_subquery, previous_parent_id=previous_parent_subquery)
-            .filter(last_parent_id=instance.id)
+            .filter(last_parent_id=F("tyontekija_id"))
+            .distinct("tyontekija_id", "id")
+            .order_by("tyontekija_id", "id", "-history_date")
+        )
+        self.set_prefetched_nested(
+            "palvelussuhteet", TkPalvelussuhdeSerializer, _group_instances(palvelussuhde_qs, "tyontekija_id", id_pair_set)
+        )
+
+    def _prefetch_taydennyskoulutukset(self, tyontekija_id_list):
+        id_pair_set = set(
+            get_related_object_changed_id_qs(
+                Tyontekija.get_name(),
+                self.datetime_gt,
+                self.datetime_lte,
+                return_value="parent_instance_id",
+                additional_filters=Q(instance_id__in=tyontekija_id_list)
+                & Q(trigger_model_name=TaydennyskoulutusTyontekija.get_name()),
+                partition_field="instance_id",
+            )
+        )
+        taydennyskoulutus_dict = {
+            taydennyskoulutus.id: taydennyskoulutus
+            for taydennyskoulutus in Taydennyskoulutus.history.filter(
+                id__in={id_pair[1] for id_pair in id_pair_set}, history_date__lte=self.datetime_lte
+            )
             .distinct("id")
             .order_by("id", "-history_date")
+        }
+
+        # Same Taydennyskoulutus object can be related to multiple Tyontekija objects
+        instance_dict = {}
+        for tyontekija_id, taydennyskoulutus_id in sorted(id_pair_set):
+            if taydennyskoulutus := taydennyskoulutus_dict.get(taydennyskoulutus_id):
+                instance_dict.setdefault(tyontekija_id, []).append(taydennyskoulutus)
+
+        # TkTaydennyskoulutusSerializer gets tehtavanimikkeet for these Tyontekija objects
+        self.set_prefetched_nested(
+            "taydennyskoulutukset", TkTaydennyskoulutusSerializer, instance_dict, tyontekija_id_list=tyontekija_id_list
+        )
+
+    def to_representation(self, instance):
+        henkilo = self.get_prefetched("henkilo", instance).get(instance.henkilo_id)
+        instance.henkilo_instance = henkilo
+        self.secondary_muutos_pvm = getattr(henkilo, "muutos_pvm", None)
+        self.context["tyontekija_id"] = instance.id
+
+        return super().to_representation(instance)
+
+    def get_henkilotunnus(self, instance):
+        henkilotunnus = getattr(instance.henkilo_instance, "henkilotunnus", None)
+        henkilo_id = getattr(instance.henkilo_instance, "id", None)
+        return decrypt_henkilotunnus(henkilotunnus, henkilo_id=henkilo_id, raise_error=False)
+
+    @swagger_serializer_method(serializer_or_field=TkTutkintoSerializer)
+    def get_tutkinnot(self, instance):
+        return self.get_prefetched_nested_data(
+            "tutkinnot", instance, parent_key=(instance.henkilo_id, instance.vakajarjestaja_id)
         )
-        return TkPalvelussuhdeSerializer(palvelussuhde_qs, many=True, context=self.context).data
+
+    @swagger_serializer_method(serializer_or_field=TkPalvelussuhdeSerializer)
+    def get_palvelussuhteet(self, instance):
+        return self.get_prefetched_nested_data("palvelussuhteet", instance)
 
     @swagger_serializer_method(serializer_or_field=TkTaydennyskoulutusSerializer)
     def get_taydennyskoulutukset(self, instance):
-        id_qs = get_related_object_changed_id_qs(
-            Tyontekija.get_name(),
-            self.datetime_gt,
-            self.datetime_lte,
-            return_value="parent_instance_id",
-            additional_filters=Q(instance_id=instance.id) & Q(trigger_model_name=TaydennyskoulutusTyontekija.get_name()),
-        )
-        taydennyskoulutus_qs = (
-            Taydennyskoulutus.history.filter(id__in=Subquery(id_qs), history_date__lte=self.datetime_lte)
-            .distinct("id")
-            .order_by("id", "-history_date")
-        )
-        return TkTaydennyskoulutusSerializer(taydennyskoulutus_qs, many=True, context=self.context).data
+        return self.get_prefetched_nested_data("taydennyskoulutukset", instance)
 
 
 class ValssiOrganisaatioSerializer(HistoricalBaseSerializer, serializers.ModelSerializer):
@@ -8,9 +8,7 @@ from django.conf import settings
 from django.contrib.auth.models import Group, User
 from django.core.management import call_command
 from django.db import connection, transaction
-from django.db.models import Case, Count, DateField, F, Func, Max, Q, Value, When, OuterRef, Exists
-
-from django.db.models.functions import Cast
+from django.db.models import Count, F, Func, Max, Q, Value, OuterRef, Exists
 from django.utils import timezone
 from guardian.models import GroupObjectPermission, UserObjectPermission
 from guardian.shortcuts import get_objects_for_group
@@ -22,7 +20,7 @@ from varda import organisaatiopalvelu
 from varda import permission_groups
 from varda import permissions
 from varda.audit_log import audit_log
-from varda.cache import delete_paattymis_pvm_cache, set_paattymis_pvm_cache
+from varda.cache import delete_koodisto_index, delete_paattymis_pvm_cache, set_paattymis_pvm_cache
 from varda.clients.oppijanumerorekisteri_client import fetch_henkilo_data_for_oid_list, get_henkilo_by_henkilotunnus
 from varda.constants import SUCCESSFUL_STATUS_CODE_LIST
 from varda.custom_celery import custom_shared_task
@@ -31,6 +29,7 @@ from varda.enums.data_category import DataCategory
 from varda.enums.koodistot import Koodistot
 from varda.enums.lokalisointi import Lokalisointi
 from varda.enums.reporting import ReportStatus
+from varda.error_report import is_error_report_full_update_needed, update_error_report_table
 from varda.excel_export import delete_excel_reports_earlier_than
 from varda.migrations.testing.setup import create_onr_lapsi_huoltajat, get_onr_lapset
 from varda.misc import (
@@ -40,7 +39,13 @@ from varda.misc import (
     memory_efficient_queryset_iterator,
     get_person_count_per_kunta_dict,
 )
-from varda.misc_operations import set_paattymis_pvm_for_vakajarjestaja_data
+from varda.misc_operations import (
+    bulk_create_objects,
+    bulk_delete_objects,
+    bulk_update_objects,
+    rebuild_history_interval_table,
+    set_paattymis_pvm_for_vakajarjestaja_data,
+)
 from varda.models import (
     Aikaleima,
     BatchError,
@@ -64,12 +69,12 @@ from varda.models import (
     Z4_CasKayttoOikeudet,
     Z5_AuditLog,
     Z6_LastRequest,
-    Z6_RequestCount,
     Z6_RequestLog,
-    Z6_RequestSummary,
+    Z13_HistoryInterval,
 )
 from varda.permission_groups import get_oph_yllapitaja_group_name
 from varda.permissions import reassign_all_lapsi_permissions, assign_lapsi_permissions
+from varda.request_logging import save_request_log_buffer
 from varda.viestintapalvelu import (
     send_no_paakayttaja_message,
     send_no_transfers_message,
@@ -163,6 +168,19 @@ def update_henkilo_data_by_oid(henkilo_oid, henkilo_id, is_fetch_huoltajat=False
         oppijanumerorekisteri.update_huoltajuussuhde(henkilo_oid)
 
 
+@custom_shared_task()
+def update_henkilo_data_by_id_list_task(henkilo_id_list, is_fetch_huoltajat=False):
+    """
+    Updates henkilo data of a batch of henkilot from oppijanumerorekisteri
+    :param henkilo_id_list: list of Henkilo IDs
+    :param is_fetch_huoltajat: also update huoltajuussuhteet of henkilot
+    """
+    oppijanumerorekisteri.update_henkilo_data_by_id_list(henkilo_id_list)
+    if is_fetch_huoltajat:
+        henkilo_oid_list = Henkilo.objects.filter(id__in=henkilo_id_list).values_list("henkilo_oid", flat=True)
+        oppijanumerorekisteri.update_huoltajuussuhde_list(list(henkilo_oid_list))
+
+
 @custom_shared_task(single_instance=True)
 def update_huoltajasuhteet_task():
     """
@@ -225,6 +243,8 @@ def update_koodistot_task():
 
     koodistopalvelu.update_koodistot()
     lokalisointipalvelu.update_lokalisointi_data()
+    # Invalidate koodisto index once after all codes have been synced (removed koodistot and lokalisointi codes)
+    delete_koodisto_index()
 
 
 @custom_shared_task(single_instance=True)
@@ -343,47 +363,68 @@ def delete_henkilot_without_relations_task():
     cleanup_Z10_KelaVarhaiskasvatussuhde_task.delay()
 
 
+@custom_shared_task(single_instance=True)
+def save_request_log_buffer_task():
+    """
+    Saves request logs buffered in Redis (request_logging.buffer_request_log) in batches. To be run periodically,
+    e.g. every minute.
+    """
+    count = save_request_log_buffer()
+    if count:
+        logger.info(f"Saved {count} Z6_RequestLog objects")
+
+
 @custom_shared_task(single_instance=True)
 def update_last_request_table_task(init=False):
     """
     Updates Z6_LastRequest table by going through existing Z6_RequestLog objects. By default goes through requests
-    from the last 24 hours.
+    from the last 24 hours. Latest timestamps are calculated and Z6_LastRequest objects are updated or created with
+    a single query.
 
     :param init: True if table is initialized and all Z6_RequestLog objects are considered
     """
-    timestamp_filter = Q() if init else Q(timestamp__gte=timezone.now() - datetime.timedelta(days=1))
-    successful_options = [
-        (Q(response_code__in=SUCCESSFUL_STATUS_CODE_LIST), True),
-        (~Q(response_code__in=SUCCESSFUL_STATUS_CODE_LIST), False),
-    ]
-
-    for response_code_filter, is_successful in successful_options:
-        request_log_qs = (
-            Z6_RequestLog.objects.filter(timestamp_filter & response_code_filter)
-            .distinct("user", "vakajarjestaja", "lahdejarjestelma", "data_category")
-            .order_by("user", "vakajarjestaja", "lahdejarjestelma", "data_category", "-timestamp")
-            .values("user", "vakajarjestaja", "lahdejarjestelma", "data_category", "timestamp")
+    start_timestamp = timezone.now()
+    timestamp_filter = sql.SQL("") if init else sql.SQL("WHERE timestamp >= %(timestamp_gte)s")
+    params = {
+        "timestamp_gte": start_timestamp - datetime.timedelta(days=1),
+        "successful_code_list": SUCCESSFUL_STATUS_CODE_LIST,
+    }
+
+    # Fields can be NULL, so conflict target is the unique index of COALESCE'd values
+    # (last_request_user_vakaj_lahdej_data_categ_coalesce_unique), expressions must match the index
+    # PostgreSQL specific functionality (FILTER, ON CONFLICT)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            sql.SQL(
+                """
+                INSERT INTO varda_z6_lastrequest AS lr (user_id, vakajarjestaja_id, lahdejarjestelma, data_category,
+                    last_successful, last_unsuccessful)
+                SELECT user_id, vakajarjestaja_id, lahdejarjestelma, data_category,
+                    MAX(timestamp) FILTER (WHERE response_code = ANY(%(successful_code_list)s)),
+                    MAX(timestamp) FILTER (WHERE NOT response_code = ANY(%(successful_code_list)s))
+                FROM varda_z6_requestlog
+                {timestamp_filter}
+                GROUP BY user_id, vakajarjestaja_id, lahdejarjestelma, data_category
+                ON CONFLICT ((COALESCE(user_id, -1)), (COALESCE(vakajarjestaja_id, -1)), (COALESCE(lahdejarjestelma, '')),
+                    (COALESCE(data_category, '')))
+                DO UPDATE SET last_successful = COALESCE(EXCLUDED.last_successful, lr.last_successful),
+                    last_unsuccessful = COALESCE(EXCLUDED.last_unsuccessful, lr.last_unsuccessful);
+            """
+            ).format(timestamp_filter=timestamp_filter),
+            params,
         )
+        upserted_count = cursor.rowcount
 
-        for request_log in request_log_qs:
-            last_request_defaults = (
-                {"last_successful": request_log["timestamp"]}
-                if is_successful
-                else {"last_unsuccessful": request_log["timestamp"]}
-            )
-            Z6_LastRequest.objects.update_or_create(
-                user_id=request_log["user"],
-                vakajarjestaja_id=request_log["vakajarjestaja"],
-                lahdejarjestelma=request_log["lahdejarjestelma"],
-                data_category=request_log["data_category"],
-                defaults=last_request_defaults,
-            )
+    duration = (timezone.now() - start_timestamp).total_seconds()
+    logger.info(f"Updated Z6_LastRequest table, init: {init}, updated or created: {upserted_count}, duration: {duration:.2f}s")
 
 
 @custom_shared_task(single_instance=True)
 def update_request_summary_table_task():
     """
-    Updates Z6_RequestSummary table by going through existing Z6_RequestLog objects.
+    Updates Z6_RequestSummary table by going through existing Z6_RequestLog objects. Summaries are updated day by day
+    with set-based queries, and Aikaleima is updated after each day so that the task can continue from the last
+    unfinished day.
     """
     now = timezone.now()
     aikaleima, created_aikaleima = Aikaleima.objects.get_or_create(
@@ -394,89 +435,102 @@ def update_request_summary_table_task():
         start_timestamp = now - datetime.timedelta(days=100)
     else:
         start_timestamp = aikaleima.aikaleima
-    current_date = start_timestamp.date()
-    today = now.date()
-
-    # Format: [[field, filters], [field, filters],]
-    group_by_list = [
-        ["user_id", {"user__isnull": False}],
-        ["vakajarjestaja_id", {"vakajarjestaja__isnull": False}],
-        ["lahdejarjestelma", {"lahdejarjestelma__isnull": False}],
-        ["request_url_simple", {}],
-    ]
-    # Start going through Z6_RequestLog instances day by day until we reach today
+    current_date = timezone.localdate(start_timestamp)
+    today = timezone.localdate(now)
+
     # Summaries are always updated for past days
     while current_date < today:
-        # Go through group_by rules, currently summaries are grouped by user, vakajarjestaja, lahdejarjestelma and URL
-        for group_by_value in group_by_list:
-            value_field = group_by_value[0]
-            filters = group_by_value[1]
-
-            values = ["request_method", "response_code"]
-            if value_field != "request_url_simple":
-                values.append(value_field)
-
-            # QuerySet that groups Z6_RequestLog instances by defined fields and a simplified URL
-            # e.g. /api/v1/varhaiskasvatuspaatokset/123/ -> /api/v1/varhaiskasvatuspaatokset/*/
-            # PostgreSQL specific functionality (regexp_replace)
-            request_log_qs = (
-                Z6_RequestLog.objects.values(*values, "timestamp__date")
-                .annotate(
-                    request_url_simple=Case(
-                        When(
-                            request_url__regex=r"^.*\/(\d*(:.*)?|[\d.]*)\/.*$",
-                            then=Func(
-                                F("request_url"), Value(r"\/(\d*(:.*)?|[\d.]*)\/"), Value("/*/"), function="regexp_replace"
-                            ),
-                        ),
-                        default=F("request_url"),
-                    ),
-                    date=Cast("timestamp", DateField()),
-                    count=Count("id"),
-                )
-                .values(*values, "count", "date", "request_url_simple")
-                .filter(timestamp__date=current_date, **filters)
-                .order_by(value_field)
+        next_date = current_date + datetime.timedelta(days=1)
+        with transaction.atomic():
+            _update_request_summaries_for_date(current_date)
+            # Update Aikaleima instance so that the next run starts from the next day
+            aikaleima.aikaleima = timezone.make_aware(datetime.datetime.combine(next_date, datetime.time.min))
+            aikaleima.save()
+        current_date = next_date
+
+
+def _update_request_summaries_for_date(summary_date):
+    """
+    Creates or updates Z6_RequestSummary objects and replaces related Z6_RequestCount objects of specific day with
+    set-based queries. Summaries are grouped by user, vakajarjestaja, lahdejarjestelma and a simplified URL,
+    e.g. /api/v1/varhaiskasvatuspaatokset/123/ -> /api/v1/varhaiskasvatuspaatokset/*/
+    Each Z6_RequestSummary instance has related Z6_RequestCount instances which provide additional information on
+    requests that succeeded or failed.
+
+    :param summary_date: date of summaries
+    """
+    params = {
+        "url_match_regex": r"^.*\/(\d*(:.*)?|[\d.]*)\/.*$",
+        "url_regex": r"\/(\d*(:.*)?|[\d.]*)\/",
+        "timestamp_gte": timezone.make_aware(datetime.datetime.combine(summary_date, datetime.time.min)),
+        "timestamp_lt": timezone.make_aware(
+            datetime.datetime.combine(summary_date + datetime.timedelta(days=1), datetime.time.min)
+        ),
+        "summary_date": summary_date,
+        "successful_code_list": SUCCESSFUL_STATUS_CODE_LIST,
+    }
+    # Z6_RequestLog instances of the day grouped by defined field and a simplified URL
+    request_log_query = """
+        WITH request_log AS (
+            SELECT {field} AS group_value, request_url_simple, request_method, response_code, count(*) AS count
+            FROM (
+                SELECT user_id, vakajarjestaja_id, lahdejarjestelma, request_method, response_code,
+                    CASE WHEN request_url ~ %(url_match_regex)s
+                        THEN regexp_replace(request_url, %(url_regex)s, '/*/') ELSE request_url END AS request_url_simple
+                FROM varda_z6_requestlog
+                WHERE timestamp >= %(timestamp_gte)s AND timestamp < %(timestamp_lt)s
+            ) request_log_simple
+            WHERE {field} IS NOT NULL
+            GROUP BY 1, 2, 3, 4
+        )
+    """
+
+    # PostgreSQL specific functionality (regexp_replace, FILTER, ON CONFLICT with partial unique index)
+    with connection.cursor() as cursor:
+        for value_field in ("user_id", "vakajarjestaja_id", "lahdejarjestelma", "request_url_simple"):
+            field = sql.Identifier(value_field)
+            cursor.execute(
+                sql.SQL(
+                    request_log_query
+                    + """
+                    INSERT INTO varda_z6_requestsummary ({field}, summary_date, successful_count, unsuccessful_count)
+                    SELECT group_value, %(summary_date)s,
+                        COALESCE(SUM(count) FILTER (WHERE response_code = ANY(%(successful_code_list)s)), 0),
+                        COALESCE(SUM(count) FILTER (WHERE NOT response_code = ANY(%(successful_code_list)s)), 0)
+                    FROM request_log
+                    GROUP BY group_value
+                    ON CONFLICT ({field}, summary_date) WHERE {field} IS NOT NULL
+                    DO UPDATE SET successful_count = EXCLUDED.successful_count,
+                        unsuccessful_count = EXCLUDED.unsuccessful_count;
+                """
+                ).format(field=field),
+                params,
             )
 
-            current_group = None
-            request_summary = None
-            # Start going through grouped Z6_RequestLog instances and create Z6_RequestSummary and Z6_RequestCount
-            # instances
-            for request_log in request_log_qs:
-                if request_log.get(value_field) != current_group:
-                    current_group = request_log.get(value_field)
-                    request_summary, created_summary = Z6_RequestSummary.objects.update_or_create(
-                        summary_date=current_date,
-                        **{value_field: current_group},
-                        defaults={"successful_count": 0, "unsuccessful_count": 0},
-                    )
-                    if not created_summary:
-                        # If summary already existed, delete existing Z6_RequestCount instances
-                        request_summary.request_counts.all().delete()
-
-                # Each Z6_RequestCount instance has related Z6_RequestCount instances which provide additional
-                # information on requests that succeeded or failed
-                Z6_RequestCount.objects.create(
-                    request_summary=request_summary,
-                    request_url_simple=request_log.get("request_url_simple"),
-                    request_method=request_log.get("request_method"),
-                    response_code=request_log.get("response_code"),
-                    count=request_log.get("count"),
-                )
-
-                # Update the _count field of Z6_RequestSummary instance
-                if request_log.get("response_code") in SUCCESSFUL_STATUS_CODE_LIST:
-                    request_summary.successful_count += request_log.get("count")
-                else:
-                    request_summary.unsuccessful_count += request_log.get("count")
-                request_summary.save()
-
-        current_date += datetime.timedelta(days=1)
-
-    # Update Aikaleima instance
-    aikaleima.aikaleima = now
-    aikaleima.save()
+            # Replace existing Z6_RequestCount instances
+            cursor.execute(
+                sql.SQL(
+                    """
+                    DELETE FROM varda_z6_requestcount rc
+                    USING varda_z6_requestsummary rs
+                    WHERE rc.request_summary_id = rs.id AND rs.summary_date = %(summary_date)s AND rs.{field} IS NOT NULL;
+                """
+                ).format(field=field),
+                params,
+            )
+            cursor.execute(
+                sql.SQL(
+                    request_log_query
+                    + """
+                    INSERT INTO varda_z6_requestcount (request_summary_id, request_url_simple, request_method,
+                        response_code, count)
+                    SELECT rs.id, rl.request_url_simple, rl.request_method, rl.response_code, rl.count
+                    FROM request_log rl
+                    JOIN varda_z6_requestsummary rs ON rs.{field} = rl.group_value AND rs.summary_date = %(summary_date)s;
+                """
+                ).format(field=field),
+                params,
+            )
 
 
 @custom_shared_task()
@@ -690,6 +744,32 @@ def vacuum_database_task(table_name=None):
             cursor.execute(sql.SQL("VACUUM ANALYZE {};").format(sql.Identifier(table)))
 
 
+@custom_shared_task(single_instance=True)
+def rebuild_history_interval_table_task(model_name=None):
+    """
+    Rebuilds Z13_HistoryInterval table from history tables, e.g. if historical rows have been modified directly in db.
+    Z13_HistoryInterval is kept up to date when historical records are created.
+
+    :param model_name: name of the model (e.g. lapsi), by default all models in Z13_HistoryInterval.MODEL_NAME_LIST
+    """
+    model_name_list = [model_name] if model_name else Z13_HistoryInterval.MODEL_NAME_LIST
+    for model_name_item in model_name_list:
+        history_model = apps.get_model("varda", f"historical{model_name_item}")
+        rebuild_history_interval_table(model_name_item, history_model._meta.db_table)
+
+
+@custom_shared_task(single_instance=True)
+def update_error_report_table_task(is_full_update=False):
+    """
+    Updates Z14_ErrorReportError table, by default only for objects that have changed since the last update. Error
+    report rules depend on the current date, so errors of all objects are updated on the first run of the day.
+    This task is run regularly via a periodic task scheduler.
+
+    :param is_full_update: True if errors of all objects are updated
+    """
+    update_error_report_table(is_full_update=is_full_update or is_error_report_full_update_needed())
+
+
 @custom_shared_task(single_instance=True)
 def update_message_targets_and_paakayttaja_status_task():
     update_message_targets_and_paakayttaja_status()
@@ -759,21 +839,29 @@ def set_toimipaikkas_inactive_painotus_kytkin_to_false():
     set varda_toimipaikka [toiminnallinen/kieli]painotus_kytkin to false
     if toimipaikka is not found in varda_[toiminnallinen/kieli]painotus table
     """
-    # Update Toimipaikka toiminnallinenpainotus_kytkin
-    toiminnallinenpainotus_toimipaikka_ids = ToiminnallinenPainotus.objects.values_list("toimipaikka__id", flat=True).distinct()
-    update_count_toiminnallinenpainotus = (
-        Toimipaikka.objects.filter(toiminnallinenpainotus_kytkin=True)
-        .exclude(pk__in=toiminnallinenpainotus_toimipaikka_ids)
-        .update(toiminnallinenpainotus_kytkin=False, muutos_pvm=timezone.now())
-    )
-
-    # Update Toimipaikka kielipainotus_kytkin
-    kielipainotus_toimipaikka_ids = KieliPainotus.objects.values_list("toimipaikka__id", flat=True).distinct()
-    update_count_kielipainotus = (
-        Toimipaikka.objects.filter(kielipainotus_kytkin=True)
-        .exclude(pk__in=kielipainotus_toimipaikka_ids)
-        .update(kielipainotus_kytkin=False, muutos_pvm=timezone.now())
-    )
+    toiminnallinenpainotus_toimipaikka_id_set = set(ToiminnallinenPainotus.objects.values_list("toimipaikka_id", flat=True))
+    kielipainotus_toimipaikka_id_set = set(KieliPainotus.objects.values_list("toimipaikka_id", flat=True))
+
+    toimipaikka_list = []
+    update_count_toiminnallinenpainotus = 0
+    update_count_kielipainotus = 0
+    for toimipaikka in Toimipaikka.objects.filter(Q(toiminnallinenpainotus_kytkin=True) | Q(kielipainotus_kytkin=True)):
+        is_updated = False
+        # Update Toimipaikka toiminnallinenpainotus_kytkin
+        if toimipaikka.toiminnallinenpainotus_kytkin and toimipaikka.id not in toiminnallinenpainotus_toimipaikka_id_set:
+            toimipaikka.toiminnallinenpainotus_kytkin = False
+            update_count_toiminnallinenpainotus += 1
+            is_updated = True
+        # Update Toimipaikka kielipainotus_kytkin
+        if toimipaikka.kielipainotus_kytkin and toimipaikka.id not in kielipainotus_toimipaikka_id_set:
+            toimipaikka.kielipainotus_kytkin = False
+            update_count_kielipainotus += 1
+            is_updated = True
+        if is_updated:
+            toimipaikka_list.append(toimipaikka)
+
+    # Historical records and Z9_RelatedObjectChanged objects are created in bulk
+    bulk_update_objects(toimipaikka_list, ["toiminnallinenpainotus_kytkin", "kielipainotus_kytkin"])
 
     if update_count_toiminnallinenpainotus or update_count_kielipainotus:
         logger.info(
@@ -939,10 +1027,10 @@ def remove_inactive_tutkintos(timeout_minutes=5):
         tutkinto_ids_to_delete = list(tutkinto_ids_to_delete)
 
         # Split the list of id:s into batches
-        BATCH_SIZE = 20
+        BATCH_SIZE = 1000
         for i in range(0, len(tutkinto_ids_to_delete), BATCH_SIZE):
             batch_ids = tutkinto_ids_to_delete[i : i + BATCH_SIZE]
-            deleted_count, _ = Tutkinto.objects.filter(id__in=batch_ids).delete()
+            deleted_count = bulk_delete_objects(Tutkinto.objects.filter(id__in=batch_ids))
             deleted_count_all += deleted_count
             logger.info(f"Inactive Tutkinto objects batch deleted. tutkinto_koodi={tutkinto_koodi} count={deleted_count}")
 
@@ -1007,7 +1095,7 @@ def add_missing_tukipaatos_paatosmaaras():
 
         tukipaatoses_dict[vakajarjestaja_tilastointipvm][yksityinen_ikaryhma_tuentaso] = tukipaatos
 
-    created_count = 0
+    new_tukipaatos_list = []
     for tukipaatoses_key in tukipaatoses_dict.keys():
         vakajarjestaja_tilastointipvm_dict = tukipaatoses_dict.get(tukipaatoses_key)
 
@@ -1020,18 +1108,20 @@ def add_missing_tukipaatos_paatosmaaras():
                     yksityinen_ikaryhma_tuentaso = f"{yksityinen}-{ikaryhma_code}-{tuentaso_code}"
                     # Add missing Tukipaatos
                     if yksityinen_ikaryhma_tuentaso not in vakajarjestaja_tilastointipvm_dict:
-                        Tukipaatos.objects.create(
-                            vakajarjestaja=tukipaatos.vakajarjestaja,
-                            paatosmaara=0,
-                            yksityinen_jarjestaja=yksityinen,
-                            ikaryhma_koodi=ikaryhma_code,
-                            tuentaso_koodi=tuentaso_code,
-                            tilastointi_pvm=tukipaatos.tilastointi_pvm,
-                            lahdejarjestelma=tukipaatos.lahdejarjestelma,
+                        new_tukipaatos_list.append(
+                            Tukipaatos(
+                                vakajarjestaja=tukipaatos.vakajarjestaja,
+                                paatosmaara=0,
+                                yksityinen_jarjestaja=yksityinen,
+                                ikaryhma_koodi=ikaryhma_code,
+                                tuentaso_koodi=tuentaso_code,
+                                tilastointi_pvm=tukipaatos.tilastointi_pvm,
+                                lahdejarjestelma=tukipaatos.lahdejarjestelma,
+                            )
                         )
-                        created_count += 1
 
-    logger.info(f"Missing Tukipaatoses created. count={created_count}")
+    bulk_create_objects(new_tukipaatos_list)
+    logger.info(f"Missing Tukipaatoses created. count={len(new_tukipaatos_list)}")
 
 
 @custom_shared_task(single_instance=True)
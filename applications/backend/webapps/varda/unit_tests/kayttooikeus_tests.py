@@ -2,6 +2,7 @@ import json
 
 import responses
 from django.contrib.auth.models import User
+from django.db.models.signals import m2m_changed
 from django.test import TestCase, override_settings
 from rest_framework import status
 
@@ -142,6 +143,18 @@ class TestKayttooikeus(TestCase):
         self.assertEqual(len(results), 1)
         self.assertEqual(results[0]["organisaatio_oid"], "1.2.246.562.10.34683023489")
 
+        # All permission groups are effective in UI Organisaatio list, active permission groups are not modified
+        resp = client.get("/api/ui/vakajarjestajat/")
+        assert_status_code(resp, status.HTTP_200_OK)
+        self.assertCountEqual(
+            [organisaatio_1.organisaatio_oid, organisaatio_2.organisaatio_oid],
+            [organisaatio["organisaatio_oid"] for organisaatio in json.loads(resp.content)],
+        )
+        self.assertListEqual(
+            [name for name in all_group_names if name.endswith("1.2.246.562.10.34683023489")],
+            list(user.groups.values_list("name", flat=True)),
+        )
+
         # Does not exist
         resp = client.post("/api/ui/active-organisaatio/", {"organisaatio": "/api/v1/vakajarjestajat/0/"})
         assert_status_code(resp, status.HTTP_400_BAD_REQUEST)
@@ -167,6 +180,109 @@ class TestKayttooikeus(TestCase):
         self.assertEqual(len(results), 1)
         self.assertEqual(results[0]["organisaatio_oid"], "1.2.246.562.10.93957375488")
 
+        # Change back to Organisaatio that is not active, using hyperlink
+        assert_status_code(
+            client.post("/api/ui/active-organisaatio/", {"organisaatio": f"/api/v1/vakajarjestajat/{organisaatio_1.id}/"}),
+            status.HTTP_200_OK,
+        )
+        self.assertListEqual(
+            [name for name in all_group_names if name.endswith("1.2.246.562.10.34683023489")],
+            list(user.groups.values_list("name", flat=True)),
+        )
+
+    @responses.activate
+    def test_inactive_permission_groups_are_not_added(self):
+        organisaatio_1_oid = "1.2.246.562.10.34683023489"
+        organisaatio_2_oid = "1.2.246.562.10.93957375488"
+        kayttooikeus_json = [
+            {
+                "oidHenkilo": "1.2.246.562.24.10000000001",
+                "username": "tester-no-known-privileges",
+                "kayttajaTyyppi": "VIRKAILIJA",
+                "organisaatiot": [
+                    {
+                        "organisaatioOid": organisaatio_1_oid,
+                        "kayttooikeudet": [{"palvelu": "VARDA", "oikeus": Z4_CasKayttoOikeudet.KATSELIJA}],
+                    },
+                    {
+                        "organisaatioOid": organisaatio_2_oid,
+                        "kayttooikeudet": [{"palvelu": "VARDA", "oikeus": Z4_CasKayttoOikeudet.TALLENTAJA}],
+                    },
+                ],
+            }
+        ]
+        _mock_cas_responses(kayttooikeus_json)
+        user = User.objects.get(username="tester-no-known-privileges")
+
+        added_group_id_list = []
+
+        def _on_groups_changed(action, pk_set, **kwargs):
+            if action == "post_add":
+                added_group_id_list.extend(pk_set)
+
+        m2m_changed.connect(_on_groups_changed, sender=User.groups.through)
+        try:
+            kayttooikeuspalvelu.set_permissions_for_cas_user(user.id)
+        finally:
+            m2m_changed.disconnect(_on_groups_changed, sender=User.groups.through)
+
+        # Groups of the non-active Organisaatio are never added to user.groups, not even temporarily
+        active_group_id_list = list(user.groups.values_list("id", flat=True))
+        self.assertListEqual(
+            [Z4_CasKayttoOikeudet.KATSELIJA + "_" + organisaatio_1_oid], list(user.groups.values_list("name", flat=True))
+        )
+        self.assertCountEqual(active_group_id_list, added_group_id_list)
+        self.assertEqual(user.additional_cas_user_fields.all_groups.count(), 2)
+
+    @responses.activate
+    def test_changed_permissions(self):
+        organisaatio_oid = "1.2.246.562.10.93957375488"
+        kayttooikeus_json = [
+            {
+                "oidHenkilo": "1.2.246.562.24.10000000001",
+                "username": "tester-no-known-privileges",
+                "kayttajaTyyppi": "VIRKAILIJA",
+                "organisaatiot": [
+                    {
+                        "organisaatioOid": organisaatio_oid,
+                        "kayttooikeudet": [
+                            {"palvelu": "VARDA", "oikeus": Z4_CasKayttoOikeudet.TALLENTAJA},
+                            {"palvelu": "VARDA", "oikeus": Z4_CasKayttoOikeudet.HUOLTAJATIEDOT_TALLENTAJA},
+                        ],
+                    }
+                ],
+            }
+        ]
+        _mock_cas_responses(kayttooikeus_json)
+        user = User.objects.get(username="tester-no-known-privileges")
+        kayttooikeuspalvelu.set_permissions_for_cas_user(user.id)
+        tallentaja_id = Z4_CasKayttoOikeudet.objects.get(user=user, kayttooikeus=Z4_CasKayttoOikeudet.TALLENTAJA).id
+
+        # HUOLTAJATIEDOT_TALLENTAJA is removed and PAAKAYTTAJA is added
+        kayttooikeus_json[0]["organisaatiot"][0]["kayttooikeudet"] = [
+            {"palvelu": "VARDA", "oikeus": Z4_CasKayttoOikeudet.TALLENTAJA},
+            {"palvelu": "VARDA", "oikeus": Z4_CasKayttoOikeudet.PAAKAYTTAJA},
+        ]
+        responses.reset()
+        _mock_cas_responses(kayttooikeus_json)
+        kayttooikeuspalvelu.set_permissions_for_cas_user(user.id)
+
+        expected_group_names = [
+            Z4_CasKayttoOikeudet.TALLENTAJA + "_" + organisaatio_oid,
+            Z4_CasKayttoOikeudet.PAAKAYTTAJA + "_" + organisaatio_oid,
+        ]
+        self.assertCountEqual(expected_group_names, user.groups.values_list("name", flat=True))
+        self.assertCountEqual(expected_group_names, user.additional_cas_user_fields.all_groups.values_list("name", flat=True))
+
+        cas_kayttooikeudet = Z4_CasKayttoOikeudet.objects.filter(user=user).values("kayttooikeus", "organisaatio_oid")
+        expected_cas_kayttooikeudet = [
+            {"kayttooikeus": Z4_CasKayttoOikeudet.TALLENTAJA, "organisaatio_oid": organisaatio_oid},
+            {"kayttooikeus": Z4_CasKayttoOikeudet.PAAKAYTTAJA, "organisaatio_oid": organisaatio_oid},
+        ]
+        self.assertCountEqual(cas_kayttooikeudet, expected_cas_kayttooikeudet)
+        # Unchanged permission is not recreated
+        self.assertTrue(Z4_CasKayttoOikeudet.objects.filter(id=tallentaja_id).exists())
+
 
 def _mock_cas_responses(kayttooikeus_json):
     henkilo_oid = kayttooikeus_json[0]["oidHenkilo"]
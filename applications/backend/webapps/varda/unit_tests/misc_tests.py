@@ -3,10 +3,12 @@ import json
 
 import responses
 from django.test import TestCase
+from django.utils import timezone
 from rest_framework import status
 
 from varda import misc
 from varda.misc import is_date_within_timeframe
+from varda.misc_queries import get_history_instances_by_id
 from varda.models import Henkilo
 from varda.unit_tests.test_utils import assert_status_code, assert_validation_error, SetUpTestClient
 
@@ -59,6 +61,74 @@ class MiscTests(TestCase):
         self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
         return resp.json()["id"]
 
+    @responses.activate
+    def test_external_service_session_reuse(self):
+        opintopolku_url = "https://virkailija.testiopintopolku.fi"
+        service_url = f"{opintopolku_url}/session-test-service/test"
+        tgt_url = f"{opintopolku_url}/cas/v1/tickets/TGT-123"
+        responses.add(
+            responses.POST, f"{opintopolku_url}/cas/v1/tickets", status=status.HTTP_201_CREATED, headers={"Location": tgt_url}
+        )
+        responses.add(responses.POST, tgt_url, body="ST-123", status=status.HTTP_200_OK)
+        session_cookie_header = {"Set-Cookie": "JSESSIONID=abc; Path=/"}
+        responses.add(responses.GET, service_url, json={}, status=status.HTTP_200_OK, headers=session_cookie_header)
+        responses.add(responses.GET, service_url, json={}, status=status.HTTP_200_OK)
+        responses.add(responses.GET, service_url, json={}, status=status.HTTP_401_UNAUTHORIZED)
+        responses.add(responses.GET, service_url, json={}, status=status.HTTP_200_OK, headers=session_cookie_header)
+
+        # First request is authenticated with a service ticket
+        self.assertTrue(misc.get_json_from_external_service("session-test-service", "/test")["is_ok"])
+        service_call_list = [call for call in responses.calls if call.request.url == service_url]
+        self.assertIn("CasSecurityTicket", service_call_list[-1].request.headers)
+
+        # Second request reuses session cookie
+        self.assertTrue(misc.get_json_from_external_service("session-test-service", "/test")["is_ok"])
+        service_call_list = [call for call in responses.calls if call.request.url == service_url]
+        self.assertNotIn("CasSecurityTicket", service_call_list[-1].request.headers)
+        self.assertIn("JSESSIONID=abc", service_call_list[-1].request.headers["Cookie"])
+
+        # Expired session is authenticated again with a new service ticket
+        self.assertTrue(misc.get_json_from_external_service("session-test-service", "/test")["is_ok"])
+        service_call_list = [call for call in responses.calls if call.request.url == service_url]
+        self.assertEqual(len(service_call_list), 4)
+        self.assertIn("CasSecurityTicket", service_call_list[-1].request.headers)
+
+        statistics = misc.pop_external_service_statistics()["session-test-service"]
+        self.assertEqual(statistics["count"], 4)
+        self.assertEqual(statistics["error_count"], 1)
+
+    def test_get_history_instances_by_id(self):
+        henkilo_history, henkilo_no_history = Henkilo.objects.order_by("id")[:2]
+        henkilo_history.kutsumanimi = "Historia"
+        henkilo_history.save()
+        datetime_lte = timezone.now()
+        # Changes after datetime_lte are not returned
+        henkilo_history.kutsumanimi = "Muutettu"
+        henkilo_history.save()
+        # History is incomplete in test environments
+        Henkilo.history.filter(id=henkilo_no_history.id).delete()
+        id_list = [henkilo_history.id, henkilo_no_history.id, None]
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_history_instances_by_id(Henkilo, [None], datetime_lte), {})
+
+        with self.assertNumQueries(1):
+            instance_dict = get_history_instances_by_id(Henkilo, id_list, datetime_lte)
+        self.assertEqual(instance_dict.keys(), {henkilo_history.id})
+        self.assertEqual(instance_dict[henkilo_history.id].kutsumanimi, "Historia")
+
+        # Objects missing from history table are fetched from actual table with a single query
+        with self.assertNumQueries(2):
+            instance_dict = get_history_instances_by_id(Henkilo, id_list, datetime_lte, fallback_to_current=True)
+        self.assertEqual(instance_dict.keys(), {henkilo_history.id, henkilo_no_history.id})
+        self.assertEqual(instance_dict[henkilo_history.id].kutsumanimi, "Historia")
+        self.assertIsInstance(instance_dict[henkilo_no_history.id], Henkilo)
+        self.assertEqual(instance_dict[henkilo_no_history.id].henkilo_oid, henkilo_no_history.henkilo_oid)
+
+        # Actual table is not queried if all objects are found from history table
+        with self.assertNumQueries(1):
+            get_history_instances_by_id(Henkilo, [henkilo_history.id], datetime_lte, fallback_to_current=True)
+
     def test_request_path_type(self):
         request_path_string = "/api/v1/toimipaikat/55/"
         request_path_bytes = b"/api/v1/toimipaikat/55/"
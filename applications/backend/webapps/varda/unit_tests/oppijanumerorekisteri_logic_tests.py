@@ -1,15 +1,18 @@
 import re
+import threading
 from datetime import datetime, timezone, timedelta
+from unittest import mock
 
 import responses
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.utils import timezone as tz
 from rest_framework import status
+from rest_framework.exceptions import APIException
 
 from varda import oppijanumerorekisteri
 from varda.enums.batcherror_type import BatchErrorType
 from varda.misc import decrypt_henkilotunnus
-from varda.models import Lapsi, Huoltaja, BatchError, Henkilo
+from varda.models import Lapsi, Huoltaja, Huoltajuussuhde, BatchError, Henkilo
 
 
 class TestOppijanumerorekisteriLogic(TestCase):
@@ -649,3 +652,133 @@ class TestOppijanumerorekisteriLogic(TestCase):
         )
         oppijanumerorekisteri.fetch_and_update_modified_henkilot()
         self.assertEqual(batch_error_qs.first().henkilo_duplicate, henkilo_duplicate)
+
+    @responses.activate
+    def test_update_henkilo_data_by_id_list(self):
+        henkilo_oid = "1.2.246.562.24.47279942650"
+        duplicate_oid = "1.2.246.562.24.58672764848"
+        henkilo = Henkilo.objects.get(henkilo_oid=henkilo_oid)
+        henkilo_duplicate = Henkilo.objects.get(henkilo_oid=duplicate_oid)
+        # Master data of this henkilo cannot be fetched
+        henkilo_error = Henkilo.objects.exclude(henkilo_oid__in=["", henkilo_oid, duplicate_oid]).order_by("id").first()
+        BatchError.objects.create(henkilo=henkilo, type=BatchErrorType.HENKILOTIETO_UPDATE.name, error_message="error")
+        responses.add(
+            responses.POST,
+            "https://virkailija.testiopintopolku.fi/oppijanumerorekisteri-service/henkilo/henkilotByHenkiloOidList",
+            json=[
+                {
+                    "etunimet": "Batch",
+                    "sukunimi": henkilo.sukunimi,
+                    "kutsumanimi": "Batch",
+                    "oidHenkilo": henkilo_oid,
+                    "hetu": decrypt_henkilotunnus(henkilo.henkilotunnus),
+                    "duplicate": False,
+                },
+                {"oidHenkilo": duplicate_oid, "duplicate": True},
+            ],
+            status=status.HTTP_200_OK,
+        )
+        # Master data of duplicate henkilo is fetched separately
+        responses.add(
+            responses.GET,
+            f"https://virkailija.testiopintopolku.fi/oppijanumerorekisteri-service/henkilo/{duplicate_oid}/master",
+            json={
+                "etunimet": "Master",
+                "sukunimi": henkilo_duplicate.sukunimi,
+                "kutsumanimi": "Master",
+                "oidHenkilo": duplicate_oid,
+                "hetu": decrypt_henkilotunnus(henkilo_duplicate.henkilotunnus),
+            },
+            status=status.HTTP_200_OK,
+        )
+
+        responses.add(
+            responses.GET,
+            f"https://virkailija.testiopintopolku.fi/oppijanumerorekisteri-service/henkilo/{henkilo_error.henkilo_oid}/master",
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        )
+
+        oppijanumerorekisteri.update_henkilo_data_by_id_list([henkilo.id, henkilo_duplicate.id, henkilo_error.id])
+
+        henkilo.refresh_from_db()
+        henkilo_duplicate.refresh_from_db()
+        self.assertEqual(henkilo.etunimet, "Batch")
+        self.assertEqual(henkilo_duplicate.etunimet, "Master")
+        master_url_list = [call.request.url for call in responses.calls if call.request.url.endswith("/master")]
+        self.assertEqual(len(master_url_list), 2)
+        self.assertIn(duplicate_oid, master_url_list[0])
+
+        # Errors are handled per henkilo, BatchErrors of updated henkilot are cleared
+        batch_error_qs = BatchError.objects.filter(type=BatchErrorType.HENKILOTIETO_UPDATE.name)
+        self.assertListEqual(list(batch_error_qs.values_list("henkilo_id", flat=True)), [henkilo_error.id])
+
+    @responses.activate
+    def test_update_huoltajuussuhde_list(self):
+        lapsi_oid = "1.2.246.562.24.6815981182311"
+        responses.add(
+            responses.GET,
+            f"https://virkailija.testiopintopolku.fi/oppijanumerorekisteri-service/henkilo/{lapsi_oid}/huoltajat",
+            json=[{"etunimet": "Arpa", "sukunimi": "Kuutio", "kutsumanimi": "Arpa", "oidHenkilo": "1.2.3.4.5"}],
+            status=status.HTTP_200_OK,
+        )
+        # Master data of huoltajat is fetched with a single request
+        responses.add(
+            responses.POST,
+            "https://virkailija.testiopintopolku.fi/oppijanumerorekisteri-service/henkilo/henkilotByHenkiloOidList",
+            json=[
+                {"etunimet": "Arpa", "sukunimi": "Kuutio", "kutsumanimi": "Arpa", "oidHenkilo": "1.2.3.4.5", "duplicate": False}
+            ],
+            status=status.HTTP_200_OK,
+        )
+
+        self.assertEqual(oppijanumerorekisteri.update_huoltajuussuhde_list([lapsi_oid]), 1)
+        huoltajuussuhde_qs = Huoltajuussuhde.objects.filter(lapsi__henkilo__henkilo_oid=lapsi_oid)
+        huoltajuussuhde = huoltajuussuhde_qs.get(huoltaja__henkilo__henkilo_oid="1.2.3.4.5")
+        self.assertTrue(huoltajuussuhde.voimassa_kytkin)
+        self.assertFalse(huoltajuussuhde_qs.exclude(id=huoltajuussuhde.id).filter(voimassa_kytkin=True).exists())
+        self.assertFalse(any(call.request.url.endswith("/master") for call in responses.calls))
+
+        # Unchanged huoltajuussuhteet are not saved again
+        history_count = Huoltajuussuhde.history.filter(lapsi__henkilo__henkilo_oid=lapsi_oid).count()
+        oppijanumerorekisteri.update_huoltajuussuhde_list([lapsi_oid])
+        self.assertEqual(Huoltajuussuhde.history.filter(lapsi__henkilo__henkilo_oid=lapsi_oid).count(), history_count)
+
+    def test_update_huoltajuussuhde_list_clears_batch_error_of_skipped_henkilo(self):
+        # Henkilo is not lapsi (e.g. Lapsi object has been deleted after BatchError was created)
+        henkilo = Henkilo.objects.filter(lapsi=None).exclude(henkilo_oid="").first()
+        BatchError.objects.create(
+            henkilo=henkilo,
+            type=BatchErrorType.LAPSI_HUOLTAJUUSSUHDE_UPDATE.name,
+            retry_time=datetime.now(tz=timezone.utc) - timedelta(days=1),
+            retry_count=1,
+            error_message="error",
+        )
+
+        self.assertEqual(oppijanumerorekisteri.update_huoltajuussuhde_list([henkilo.henkilo_oid]), 0)
+        self.assertFalse(
+            BatchError.objects.filter(henkilo=henkilo, type=BatchErrorType.LAPSI_HUOLTAJUUSSUHDE_UPDATE.name).exists()
+        )
+
+    @override_settings(TESTING=False)
+    def test_get_huoltajat_dict_threads(self):
+        lapsi_oid_list = list(Henkilo.objects.exclude(lapsi=None).exclude(henkilo_oid="").values_list("henkilo_oid", flat=True))
+        error_oid = lapsi_oid_list[0]
+        thread_id_set = set()
+
+        def _mock_get_huoltajat(henkilo_oid):
+            # Does not access the database, connections of other threads do not see data of the test transaction
+            thread_id_set.add(threading.get_ident())
+            if henkilo_oid == error_oid:
+                raise APIException("error")
+            return [{"oidHenkilo": f"{henkilo_oid}.1"}]
+
+        with mock.patch("varda.oppijanumerorekisteri._get_huoltajat_from_onr_by_oid", side_effect=_mock_get_huoltajat):
+            huoltajat_dict = oppijanumerorekisteri._get_huoltajat_dict(lapsi_oid_list)
+
+        # Huoltajat are fetched in worker threads, errors are returned per child
+        self.assertNotIn(threading.get_ident(), thread_id_set)
+        self.assertLessEqual(len(thread_id_set), oppijanumerorekisteri.HUOLTAJAT_MAX_WORKERS)
+        self.assertEqual(huoltajat_dict.keys(), set(lapsi_oid_list))
+        self.assertIsInstance(huoltajat_dict[error_oid], APIException)
+        for lapsi_oid in lapsi_oid_list[1:]:
+            self.assertEqual(huoltajat_dict[lapsi_oid], [{"oidHenkilo": f"{lapsi_oid}.1"}])
@@ -1,4 +1,5 @@
 import json
+from unittest import mock
 
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
@@ -7,7 +8,21 @@ from guardian.models import GroupObjectPermission
 from rest_framework import status
 
 from varda.misc import decrypt_henkilotunnus
-from varda.models import Organisaatio, Toimipaikka, PaosOikeus, Huoltaja, Huoltajuussuhde, Henkilo, Lapsi
+from varda.models import (
+    Organisaatio,
+    Toimipaikka,
+    PaosOikeus,
+    Huoltaja,
+    Huoltajuussuhde,
+    Henkilo,
+    Lapsi,
+    Maksutieto,
+    Varhaiskasvatuspaatos,
+    Varhaiskasvatussuhde,
+    Z4_CasKayttoOikeudet,
+)
+from varda.permissions import reassign_all_lapsi_permissions
+from varda.tasks import change_paos_tallentaja_organization_task
 from varda.unit_tests.test_utils import assert_status_code, SetUpTestClient, assert_validation_error
 
 
@@ -276,11 +291,13 @@ class VardaPaosTests(TestCase):
         assert_status_code(resp, status.HTTP_200_OK)
         data = json.loads(resp.content)
         paos_toiminta = {"oma_organisaatio": data["oma_organisaatio"], "paos_organisaatio": data["paos_organisaatio"]}
-        resp = client.delete("/api/v1/paos-toiminnat/1/")
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = client.delete("/api/v1/paos-toiminnat/1/")
         assert_status_code(resp, status.HTTP_204_NO_CONTENT)
         self.assertFalse(PaosOikeus.objects.get(id=1).voimassa_kytkin)  # link is now disabled
 
-        resp = client.post("/api/v1/paos-toiminnat/", paos_toiminta)
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = client.post("/api/v1/paos-toiminnat/", paos_toiminta)
         assert_status_code(resp, status.HTTP_201_CREATED)
         self.assertTrue(PaosOikeus.objects.get(id=1).voimassa_kytkin)  # link is now enabled again
         self.assertTrue(tester2.has_perm("view_toimipaikka", toimipaikka_5))  # tester2 can see toimipaikka_5
@@ -346,9 +363,11 @@ class VardaPaosTests(TestCase):
             jarjestaja_kunta_organisaatio=jarjestaja_organisaatio, tuottaja_organisaatio=tuottaja_organisaatio
         )
         paos_oikeus_patch = {"tallentaja_organisaatio_oid": tuottaja_organisaatio.organisaatio_oid}
-        assert_status_code(
-            tester_4_client.patch(f"/api/v1/paos-oikeudet/{paos_oikeus.id}/", paos_oikeus_patch), status.HTTP_200_OK
-        )
+        # Permissions are reassigned when transaction is committed
+        with self.captureOnCommitCallbacks(execute=True):
+            assert_status_code(
+                tester_4_client.patch(f"/api/v1/paos-oikeudet/{paos_oikeus.id}/", paos_oikeus_patch), status.HTTP_200_OK
+            )
 
         self._test_paos_get_put(
             "/api/v1/varhaiskasvatussuhteet/4/",
@@ -370,7 +389,8 @@ class VardaPaosTests(TestCase):
         )
 
         # Disable the paos-link between the organizations
-        paos_oikeus.delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            paos_oikeus.delete()
 
         self._test_paos_get_put(
             "/api/v1/varhaiskasvatussuhteet/4/",
@@ -391,6 +411,70 @@ class VardaPaosTests(TestCase):
             ),
         )
 
+    @mock.patch("varda.tasks.change_paos_tallentaja_organization_task.delay")
+    def test_change_paos_tallentaja_task_after_commit(self, mock_task_delay):
+        paos_oikeus = PaosOikeus.objects.get(id=1)
+        organisaatio_id_pair = (paos_oikeus.jarjestaja_kunta_organisaatio_id, paos_oikeus.tuottaja_organisaatio_id)
+
+        for modify_paos_oikeus in (paos_oikeus.save, paos_oikeus.delete):
+            mock_task_delay.reset_mock()
+            with self.captureOnCommitCallbacks() as callbacks:
+                modify_paos_oikeus()
+                # Task is not enqueued before transaction is committed
+                mock_task_delay.assert_not_called()
+            for callback in callbacks:
+                callback()
+            mock_task_delay.assert_called_once_with(*organisaatio_id_pair)
+
+    def test_reassign_paos_permissions(self):
+        jarjestaja_organisaatio = Organisaatio.objects.get(organisaatio_oid="1.2.246.562.10.34683023489")
+        tuottaja_organisaatio = Organisaatio.objects.get(organisaatio_oid="1.2.246.562.10.93957375488")
+        lapsi_qs = Lapsi.objects.filter(oma_organisaatio=jarjestaja_organisaatio, paos_organisaatio=tuottaja_organisaatio)
+        self.assertTrue(lapsi_qs.exists())
+        lapsi_content_type = ContentType.objects.get_for_model(Lapsi)
+        lapsi_permission_qs = GroupObjectPermission.objects.filter(
+            content_type=lapsi_content_type,
+            object_pk__in=[str(lapsi_id) for lapsi_id in lapsi_qs.values_list("id", flat=True)],
+            permission__codename="change_lapsi",
+        )
+        jarjestaja_group_name = f"{Z4_CasKayttoOikeudet.TALLENTAJA}_{jarjestaja_organisaatio.organisaatio_oid}"
+        tuottaja_group_name = f"{Z4_CasKayttoOikeudet.TALLENTAJA}_{tuottaja_organisaatio.organisaatio_oid}"
+        self.assertTrue(lapsi_permission_qs.filter(group__name=jarjestaja_group_name).exists())
+        self.assertFalse(lapsi_permission_qs.filter(group__name=tuottaja_group_name).exists())
+
+        # Change tallentaja_organisaatio without triggering signals, and reassign permissions with set based queries
+        PaosOikeus.objects.filter(
+            jarjestaja_kunta_organisaatio=jarjestaja_organisaatio, tuottaja_organisaatio=tuottaja_organisaatio
+        ).update(tallentaja_organisaatio=tuottaja_organisaatio)
+        change_paos_tallentaja_organization_task(jarjestaja_organisaatio.id, tuottaja_organisaatio.id)
+        self.assertFalse(lapsi_permission_qs.filter(group__name=jarjestaja_group_name).exists())
+        self.assertTrue(lapsi_permission_qs.filter(group__name=tuottaja_group_name).exists())
+
+        # Permissions are the same as when reassigning permissions of each Lapsi separately
+        set_based_permission_list = self._get_paos_lapsi_permission_list(lapsi_qs)
+        for lapsi in lapsi_qs:
+            reassign_all_lapsi_permissions(lapsi)
+        self.assertCountEqual(set_based_permission_list, self._get_paos_lapsi_permission_list(lapsi_qs))
+
+    def _get_paos_lapsi_permission_list(self, lapsi_qs):
+        permission_list = []
+        for model, id_qs in (
+            (Lapsi, lapsi_qs.values_list("id", flat=True)),
+            (Henkilo, lapsi_qs.values_list("henkilo_id", flat=True)),
+            (Varhaiskasvatuspaatos, Varhaiskasvatuspaatos.objects.filter(lapsi__in=lapsi_qs).values_list("id", flat=True)),
+            (
+                Varhaiskasvatussuhde,
+                Varhaiskasvatussuhde.objects.filter(varhaiskasvatuspaatos__lapsi__in=lapsi_qs).values_list("id", flat=True),
+            ),
+            (Maksutieto, Maksutieto.objects.filter(huoltajuussuhteet__lapsi__in=lapsi_qs).values_list("id", flat=True)),
+        ):
+            permission_list.extend(
+                GroupObjectPermission.objects.filter(
+                    content_type=ContentType.objects.get_for_model(model), object_pk__in=[str(object_id) for object_id in id_qs]
+                ).values_list("content_type_id", "object_pk", "group__name", "permission__codename")
+            )
+        return permission_list
+
     def _test_paos_get_put(self, url, json_message, edit_client_list=(), no_edit_client_list=()):
         for edit_client in edit_client_list:
             resp = edit_client.put(url, json_message, content_type="application/json")
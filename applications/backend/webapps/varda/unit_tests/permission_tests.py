@@ -7,14 +7,26 @@ from unittest.mock import patch
 import responses
 from django.conf import settings
 from django.contrib.auth.models import Group, User
+from django.contrib.contenttypes.models import ContentType
 from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from guardian.models import GroupObjectPermission
+from guardian.shortcuts import get_objects_for_user
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
 from varda.misc import decrypt_henkilotunnus
-from varda.models import Z4_CasKayttoOikeudet, Z5_AuditLog, Z6_RequestLog, Organisaatio, Henkilo
+from varda.models import Z4_CasKayttoOikeudet, Z5_AuditLog, Z6_RequestLog, Organisaatio, Henkilo, Lapsi, Toimipaikka
+from varda.permissions import (
+    assign_or_remove_object_permissions,
+    delete_all_user_permissions,
+    get_object_id_qs_user_has_permissions,
+    get_related_organisaatio_id_list_for_user,
+)
+from varda.request_logging import save_request_log_buffer
 from varda.unit_tests.kayttooikeus_palvelukayttaja_tests import mock_cas_palvelukayttaja_responses
 from varda.unit_tests.test_utils import (
     assert_status_code,
@@ -471,6 +483,103 @@ class VardaPermissionsTests(TestCase):
         self.assertEqual(request_log.user.username, "tester")
         self.assertEqual(request_log.request_url, "/api/v1/hae-henkilo/")
 
+    def test_request_log_data_is_masked_before_buffering(self):
+        henkilotunnus = "120456-123C"
+        user = User.objects.get(username="tester")
+        client = SetUpTestClient("tester").client()
+        with patch("varda.request_logging.buffer_request_log") as mock_buffer:
+            client.post("/api/v1/hae-henkilo/", {"henkilotunnus": henkilotunnus})
+
+        # Only the final request log row with hidden henkilotunnus is buffered
+        request_log_data = mock_buffer.call_args.args[0]
+        self.assertNotIn(henkilotunnus, json.dumps(request_log_data))
+        self.assertEqual(request_log_data["user_id"], user.id)
+        self.assertEqual(request_log_data["request_url"], "/api/v1/hae-henkilo/")
+        self.assertIsNotNone(request_log_data["timestamp"])
+
+    def test_request_log_buffer(self):
+        class MockRedisClient:
+            def __init__(self):
+                self.list_dict = {}
+
+            def rpush(self, key, value):
+                self.list_dict.setdefault(key, []).append(value)
+
+            def lrange(self, key, start, end):
+                return self.list_dict.get(key, [])[start : end + 1]
+
+            def ltrim(self, key, start, end):
+                self.list_dict[key] = self.list_dict.get(key, [])[start:]
+
+        mock_redis_client = MockRedisClient()
+        client = SetUpTestClient("tester").client()
+        request_log_count = Z6_RequestLog.objects.count()
+        with (
+            patch("varda.request_logging.get_redis_client", return_value=mock_redis_client),
+            patch("varda.request_logging.REQUEST_LOG_BATCH_SIZE", 2),
+        ):
+            for _ in range(3):
+                resp = client.post("/api/v1/hae-henkilo/", {"henkilo_oid": "1.2.246.562.24.47279942650"})
+            # Rows are buffered and not saved during the request
+            self.assertEqual(Z6_RequestLog.objects.count(), request_log_count)
+
+            # Buffered rows are saved in batches with bulk_create
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(save_request_log_buffer(), 3)
+            self.assertEqual(len([query for query in queries if query["sql"].startswith("INSERT")]), 2)
+            self.assertEqual(Z6_RequestLog.objects.count(), request_log_count + 3)
+            self.assertFalse(any(mock_redis_client.list_dict.values()))
+            self.assertEqual(save_request_log_buffer(), 0)
+
+        # Errors in logging do not fail the request
+        with patch("varda.request_logging.get_redis_client", side_effect=ConnectionError):
+            resp_error = client.post("/api/v1/hae-henkilo/", {"henkilo_oid": "1.2.246.562.24.47279942650"})
+        assert_status_code(resp_error, resp.status_code)
+        self.assertEqual(Z6_RequestLog.objects.count(), request_log_count + 3)
+
+    @override_settings(CACHES=TEST_CACHE_SETTINGS)
+    def test_related_organisaatio_cache(self):
+        cache.clear()
+        user = User.objects.get(username="tester2")
+        organisaatio = Organisaatio.objects.get(organisaatio_oid="1.2.246.562.10.34683023489")
+
+        self.assertEqual(get_related_organisaatio_id_list_for_user(user), [organisaatio.id])
+        # Result is fetched from cache
+        with self.assertNumQueries(0):
+            self.assertEqual(get_related_organisaatio_id_list_for_user(user), [organisaatio.id])
+
+        # Cache is invalidated when users of permission groups change
+        group_list = list(user.groups.all())
+        for group in group_list:
+            group.user_set.remove(user)
+        self.assertEqual(get_related_organisaatio_id_list_for_user(user), [])
+        for group in group_list:
+            group.user_set.add(user)
+        self.assertEqual(get_related_organisaatio_id_list_for_user(user), [organisaatio.id])
+        for group in group_list:
+            group.user_set.clear()
+        self.assertEqual(get_related_organisaatio_id_list_for_user(user), [])
+        user.groups.set(group_list)
+        self.assertEqual(get_related_organisaatio_id_list_for_user(user), [organisaatio.id])
+
+        # Cache is invalidated when permission groups of user are removed
+        delete_all_user_permissions(user)
+        self.assertEqual(get_related_organisaatio_id_list_for_user(user), [])
+
+    def test_object_id_qs_user_has_permissions(self):
+        for username in ("tester", "tester2", "tester5"):
+            user = User.objects.get(username=username)
+            for model in (Organisaatio, Toimipaikka, Lapsi, Henkilo):
+                guardian_id_set = set(
+                    get_objects_for_user(
+                        user, f"view_{model.get_name()}", klass=model, with_superuser=True, accept_global_perms=False
+                    ).values_list("id", flat=True)
+                )
+                id_set = set(
+                    model.objects.filter(id__in=get_object_id_qs_user_has_permissions(user, model)).values_list("id", flat=True)
+                )
+                self.assertEqual(id_set, guardian_id_set)
+
     def test_audit_log_for_toimipaikan_lapset(self):
         client = SetUpTestClient("tester").client()
         client.get("/api/ui/vakajarjestajat/2/lapset/?toimipaikat=1")
@@ -527,6 +636,53 @@ class VardaPermissionsTests(TestCase):
         assert_validation_error(resp_fail, "errors", "PE006", "User does not have permission to perform this action.")
 
     @responses.activate
+    def test_assign_or_remove_object_permissions(self):
+        organisaatio_oid = "1.2.246.562.10.34683023489"
+        tallentaja_group_name = f"{Z4_CasKayttoOikeudet.TALLENTAJA}_{organisaatio_oid}"
+        content_type = ContentType.objects.get_for_model(Lapsi)
+        lapsi_qs = Lapsi.objects.filter(vakatoimija__organisaatio_oid=organisaatio_oid)
+        lapsi_pk_list = [str(lapsi_id) for lapsi_id in lapsi_qs.values_list("id", flat=True)]
+        self.assertGreater(len(lapsi_pk_list), 1)
+        permission_qs = GroupObjectPermission.objects.filter(
+            group__name=tallentaja_group_name, content_type=content_type, object_pk__in=lapsi_pk_list
+        )
+        tallentaja_group = Group.objects.get(name=tallentaja_group_name)
+        codename_list = list(tallentaja_group.permissions.filter(content_type=content_type).values_list("codename", flat=True))
+        view_codename_list = [codename for codename in codename_list if codename.startswith("view_")]
+        self.assertTrue(view_codename_list)
+        self.assertNotEqual(len(view_codename_list), len(codename_list))
+
+        # Remove permissions of all objects
+        assign_or_remove_object_permissions(lapsi_qs, [organisaatio_oid], [Z4_CasKayttoOikeudet.TALLENTAJA])
+        self.assertFalse(permission_qs.exists())
+
+        # Permissions of all objects are assigned with a single insert
+        with CaptureQueriesContext(connection) as context:
+            assign_or_remove_object_permissions(
+                lapsi_qs, [organisaatio_oid], [Z4_CasKayttoOikeudet.TALLENTAJA], view_only=True, assign=True
+            )
+        self.assertEqual(len([query for query in context.captured_queries if query["sql"].startswith("INSERT")]), 1)
+        self.assertCountEqual(
+            permission_qs.values_list("object_pk", "permission__codename"),
+            [(pk, codename) for pk in lapsi_pk_list for codename in view_codename_list],
+        )
+
+        # Existing permissions are not duplicated
+        assign_or_remove_object_permissions(lapsi_qs, [organisaatio_oid], [Z4_CasKayttoOikeudet.TALLENTAJA], assign=True)
+        self.assertCountEqual(
+            permission_qs.values_list("object_pk", "permission__codename"),
+            [(pk, codename) for pk in lapsi_pk_list for codename in codename_list],
+        )
+
+        # Remove only view permissions of a single object
+        lapsi = lapsi_qs.first()
+        assign_or_remove_object_permissions(lapsi, [organisaatio_oid], [Z4_CasKayttoOikeudet.TALLENTAJA], view_only=True)
+        self.assertCountEqual(
+            permission_qs.filter(object_pk=str(lapsi.id)).values_list("permission__codename", flat=True),
+            [codename for codename in codename_list if codename not in view_codename_list],
+        )
+        self.assertEqual(permission_qs.exclude(object_pk=str(lapsi.id)).count(), (len(lapsi_pk_list) - 1) * len(codename_list))
+
     def test_henkilo_lapsi_permissions(self):
         responses.add(
             responses.POST,
@@ -9,6 +9,7 @@ from django.test import TestCase
 from django.utils import timezone
 from rest_framework import status
 
+from varda.enums.data_category import DataCategory
 from varda.models import (
     Lapsi,
     Huoltaja,
@@ -21,7 +22,11 @@ from varda.models import (
     Palvelussuhde,
     Tutkinto,
     Z5_AuditLog,
+    Z6_LastRequest,
+    Z6_RequestLog,
+    Z6_RequestSummary,
     Tukipaatos,
+    Z13_HistoryInterval,
 )
 from varda.permission_groups import get_oph_yllapitaja_group_name
 from varda.tasks import (
@@ -33,6 +38,8 @@ from varda.tasks import (
     remove_inactive_tutkintos,
     add_missing_tukipaatos_paatosmaaras,
     remove_tutkintos_003_if_multiple_tutkinto_koodi,
+    update_last_request_table_task,
+    update_request_summary_table_task,
 )
 from varda.unit_tests.test_utils import SetUpTestClient, assert_status_code
 
@@ -347,6 +354,11 @@ class TaskTests(TestCase):
         # set Tutkintos created time to 91d ago
         datetime_91d_ago = timezone.now() - datetime.timedelta(days=91)
         Tutkinto.objects.filter(henkilo__henkilotunnus_unique_hash=hetu_hash).update(luonti_pvm=datetime_91d_ago)
+        removed_tutkinto_id_list = list(
+            Tutkinto.objects.filter(
+                henkilo__henkilotunnus_unique_hash=hetu_hash, tutkinto_koodi=tutkintokoodi_not_found
+            ).values_list("id", flat=True)
+        )
 
         remove_inactive_tutkintos()
 
@@ -358,6 +370,20 @@ class TaskTests(TestCase):
             Tutkinto.objects.filter(henkilo__henkilotunnus_unique_hash=hetu_hash, tutkinto_koodi=tutkintokoodi_not_found).exists()
         )
 
+        # check historical records and history intervals are created for removed Tutkinto objects
+        self.assertEqual(
+            Tutkinto.history.filter(id__in=removed_tutkinto_id_list, history_type="-").count(), len(removed_tutkinto_id_list)
+        )
+        self.assertEqual(
+            Z13_HistoryInterval.objects.filter(
+                model_name=Tutkinto.get_name(),
+                instance_id__in=removed_tutkinto_id_list,
+                history_type="-",
+                valid_period__upper_inf=True,
+            ).count(),
+            len(removed_tutkinto_id_list),
+        )
+
         # create Tutkinto without relation to any Palvelussuhde
         henkilo = Henkilo.objects.get(henkilo_oid="1.2.246.562.24.47279949999")
         created_tutkinto = Tutkinto.objects.create(henkilo=henkilo, tutkinto_koodi="321901")
@@ -388,6 +414,12 @@ class TaskTests(TestCase):
         self.assertEqual(
             Tukipaatos.objects.filter(vakajarjestaja=vakajarjestaja, tilastointi_pvm=datetime.date(2024, 5, 31)).count(), 30
         )
+        self.assertEqual(
+            Tukipaatos.history.filter(
+                vakajarjestaja=vakajarjestaja, tilastointi_pvm=datetime.date(2024, 5, 31), history_type="+"
+            ).count(),
+            30,
+        )
 
         for yksityinen in (True, False):
             for ikaryhma in ["IR01", "IR02", "IR03", "IR04", "IR05"]:
@@ -458,3 +490,92 @@ class TaskTests(TestCase):
         # Check there is no remowal if 003 tutkinto_koodi is missing
         tutkinnot_org3 = Tutkinto.objects.filter(henkilo=henkilo, vakajarjestaja=org3)
         self.assertEqual(tutkinnot_org3.count(), 2)
+
+    def test_update_last_request_table_task_null_fields(self):
+        user = User.objects.get(username="tester2")
+        now = timezone.now()
+        # Existing row with NULL vakajarjestaja and lahdejarjestelma
+        last_request = Z6_LastRequest.objects.create(
+            user=user,
+            vakajarjestaja=None,
+            lahdejarjestelma=None,
+            data_category=DataCategory.VARHAISKASVATUS.value,
+            last_successful=now - datetime.timedelta(days=10),
+            last_unsuccessful=None,
+        )
+        for response_code, timestamp in ((200, now - datetime.timedelta(hours=2)), (400, now - datetime.timedelta(hours=1))):
+            Z6_RequestLog.objects.create(
+                request_url="/api/v1/lapset/1/",
+                request_method="PUT",
+                response_code=response_code,
+                user=user,
+                vakajarjestaja=None,
+                lahdejarjestelma=None,
+                data_category=DataCategory.VARHAISKASVATUS.value,
+                timestamp=timestamp,
+            )
+
+        # Run task twice to make sure rows are not duplicated
+        update_last_request_table_task()
+        update_last_request_table_task()
+
+        # Existing row is updated (NULL values are considered equal in conflict target)
+        last_request_qs = Z6_LastRequest.objects.filter(
+            user=user,
+            vakajarjestaja__isnull=True,
+            lahdejarjestelma__isnull=True,
+            data_category=DataCategory.VARHAISKASVATUS.value,
+        )
+        self.assertEqual(last_request_qs.count(), 1)
+        last_request_updated = last_request_qs.first()
+        self.assertEqual(last_request_updated.id, last_request.id)
+        self.assertEqual(last_request_updated.last_successful, now - datetime.timedelta(hours=2))
+        self.assertEqual(last_request_updated.last_unsuccessful, now - datetime.timedelta(hours=1))
+
+    def test_update_request_summary_table_task(self):
+        user = User.objects.get(username="tester2")
+        organisaatio = Organisaatio.objects.get(organisaatio_oid="1.2.246.562.10.34683023489")
+        yesterday = timezone.now() - datetime.timedelta(days=1)
+        for request_url, response_code in (
+            ("/api/v1/lapset/1/", 200),
+            ("/api/v1/lapset/2/", 200),
+            ("/api/v1/lapset/3/", 400),
+            ("/api/v1/toimipaikat/", 201),
+        ):
+            request_log = Z6_RequestLog.objects.create(
+                request_url=request_url,
+                request_method="POST" if response_code == 201 else "GET",
+                response_code=response_code,
+                user=user,
+                vakajarjestaja=organisaatio,
+                lahdejarjestelma="1",
+            )
+            # timestamp has auto_now=True
+            Z6_RequestLog.objects.filter(id=request_log.id).update(timestamp=yesterday)
+
+        # Run task twice to make sure summaries are not duplicated
+        update_request_summary_table_task()
+        update_request_summary_table_task()
+
+        summary_date = timezone.localdate(yesterday)
+        for summary_filter in (
+            {"user": user},
+            {"vakajarjestaja": organisaatio},
+            {"lahdejarjestelma": "1"},
+        ):
+            summary = Z6_RequestSummary.objects.get(summary_date=summary_date, **summary_filter)
+            self.assertEqual(summary.successful_count, 3)
+            self.assertEqual(summary.unsuccessful_count, 1)
+            self.assertCountEqual(
+                summary.request_counts.values_list("request_url_simple", "request_method", "response_code", "count"),
+                [
+                    ("/api/v1/lapset/*/", "GET", 200, 2),
+                    ("/api/v1/lapset/*/", "GET", 400, 1),
+                    ("/api/v1/toimipaikat/", "POST", 201, 1),
+                ],
+            )
+
+        summary = Z6_RequestSummary.objects.get(summary_date=summary_date, request_url_simple="/api/v1/lapset/*/")
+        self.assertEqual(summary.successful_count, 2)
+        self.assertEqual(summary.unsuccessful_count, 1)
+        self.assertEqual(summary.request_counts.count(), 2)
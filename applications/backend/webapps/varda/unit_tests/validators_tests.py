@@ -1,9 +1,16 @@
 import datetime
 
+from django.core.cache import cache
 from django.test import TestCase, override_settings
 from rest_framework.exceptions import ValidationError
+
+from varda.cache import delete_koodisto_index
+from varda.enums.koodistot import Koodistot
+from varda.models import Z2_Code
+from varda.unit_tests.test_utils import TEST_CACHE_SETTINGS
 from varda.validators import (
     validate_henkilotunnus,
+    validate_jarjestamismuoto_koodi,
     validate_paivamaara1_before_paivamaara2,
     validate_paivamaara1_after_paivamaara2,
     validate_vaka_date,
@@ -125,3 +132,23 @@ class ValidatorsTests(TestCase):
             validate_vaka_date(datetime.date(2010, 1, 1))
         except ValidationError:
             self.fail("ValidationError was raised unexpectedly!")
+
+    @override_settings(CACHES=TEST_CACHE_SETTINGS)
+    def test_validate_z2_koodi_index(self):
+        cache.clear()
+        # Index is loaded once
+        validate_jarjestamismuoto_koodi("jm01")
+        with self.assertNumQueries(0):
+            validate_jarjestamismuoto_koodi("JM01", datetime.date(2020, 1, 1), datetime.date(2021, 1, 1))
+            with self.assertRaises(ValidationError) as error:
+                validate_jarjestamismuoto_koodi("jm99")
+            self.assertEqual(error.exception.detail[0]["error_code"], "KO003")
+
+        # Index is reloaded when it is invalidated after codes have changed
+        code = Z2_Code.objects.get(koodisto__name=Koodistot.jarjestamismuoto_koodit.value, code_value__iexact="jm01")
+        code.paattymis_pvm = datetime.date(2020, 6, 1)
+        code.save()
+        delete_koodisto_index()
+        with self.assertRaises(ValidationError) as error:
+            validate_jarjestamismuoto_koodi("jm01", datetime.date(2020, 1, 1), datetime.date(2021, 1, 1))
+        self.assertEqual(error.exception.detail["jarjestamismuoto_koodi"][0]["error_code"], "KO005")
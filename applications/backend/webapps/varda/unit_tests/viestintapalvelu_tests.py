@@ -348,7 +348,8 @@ class ViestintapalveluTests(RollbackTestCase):
         henkilo_lapsi = Henkilo.objects.get(henkilo_oid="1.2.246.562.24.4338669286936")
         hetu = henkilo_lapsi.henkilotunnus
         henkilo_lapsi.henkilotunnus = ""
-        henkilo_lapsi.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            henkilo_lapsi.save()
 
         send_puutteelliset_tiedot_message()
         message_count += 1
@@ -357,7 +358,8 @@ class ViestintapalveluTests(RollbackTestCase):
 
         # Reset
         henkilo_lapsi.henkilotunnus = hetu
-        henkilo_lapsi.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            henkilo_lapsi.save()
         send_puutteelliset_tiedot_message()
         self.assertEqual(message_qs.count(), message_count)
         self.assertEqual(len(list(filter(lambda email: organisaatio.nimi in email.body, mail.outbox))), message_count)
@@ -365,7 +367,8 @@ class ViestintapalveluTests(RollbackTestCase):
         # Maksutiedot
         maksutieto = Maksutieto.objects.get(tunniste="testing-maksutieto6")
         maksutieto.asiakasmaksu = MAXIMUM_ASIAKASMAKSU + 5
-        maksutieto.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            maksutieto.save()
 
         send_puutteelliset_tiedot_message()
         message_count += 1
@@ -374,7 +377,8 @@ class ViestintapalveluTests(RollbackTestCase):
 
         # Reset
         maksutieto.asiakasmaksu = 50
-        maksutieto.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            maksutieto.save()
         send_puutteelliset_tiedot_message()
         self.assertEqual(message_qs.count(), message_count)
         self.assertEqual(len(list(filter(lambda email: organisaatio.nimi in email.body, mail.outbox))), message_count)
@@ -383,7 +387,8 @@ class ViestintapalveluTests(RollbackTestCase):
         henkilo_tyontekija = Henkilo.objects.get(henkilo_oid="1.2.246.562.24.4645229637988")
         hetu = henkilo_tyontekija.henkilotunnus
         henkilo_tyontekija.henkilotunnus = ""
-        henkilo_tyontekija.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            henkilo_tyontekija.save()
 
         send_puutteelliset_tiedot_message()
         message_count += 1
@@ -392,7 +397,8 @@ class ViestintapalveluTests(RollbackTestCase):
 
         # Reset
         henkilo_tyontekija.henkilotunnus = hetu
-        henkilo_tyontekija.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            henkilo_tyontekija.save()
         send_puutteelliset_tiedot_message()
         self.assertEqual(message_qs.count(), message_count)
         self.assertEqual(len(list(filter(lambda email: organisaatio.nimi in email.body, mail.outbox))), message_count)
@@ -400,7 +406,8 @@ class ViestintapalveluTests(RollbackTestCase):
         # Toimipaikka varhaiskasvatus
         toimipaikka = Toimipaikka.objects.get(organisaatio_oid="1.2.246.562.10.6727877596658")
         toimipaikka.varhaiskasvatuspaikat = 0
-        toimipaikka.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            toimipaikka.save()
 
         send_puutteelliset_tiedot_message()
         message_count += 1
@@ -409,7 +416,8 @@ class ViestintapalveluTests(RollbackTestCase):
 
         # Reset
         toimipaikka.varhaiskasvatuspaikat = 100
-        toimipaikka.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            toimipaikka.save()
         send_puutteelliset_tiedot_message()
         self.assertEqual(message_qs.count(), message_count)
         self.assertEqual(len(list(filter(lambda email: organisaatio.nimi in email.body, mail.outbox))), message_count)
@@ -417,7 +425,8 @@ class ViestintapalveluTests(RollbackTestCase):
         # Toimipaikka henkilöstö
         tyoskentelypaikka = Tyoskentelypaikka.objects.get(tunniste="testing-tyoskentelypaikka6-1")
         tyoskentelypaikka.toimipaikka = Toimipaikka.objects.get(organisaatio_oid="1.2.246.562.10.2565458382544")
-        tyoskentelypaikka.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            tyoskentelypaikka.save()
 
         send_puutteelliset_tiedot_message()
         message_count += 1
@@ -426,7 +435,8 @@ class ViestintapalveluTests(RollbackTestCase):
 
         # Reset
         tyoskentelypaikka.toimipaikka = toimipaikka
-        tyoskentelypaikka.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            tyoskentelypaikka.save()
         send_puutteelliset_tiedot_message()
         self.assertEqual(message_qs.count(), message_count)
         self.assertEqual(len(list(filter(lambda email: organisaatio.nimi in email.body, mail.outbox))), message_count)
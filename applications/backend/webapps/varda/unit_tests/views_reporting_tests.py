@@ -1,18 +1,34 @@
+import base64
 import datetime
 import json
+import math
+import os
 import time
+from functools import partial
 from unittest import mock
 
 from django.contrib.auth.models import User
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from rest_framework import status
 
+from varda.apps import _commit_with_related_object_changed, flush_related_object_changed_buffers
 from varda.constants import MAXIMUM_ASIAKASMAKSU
+from varda.enums.aikaleima_avain import AikaleimaAvain
 from varda.enums.change_type import ChangeType
+from varda.enums.data_access_type import DataAccessType
 from varda.enums.koodistot import Koodistot
+from varda.enums.reporting import ReportStatus
+from varda.error_report import get_error_count_dict, get_error_report_viewset, update_error_report_table
+from varda.excel_export import ExcelReportGenerator, ExcelReportType, get_excel_local_file_path
 from varda.misc import decrypt_henkilotunnus
+from varda.misc_queries import get_active_filter
+from varda.request_logging import save_data_access_log
 from varda.models import (
+    Aikaleima,
     Henkilo,
     Huoltaja,
     Huoltajuussuhde,
@@ -33,10 +49,19 @@ from varda.models import (
     Organisaatio,
     Varhaiskasvatuspaatos,
     Varhaiskasvatussuhde,
+    ErrorReports,
     Z2_Code,
+    Z8_ExcelReport,
+    Z8_ExcelReportLog,
+    Z9_RelatedObjectChanged,
+    Z12_DataAccessLog,
+    Z13_HistoryInterval,
+    Z14_ErrorReportError,
     Tukipaatos,
 )
 from varda.organisation_transformations import transfer_toimipaikat_to_vakajarjestaja
+from varda.reporting import set_organisaatio_active_errors
+from varda.serializers_reporting import ErrorReportLapsetSerializer
 from varda.unit_tests.test_utils import (
     assert_status_code,
     assert_validation_error,
@@ -209,6 +234,94 @@ class VardaViewsReportingTests(TestCase):
         self.assertEqual(resp_content["count"], existing_count + 1)
         assert_expected_result_in_list_of_dicts_with_slight_time_difference_allowed(expected_result, resp_content["results"])
 
+    def test_reporting_api_kela_etuusmaksatus_aloittaneet_keyset_and_stream(self):
+        client_tester2 = SetUpTestClient("tester2").client()  # tallentaja, huoltaja tallentaja vakajarjestaja 1
+        client_tester_kela = SetUpTestClient("kela_luovutuspalvelu").client()
+        vakapaatos_url = _load_base_data_for_kela_success_testing()
+
+        datetime_gte = _get_iso_datetime_now()
+
+        for alkamis_pvm in ("2021-01-05", "2021-01-06"):
+            data_vakasuhde = {
+                "varhaiskasvatuspaatos": vakapaatos_url,
+                "toimipaikka": "/api/v1/toimipaikat/5/",
+                "alkamis_pvm": alkamis_pvm,
+                "lahdejarjestelma": "1",
+            }
+            resp_vakasuhde = client_tester2.post("/api/v1/varhaiskasvatussuhteet/", data_vakasuhde)
+            assert_status_code(resp_vakasuhde, 201)
+
+        resp_kela_api = client_tester_kela.get(f"{kela_base_url}aloittaneet/?luonti_pvm_gte={datetime_gte}", **kela_headers)
+        assert_status_code(resp_kela_api, 200)
+        page_number_results = json.loads(resp_kela_api.content)["results"]
+        self.assertEqual(len(page_number_results), 2)
+
+        keyset_results = []
+        next_url = f"{kela_base_url}aloittaneet/?luonti_pvm_gte={datetime_gte}&keyset=true&page_size=1"
+        while next_url:
+            resp_kela_api = client_tester_kela.get(next_url, **kela_headers)
+            assert_status_code(resp_kela_api, 200)
+            resp_content = json.loads(resp_kela_api.content)
+            self.assertNotIn("count", resp_content)
+            keyset_results.extend(resp_content["results"])
+            next_url = resp_content["next"]
+        self.assertEqual(keyset_results, page_number_results)
+
+        resp_kela_api = client_tester_kela.get(
+            f"{kela_base_url}aloittaneet/?luonti_pvm_gte={datetime_gte}&stream=true", **kela_headers
+        )
+        assert_status_code(resp_kela_api, 200)
+        self.assertEqual(resp_kela_api["Content-Type"], "application/x-ndjson")
+        stream_content = b"".join(resp_kela_api.streaming_content).decode("utf-8")
+        stream_results = [json.loads(line) for line in stream_content.splitlines()]
+        self.assertEqual(stream_results, page_number_results)
+
+        resp_kela_api = client_tester_kela.get(
+            f"{kela_base_url}aloittaneet/?luonti_pvm_gte={datetime_gte}&cursor=invalid", **kela_headers
+        )
+        assert_status_code(resp_kela_api, 400)
+        assert_validation_error(resp_kela_api, "cursor", "GE028", "Invalid cursor.")
+
+        # Cursor values of wrong type are not passed to the database
+        for invalid_position in (["a", "2021-01-05", 1], [1, "2021-13-05", 1], [1, 20210105, 1], [2**63, "2021-01-05", 1]):
+            invalid_cursor = base64.urlsafe_b64encode(json.dumps(invalid_position).encode("utf-8")).decode("ascii")
+            resp_kela_api = client_tester_kela.get(
+                f"{kela_base_url}aloittaneet/?luonti_pvm_gte={datetime_gte}&cursor={invalid_cursor}", **kela_headers
+            )
+            assert_status_code(resp_kela_api, 400)
+            assert_validation_error(resp_kela_api, "cursor", "GE028", "Invalid cursor.")
+
+    def test_reporting_api_kela_etuusmaksatus_query_count(self):
+        client_tester2 = SetUpTestClient("tester2").client()  # tallentaja, huoltaja tallentaja vakajarjestaja 1
+        client_tester_kela = SetUpTestClient("kela_luovutuspalvelu").client()
+        vakapaatos_url = _load_base_data_for_kela_success_testing()
+
+        datetime_gte = _get_iso_datetime_now()
+
+        for alkamis_pvm in ("2021-01-05", "2021-01-06", "2021-01-07"):
+            data_vakasuhde = {
+                "varhaiskasvatuspaatos": vakapaatos_url,
+                "toimipaikka": "/api/v1/toimipaikat/5/",
+                "alkamis_pvm": alkamis_pvm,
+                "lahdejarjestelma": "1",
+            }
+            resp_vakasuhde = client_tester2.post("/api/v1/varhaiskasvatussuhteet/", data_vakasuhde)
+            assert_status_code(resp_vakasuhde, 201)
+
+        url = f"{kela_base_url}aloittaneet/?luonti_pvm_gte={datetime_gte}"
+        # Populate caches (e.g. permissions of user) so that they do not affect query counts
+        client_tester_kela.get(url, **kela_headers)
+
+        # Related data of all rows of the page is fetched with bulk queries (KelaListSerializer)
+        query_count_list = []
+        for page_size in (1, 3):
+            with CaptureQueriesContext(connection) as queries:
+                resp_kela_api = client_tester_kela.get(f"{url}&page_size={page_size}", **kela_headers)
+            assert_status_code(resp_kela_api, 200)
+            self.assertEqual(len(json.loads(resp_kela_api.content)["results"]), page_size)
+            query_count_list.append(len(queries))
+        self.assertEqual(query_count_list[0], query_count_list[1])
+
     def test_reporting_api_kela_etuusmaksatus_aloittaneet_non_applicable_data(self):
         client_tester2 = SetUpTestClient("tester2").client()  # tallentaja, huoltaja tallentaja vakajarjestaja 1
         client_tester5 = SetUpTestClient("tester5").client()  # tallentaja, huoltaja tallentaja vakajarjestaja 1
@@ -2063,6 +2176,243 @@ class VardaViewsReportingTests(TestCase):
         resp = client.get(url)
         self._verify_error_report_result(resp, ["VJ010"])
 
+    def test_error_report_table(self):
+        vakajarjestaja = Organisaatio.objects.get(organisaatio_oid="1.2.246.562.10.57294396385")
+        toimipaikka = Toimipaikka.objects.get(organisaatio_oid="1.2.246.562.10.2565458382544")
+        organisaatio_filter = {"model_name": Organisaatio.get_name(), "instance_id": vakajarjestaja.id}
+        toimipaikka_filter = {"model_name": Toimipaikka.get_name(), "instance_id": toimipaikka.id}
+
+        update_error_report_table(is_full_update=True)
+        self.assertFalse(Z14_ErrorReportError.objects.filter(**toimipaikka_filter).exists())
+
+        # Errors are updated for changed objects
+        with self.captureOnCommitCallbacks(execute=True):
+            vakajarjestaja.sahkopostiosoite = ""
+            vakajarjestaja.save()
+            toimipaikka.toiminnallinenpainotus_kytkin = True
+            toimipaikka.kielipainotus_kytkin = True
+            toimipaikka.save()
+        update_error_report_table()
+        self.assertCountEqual(
+            Z14_ErrorReportError.objects.filter(**organisaatio_filter).values_list("error_code", flat=True), ["VJ010"]
+        )
+        self.assertCountEqual(
+            Z14_ErrorReportError.objects.filter(**toimipaikka_filter).values_list("error_code", flat=True), ["TO005", "KP005"]
+        )
+        error = Z14_ErrorReportError.objects.get(error_code="TO005", **toimipaikka_filter)
+        self.assertEqual(error.model_id_list, [toimipaikka.id])
+
+        # Persisted errors match evaluated errors
+        def _get_error_data(viewset, queryset):
+            return [
+                {
+                    **instance,
+                    "errors": [{**error, "model_id_list": sorted(error["model_id_list"])} for error in instance["errors"]],
+                }
+                for instance in viewset.get_serializer(queryset, many=True).data
+            ]
+
+        for model in (Lapsi, Tyontekija, Toimipaikka, Organisaatio):
+            viewset = get_error_report_viewset(model)
+            viewset.vakajarjestaja_id = vakajarjestaja.id
+            self.assertEqual(
+                _get_error_data(viewset, viewset.get_persisted_queryset()), _get_error_data(viewset, viewset.get_queryset())
+            )
+
+        # Error counts match evaluated errors
+        for model in (Lapsi, Tyontekija, Toimipaikka):
+            viewset = get_error_report_viewset(model)
+            viewset.vakajarjestaja_id = vakajarjestaja.id
+            error_count_dict = {}
+            for instance in viewset.get_serializer(viewset.get_queryset(), many=True).data:
+                for error in instance["errors"]:
+                    error_code = error["error_code"]
+                    error_count_dict[error_code] = error_count_dict.get(error_code, 0) + len(error["model_id_list"])
+            self.assertEqual(get_error_count_dict(model, [vakajarjestaja.id]).get(vakajarjestaja.id, {}), error_count_dict)
+
+        # Errors of fixed objects are removed
+        toimipaikka.toiminnallinenpainotus_kytkin = False
+        toimipaikka.kielipainotus_kytkin = False
+        with self.captureOnCommitCallbacks(execute=True):
+            toimipaikka.save()
+        update_error_report_table()
+        self.assertFalse(Z14_ErrorReportError.objects.filter(**toimipaikka_filter).exists())
+
+    def test_error_report_table_committed_watermark(self):
+        toimipaikka = Toimipaikka.objects.get(organisaatio_oid="1.2.246.562.10.2565458382544")
+        toimipaikka_filter = {"model_name": Toimipaikka.get_name(), "instance_id": toimipaikka.id}
+
+        update_error_report_table(is_full_update=True)
+        watermark = Aikaleima.objects.get(avain=AikaleimaAvain.ERROR_REPORT_LAST_UPDATE.value).aikaleima
+
+        # Changes after committed watermark (e.g. changes of transactions that are still running) are not processed yet
+        toimipaikka.kielipainotus_kytkin = True
+        with self.captureOnCommitCallbacks(execute=True):
+            toimipaikka.save()
+        with mock.patch("varda.error_report._get_committed_watermark", return_value=watermark):
+            update_error_report_table()
+        self.assertFalse(Z14_ErrorReportError.objects.filter(**toimipaikka_filter).exists())
+
+        # Changes are processed when watermark has passed them
+        update_error_report_table()
+        self.assertCountEqual(
+            Z14_ErrorReportError.objects.filter(**toimipaikka_filter).values_list("error_code", flat=True), ["KP005"]
+        )
+
+    def test_error_report_table_late_related_object_changed(self):
+        toimipaikka = Toimipaikka.objects.get(organisaatio_oid="1.2.246.562.10.2565458382544")
+        toimipaikka_filter = {"model_name": Toimipaikka.get_name(), "instance_id": toimipaikka.id}
+
+        update_error_report_table(is_full_update=True)
+
+        # Change is made but buffered Z9_RelatedObjectChanged objects are not saved yet
+        toimipaikka.kielipainotus_kytkin = True
+        with self.captureOnCommitCallbacks() as callbacks:
+            toimipaikka.save()
+        self.assertTrue(callbacks)
+        update_error_report_table()
+        self.assertFalse(Z14_ErrorReportError.objects.filter(**toimipaikka_filter).exists())
+
+        # changed_timestamp of saved objects is before the last update, but they are processed by inserted_timestamp
+        for callback in callbacks:
+            callback()
+        last_update = Aikaleima.objects.get(avain=AikaleimaAvain.ERROR_REPORT_LAST_UPDATE.value).aikaleima
+        related_object_changed_qs = Z9_RelatedObjectChanged.objects.filter(
+            model_name=Toimipaikka.get_name(), instance_id=toimipaikka.id, inserted_timestamp__gte=last_update
+        )
+        self.assertTrue(related_object_changed_qs.exists())
+        self.assertTrue(related_object_changed_qs.filter(changed_timestamp__lt=last_update).exists())
+        update_error_report_table()
+        self.assertCountEqual(
+            Z14_ErrorReportError.objects.filter(**toimipaikka_filter).values_list("error_code", flat=True), ["KP005"]
+        )
+
+    @mock.patch("varda.reporting.update_pulssi", lambda: None)
+    def test_set_organisaatio_active_errors(self):
+        vakajarjestaja = Organisaatio.objects.get(organisaatio_oid="1.2.246.562.10.57294396385")
+
+        def _has_errors():
+            # Evaluate errors the same way as error report API for a user with all permissions
+            for model in (Lapsi, Tyontekija, Toimipaikka, Organisaatio):
+                viewset = get_error_report_viewset(model)
+                viewset.vakajarjestaja_id = vakajarjestaja.id
+                if len(list(viewset.get_queryset())) > 0:
+                    return True
+            return False
+
+        vakajarjestaja.sahkopostiosoite = "test@example.com"
+        with self.captureOnCommitCallbacks(execute=True):
+            vakajarjestaja.save()
+        set_organisaatio_active_errors()
+        self.assertEqual(ErrorReports.objects.get(organisaatio=vakajarjestaja).active_errors, _has_errors())
+
+        # No sahkopostiosoite
+        vakajarjestaja.sahkopostiosoite = ""
+        with self.captureOnCommitCallbacks(execute=True):
+            vakajarjestaja.save()
+        set_organisaatio_active_errors()
+        self.assertTrue(ErrorReports.objects.get(organisaatio=vakajarjestaja).active_errors)
+
+        vakajarjestaja.sahkopostiosoite = "test@example.com"
+        with self.captureOnCommitCallbacks(execute=True):
+            vakajarjestaja.save()
+        set_organisaatio_active_errors()
+        self.assertEqual(ErrorReports.objects.get(organisaatio=vakajarjestaja).active_errors, _has_errors())
+
+    @mock.patch("varda.excel_export._encrypt_excel_file", lambda file_path, password: True)
+    @mock.patch("varda.excel_export.decrypt_excel_report_password", lambda encrypted_password, report_id: "password")
+    def test_excel_report_puutteelliset_lapsi(self):
+        mock_admin_user("tester2")
+        vakajarjestaja = Organisaatio.objects.get(organisaatio_oid="1.2.246.562.10.57294396385")
+        henkilo_lapsi = Henkilo.objects.get(henkilo_oid="1.2.246.562.24.4338669286936")
+        henkilo_lapsi.henkilotunnus = ""
+        with self.captureOnCommitCallbacks(execute=True):
+            henkilo_lapsi.save()
+
+        report = Z8_ExcelReport.objects.create(
+            user=User.objects.get(username="tester2"),
+            organisaatio=vakajarjestaja,
+            report_type=ExcelReportType.PUUTTEELLISET_LAPSI.value,
+            status=ReportStatus.PENDING.value,
+            language="FI",
+            password="password",
+        )
+        # Objects are serialized one by one instead of serializing the whole queryset at once
+        with mock.patch.object(ErrorReportLapsetSerializer, "many_init", side_effect=AssertionError):
+            ExcelReportGenerator(report).generate()
+        report.refresh_from_db()
+        os.remove(get_excel_local_file_path(report))
+        self.assertEqual(report.status, ReportStatus.FINISHED.value)
+
+        # Report has a row for each error
+        viewset = get_error_report_viewset(Lapsi)
+        viewset.vakajarjestaja_id = vakajarjestaja.id
+        row_count = sum(
+            len(error["model_id_list"])
+            for instance in viewset.get_serializer(viewset.get_persisted_queryset(), many=True).data
+            for error in instance["errors"]
+        )
+        self.assertGreater(row_count, 0)
+        excel_log = Z8_ExcelReportLog.objects.get(report_id=report.id)
+        self.assertEqual(excel_log.number_of_rows, [row_count])
+        self.assertGreater(excel_log.peak_memory_usage, 0)
+
+    @mock.patch("varda.request_logging.DATA_ACCESS_LOG_BATCH_SIZE", 2)
+    @mock.patch("varda.excel_export._encrypt_excel_file", lambda file_path, password: True)
+    @mock.patch("varda.excel_export.decrypt_excel_report_password", lambda encrypted_password, report_id: "password")
+    def test_excel_report_data_access_log(self):
+        user = User.objects.get(username="tester2")
+        vakajarjestaja = Organisaatio.objects.get(organisaatio_oid="1.2.246.562.10.34683023489")
+        report = Z8_ExcelReport.objects.create(
+            user=user,
+            organisaatio=vakajarjestaja,
+            report_type=ExcelReportType.VAKATIEDOT_VOIMASSA.value,
+            status=ReportStatus.PENDING.value,
+            language="FI",
+            password="password",
+        )
+
+        def _save_data_access_log_slow(*args, **kwargs):
+            save_data_access_log(*args, **kwargs)
+            time.sleep(1)
+
+        generator = ExcelReportGenerator(report)
+        with (
+            mock.patch("varda.excel_export.save_data_access_log", side_effect=_save_data_access_log_slow),
+            CaptureQueriesContext(connection) as queries,
+        ):
+            generator.generate()
+        report.refresh_from_db()
+        os.remove(get_excel_local_file_path(report))
+        self.assertEqual(report.status, ReportStatus.FINISHED.value)
+
+        # Report contains the lapset of active Varhaiskasvatussuhde objects of the Organisaatio
+        today = datetime.date.today()
+        vakasuhde_henkilo_set = set(
+            Varhaiskasvatussuhde.objects.filter(
+                (
+                    Q(varhaiskasvatuspaatos__lapsi__vakatoimija=vakajarjestaja)
+                    | Q(varhaiskasvatuspaatos__lapsi__oma_organisaatio=vakajarjestaja)
+                    | Q(varhaiskasvatuspaatos__lapsi__paos_organisaatio=vakajarjestaja)
+                )
+                & get_active_filter(today)
+                & get_active_filter(today, prefix="varhaiskasvatuspaatos")
+            ).values_list("varhaiskasvatuspaatos__lapsi__henkilo_id", "varhaiskasvatuspaatos__lapsi__henkilo__henkilo_oid")
+        )
+        self.assertGreater(len(vakasuhde_henkilo_set), 1)
+        self.assertTrue(vakasuhde_henkilo_set.issubset(generator.henkilo_id_oid_set))
+
+        # A data access log is created for each Henkilo of the report in batches
+        data_access_log_qs = Z12_DataAccessLog.objects.filter(user=user, access_type=DataAccessType.EXCEL.value)
+        self.assertCountEqual(data_access_log_qs.values_list("henkilo_id", "henkilo_oid"), generator.henkilo_id_oid_set)
+        self.assertFalse(data_access_log_qs.exclude(organisaatio=vakajarjestaja).exists())
+        insert_query_count = len([query for query in queries if query["sql"].startswith('INSERT INTO "varda_z12_dataaccesslog"')])
+        self.assertEqual(insert_query_count, math.ceil(len(generator.henkilo_id_oid_set) / 2))
+
+        excel_log = Z8_ExcelReportLog.objects.get(report_id=report.id)
+        self.assertGreaterEqual(excel_log.data_access_log_duration, 1)
+        self.assertGreaterEqual(excel_log.duration, excel_log.data_access_log_duration)
+
     def _verify_error_report_result(self, response, error_code_list):
         assert_status_code(response, status.HTTP_200_OK)
         response_json = json.loads(response.content)
@@ -3384,6 +3734,29 @@ class VardaViewsReportingTests(TestCase):
             assert_status_code(resp, status.HTTP_403_FORBIDDEN)
             assert_validation_error(resp, "errors", "PE006", "User does not have permission to perform this action.")
 
+    def test_tk_query_count_does_not_depend_on_page_size(self):
+        client = SetUpTestClient("tilastokeskus_luovutuspalvelu").client()
+        for url in [
+            "/api/reporting/v1/tilastokeskus/organisaatiot/",
+            "/api/reporting/v1/tilastokeskus/varhaiskasvatustiedot/",
+            "/api/reporting/v1/tilastokeskus/henkilostotiedot/",
+        ]:
+            # Populate caches (e.g. permissions of user) so that they do not affect query counts
+            client.get(url, **tilastokeskus_headers)
+
+            result_count_list = []
+            query_count_list = []
+            for page_size in (2, 8):
+                with CaptureQueriesContext(connection) as queries:
+                    resp = client.get(f"{url}?page_size={page_size}", **tilastokeskus_headers)
+                assert_status_code(resp, status.HTTP_200_OK)
+                result_count_list.append(len(json.loads(resp.content)["results"]))
+                query_count_list.append(len(queries))
+
+            # Related data of all rows of the page is fetched with bulk queries
+            self.assertLess(result_count_list[0], result_count_list[1], msg=url)
+            self.assertEqual(query_count_list[0], query_count_list[1], msg=url)
+
     def test_valssi_organisaatiot(self):
         create_dict = {
             "nimi": "Testiorganisaatio",
@@ -3735,6 +4108,88 @@ class VardaViewsReportingTests(TestCase):
             assert_status_code(resp, status.HTTP_403_FORBIDDEN)
             assert_validation_error(resp, "errors", "PE006", "User does not have permission to perform this action.")
 
+    def test_history_interval(self):
+        toiminnallinen_painotus = ToiminnallinenPainotus.objects.get(pk=1)
+        painotus_id = toiminnallinen_painotus.id
+        toiminnallinen_painotus.toimintapainotus_koodi = "TP02"
+        toiminnallinen_painotus.save()
+        toiminnallinen_painotus.delete()
+
+        history_list = list(ToiminnallinenPainotus.history.filter(id=painotus_id).order_by("history_date", "history_id"))
+        interval_list = list(
+            Z13_HistoryInterval.objects.filter(model_name=ToiminnallinenPainotus.get_name(), instance_id=painotus_id).order_by(
+                "id"
+            )
+        )
+        self.assertEqual([history.history_id for history in history_list], [interval.history_id for interval in interval_list])
+        for history, interval in zip(history_list, interval_list):
+            self.assertEqual(history.history_type, interval.history_type)
+            self.assertEqual(history.history_date, interval.valid_period.lower)
+        # Only the latest (deleted) historical row is valid now
+        self.assertEqual(
+            Z13_HistoryInterval.objects.filter(
+                model_name=ToiminnallinenPainotus.get_name(), instance_id=painotus_id, valid_period__contains=timezone.now()
+            )
+            .get()
+            .history_id,
+            history_list[-1].history_id,
+        )
+
+    def test_related_object_changed_buffer(self):
+        toiminnallinen_painotus = ToiminnallinenPainotus.objects.get(pk=1)
+        z9_count = Z9_RelatedObjectChanged.objects.count()
+        bulk_create = Z9_RelatedObjectChanged.objects.bulk_create
+        with mock.patch.object(Z9_RelatedObjectChanged.objects, "bulk_create", wraps=bulk_create) as mock_bulk_create:
+            with self.captureOnCommitCallbacks(execute=True):
+                with transaction.atomic():
+                    toiminnallinen_painotus.toimintapainotus_koodi = "TP02"
+                    toiminnallinen_painotus.save()
+                    toiminnallinen_painotus.toimintapainotus_koodi = "TP03"
+                    toiminnallinen_painotus.save()
+                # Objects are buffered until transaction is committed
+                self.assertEqual(Z9_RelatedObjectChanged.objects.count(), z9_count)
+            # Objects of the transaction are saved once
+            mock_bulk_create.assert_called_once()
+        # Toimipaikka and Organisaatio rows for both saves
+        self.assertEqual(Z9_RelatedObjectChanged.objects.count(), z9_count + 4)
+
+        # New buffer is started after previous one has been flushed
+        with self.captureOnCommitCallbacks(execute=True):
+            toiminnallinen_painotus.save()
+        self.assertEqual(Z9_RelatedObjectChanged.objects.count(), z9_count + 6)
+        with self.captureOnCommitCallbacks(execute=True):
+            toiminnallinen_painotus.save()
+        self.assertEqual(Z9_RelatedObjectChanged.objects.count(), z9_count + 8)
+
+        # Objects of rolled back savepoint are discarded
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    toiminnallinen_painotus.save()
+                    raise IntegrityError
+            except IntegrityError:
+                pass
+        self.assertEqual(Z9_RelatedObjectChanged.objects.count(), z9_count + 8)
+
+        # Buffered objects are saved inside the transaction before it is committed, on_commit callback does not save them again
+        self.assertIsInstance(connection.commit, partial)
+        self.assertIs(connection.commit.func, _commit_with_related_object_changed)
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                toiminnallinen_painotus.save()
+                with transaction.atomic():
+                    toiminnallinen_painotus.save()
+            flush_related_object_changed_buffers(connection)
+            self.assertEqual(Z9_RelatedObjectChanged.objects.count(), z9_count + 12)
+        self.assertEqual(Z9_RelatedObjectChanged.objects.count(), z9_count + 12)
+
+        # Database error is raised before commit
+        with mock.patch.object(Z9_RelatedObjectChanged.objects, "bulk_create", side_effect=IntegrityError):
+            with self.captureOnCommitCallbacks():
+                toiminnallinen_painotus.save()
+                with self.assertRaises(IntegrityError):
+                    flush_related_object_changed_buffers(connection)
+
     def test_vipunen_organisaatiot(self):
         create_dict = {
             "nimi": "Testiorganisaatio",
@@ -12,6 +12,7 @@ from rest_framework import status
 from rest_framework.exceptions import ValidationError as ValidationErrorRest
 from rest_framework.test import APIClient
 
+from varda.cache import delete_koodisto_index
 from varda.enums.data_access_type import DataAccessType
 from varda.enums.error_messages import ErrorMessages
 from varda.enums.organisaatiotyyppi import Organisaatiotyyppi
@@ -5297,6 +5298,7 @@ class VardaViewsTests(TestCase):
             code_instance.alkamis_pvm = code_dates[0]
             code_instance.paattymis_pvm = code_dates[1]
             code_instance.save()
+            delete_koodisto_index()
 
             for invalid_case in invalid_cases:
                 vakapaatos_post["alkamis_pvm"] = invalid_case[0]
@@ -5508,7 +5510,10 @@ class VardaViewsTests(TestCase):
             tuottaja_organisaatio__organisaatio_oid="1.2.246.562.10.93957375488",
         )
         paos_oikeus_patch = {"tallentaja_organisaatio_oid": "1.2.246.562.10.93957375488"}
-        assert_status_code(admin_client.patch(f"/api/v1/paos-oikeudet/{paos_oikeus.id}/", paos_oikeus_patch), status.HTTP_200_OK)
+        with self.captureOnCommitCallbacks(execute=True):
+            assert_status_code(
+                admin_client.patch(f"/api/v1/paos-oikeudet/{paos_oikeus.id}/", paos_oikeus_patch), status.HTTP_200_OK
+            )
 
         client = SetUpTestClient("pkvakajarjestaja1").client()
         lapsi = Lapsi.objects.get(tunniste="testing-lapsi4")
@@ -5520,7 +5525,10 @@ class VardaViewsTests(TestCase):
         assert_validation_error(resp, "errors", "PE006", "User does not have permission to perform this action.")
 
         paos_oikeus_patch = {"tallentaja_organisaatio_oid": "1.2.246.562.10.34683023489"}
-        assert_status_code(admin_client.patch(f"/api/v1/paos-oikeudet/{paos_oikeus.id}/", paos_oikeus_patch), status.HTTP_200_OK)
+        with self.captureOnCommitCallbacks(execute=True):
+            assert_status_code(
+                admin_client.patch(f"/api/v1/paos-oikeudet/{paos_oikeus.id}/", paos_oikeus_patch), status.HTTP_200_OK
+            )
 
         lapsi_data = self._get_data_ids_for_lapsi(lapsi)
         resp = client.delete(url)
@@ -5535,7 +5543,10 @@ class VardaViewsTests(TestCase):
             tuottaja_organisaatio__organisaatio_oid="1.2.246.562.10.93957375488",
         )
         paos_oikeus_patch = {"tallentaja_organisaatio_oid": "1.2.246.562.10.93957375488"}
-        assert_status_code(admin_client.patch(f"/api/v1/paos-oikeudet/{paos_oikeus.id}/", paos_oikeus_patch), status.HTTP_200_OK)
+        with self.captureOnCommitCallbacks(execute=True):
+            assert_status_code(
+                admin_client.patch(f"/api/v1/paos-oikeudet/{paos_oikeus.id}/", paos_oikeus_patch), status.HTTP_200_OK
+            )
 
         client = SetUpTestClient("pkvakajarjestaja2").client()
         lapsi = Lapsi.objects.get(tunniste="testing-lapsi5")
@@ -197,24 +197,20 @@ def validate_koodi_in_general(koodi):
 
 
 def validate_z2_koodi(code_value, koodisto_name, alkamis_pvm=None, paattymis_pvm=None, field_name=None, paattymis_pvm_only=True):
-    from varda.models import Z2_Koodisto, Z2_Code
+    from varda.cache import get_koodisto_index
 
     validate_koodi_in_general(code_value)
-    koodisto_qs = Z2_Koodisto.objects.filter(name=koodisto_name)
-    if koodisto_qs.exists:
-        koodi_qs = Z2_Code.objects.filter(koodisto=koodisto_qs.first(), code_value__iexact=code_value)
-        if not koodi_qs.exists():
-            raise ValidationError([ErrorMessages.KO003.value])
-        koodi_instance = koodi_qs.first()
-
-        code_starts_after_start = False if paattymis_pvm_only else (alkamis_pvm and koodi_instance.alkamis_pvm > alkamis_pvm)
-        code_ends_before_start = alkamis_pvm and koodi_instance.paattymis_pvm and koodi_instance.paattymis_pvm < alkamis_pvm
-        code_ends_before_end = paattymis_pvm and koodi_instance.paattymis_pvm and koodi_instance.paattymis_pvm < paattymis_pvm
-
-        if code_starts_after_start or code_ends_before_start or code_ends_before_end:
-            raise ValidationError({field_name: [ErrorMessages.KO005.value]})
-    else:
-        raise ValidationError([ErrorMessages.KO004.value])
+    koodi_validity = get_koodisto_index().get(koodisto_name, {}).get(code_value.lower())
+    if koodi_validity is None:
+        raise ValidationError([ErrorMessages.KO003.value])
+    koodi_alkamis_pvm, koodi_paattymis_pvm = koodi_validity
+
+    code_starts_after_start = False if paattymis_pvm_only else (alkamis_pvm and koodi_alkamis_pvm > alkamis_pvm)
+    code_ends_before_start = alkamis_pvm and koodi_paattymis_pvm and koodi_paattymis_pvm < alkamis_pvm
+    code_ends_before_end = paattymis_pvm and koodi_paattymis_pvm and koodi_paattymis_pvm < paattymis_pvm
+
+    if code_starts_after_start or code_ends_before_start or code_ends_before_end:
+        raise ValidationError({field_name: [ErrorMessages.KO005.value]})
 
 
 def validate_maksun_peruste_koodi(maksun_peruste_koodi, alkamis_pvm=None, paattymis_pvm=None, field_name="maksun_peruste_koodi"):
@@ -13,12 +13,20 @@ from varda.enums.koodistot import Koodistot
 from varda.enums.message_type import MessageType
 from varda.enums.supported_language import SupportedLanguage
 from varda.enums.translation import Translation
+from varda.error_report import get_error_count_dict, update_error_report_table
 from varda.kayttooikeuspalvelu import get_paakayttaja_users_with_yhteystieto_data
 from varda.lokalisointipalvelu import get_translation
-from varda.misc import TemporaryObject
 from varda.misc_queries import get_active_vakajarjestajat
-from varda.models import Aikaleima, Organisaatio, Z11_MessageLog, Z11_MessageTarget, Z6_LastRequest
-from varda.viewsets_reporting import ErrorReportLapsetViewSet, ErrorReportTyontekijatViewSet, ErrorReportToimipaikatViewSet
+from varda.models import (
+    Aikaleima,
+    Lapsi,
+    Organisaatio,
+    Toimipaikka,
+    Tyontekija,
+    Z11_MessageLog,
+    Z11_MessageTarget,
+    Z6_LastRequest,
+)
 
 
 logger = logging.getLogger(__name__)
@@ -99,44 +107,18 @@ def send_no_paakayttaja_message():
 def send_puutteelliset_tiedot_message():
     message_type = MessageType.PUUTTEELLISET_TIEDOT.value
 
+    # Errors are counted from Z14_ErrorReportError table for all active vakajarjestajat at once
+    update_error_report_table()
+
     organisaatio_qs = get_active_vakajarjestajat()
+    organisaatio_id_list = list(organisaatio_qs.values_list("id", flat=True))
+    vaka_error_dict = get_error_count_dict(Lapsi, organisaatio_id_list)
+    henkilosto_error_dict = get_error_count_dict(Tyontekija, organisaatio_id_list)
+    toimipaikka_error_dict = get_error_count_dict(Toimipaikka, organisaatio_id_list)
     for organisaatio in organisaatio_qs:
-        vaka_errors = {}
-        henkilosto_errors = {}
-        toimipaikka_errors = {}
-
-        for viewset, error_dict in [
-            (
-                ErrorReportLapsetViewSet(),
-                vaka_errors,
-            ),
-            (
-                ErrorReportTyontekijatViewSet(),
-                henkilosto_errors,
-            ),
-            (
-                ErrorReportToimipaikatViewSet(),
-                toimipaikka_errors,
-            ),
-        ]:
-            # Initialize ViewSet by setting properties
-            viewset.vakajarjestaja_id = organisaatio.id
-            viewset.vakajarjestaja_oid = organisaatio.organisaatio_oid
-            viewset.is_vakatiedot_permissions = True
-            viewset.is_huoltajatiedot_permissions = True
-            viewset.is_tyontekijatiedot_permissions = True
-            viewset.format_kwarg = None
-            temp_request_object = TemporaryObject()
-            temp_request_object.query_params = {}
-            viewset.request = temp_request_object
-
-            queryset = viewset.get_queryset()
-            serializer_data = viewset.get_serializer(queryset, many=True).data
-
-            for object_instance in serializer_data:
-                for error in object_instance["errors"]:
-                    error_code = error["error_code"]
-                    error_dict[error_code] = error_dict.get(error_code, 0) + len(error["model_id_list"])
+        vaka_errors = vaka_error_dict.get(organisaatio.id, {})
+        henkilosto_errors = henkilosto_error_dict.get(organisaatio.id, {})
+        toimipaikka_errors = toimipaikka_error_dict.get(organisaatio.id, {})
 
         if vaka_errors or henkilosto_errors or toimipaikka_errors:
             message_target_qs = Z11_MessageTarget.objects.filter(organisaatio=organisaatio)
@@ -27,7 +27,6 @@ from varda import filters, validators
 from varda.api_token import create_token_for_user
 from varda.cache import (
     delete_cache_keys_related_model,
-    get_object_ids_user_has_permissions,
     get_yhteenveto_cache,
     set_yhteenveto_cache,
     get_queryset_count_cache_key,
@@ -122,6 +121,7 @@ from varda.permissions import (
     VAKA_LAPSI_GROUPS,
     assign_tukipaatos_permissions,
     delete_object_permissions,
+    get_object_id_qs_user_has_permissions,
 )
 from varda.request_logging import auditlog, auditlogclass, request_log_viewset_decorator_factory, save_data_access_log
 from varda.serializers import (
@@ -2544,7 +2544,7 @@ class NestedLapsiKoosteViewSet(ObjectByTunnisteMixin, GenericViewSet, ListModelM
             ),
         )
         if not is_superuser_or_oph_staff and not vakatiedot_organization_groups_qs.exists():
-            vakapaatos_filter &= Q(id__in=get_object_ids_user_has_permissions(user, Varhaiskasvatuspaatos))
+            vakapaatos_filter &= Q(id__in=get_object_id_qs_user_has_permissions(user, Varhaiskasvatuspaatos))
 
         vakapaatokset = (
             Varhaiskasvatuspaatos.objects.using(settings.READER_DB).filter(vakapaatos_filter).distinct().order_by("-alkamis_pvm")
@@ -2554,7 +2554,7 @@ class NestedLapsiKoosteViewSet(ObjectByTunnisteMixin, GenericViewSet, ListModelM
         # Get vakasuhteet
         vakasuhde_filter = Q(varhaiskasvatuspaatos__lapsi=lapsi)
         if not is_superuser_or_oph_staff and not vakatiedot_organization_groups_qs.exists():
-            vakasuhde_filter &= Q(id__in=get_object_ids_user_has_permissions(user, Varhaiskasvatussuhde))
+            vakasuhde_filter &= Q(id__in=get_object_id_qs_user_has_permissions(user, Varhaiskasvatussuhde))
 
         vakasuhteet = (
             Varhaiskasvatussuhde.objects.using(settings.READER_DB).filter(vakasuhde_filter).distinct().order_by("-alkamis_pvm")
@@ -2573,7 +2573,7 @@ class NestedLapsiKoosteViewSet(ObjectByTunnisteMixin, GenericViewSet, ListModelM
             ),
         )
         if not is_superuser_or_oph_staff and not huoltajatiedot_organization_groups_qs.exists():
-            maksutieto_filter &= Q(id__in=get_object_ids_user_has_permissions(user, Maksutieto))
+            maksutieto_filter &= Q(id__in=get_object_id_qs_user_has_permissions(user, Maksutieto))
 
         maksutiedot = Maksutieto.objects.using(settings.READER_DB).filter(maksutieto_filter).distinct().order_by("-alkamis_pvm")
         lapsi_data["maksutiedot"] = maksutiedot
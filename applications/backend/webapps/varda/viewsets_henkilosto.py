@@ -17,7 +17,7 @@ from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet, GenericViewSet
 
 from varda import filters
-from varda.cache import delete_cache_keys_related_model, get_object_ids_user_has_permissions, get_queryset_count_cache_key
+from varda.cache import delete_cache_keys_related_model, get_queryset_count_cache_key
 from varda.enums.data_access_type import DataAccessType
 from varda.enums.error_messages import ErrorMessages
 from varda.exceptions.conflict_error import ConflictError
@@ -57,6 +57,7 @@ from varda.permissions import (
     is_oph_staff,
     CustomObjectPermissions,
     get_available_tehtavanimike_codes_for_user,
+    get_object_id_qs_user_has_permissions,
 )
 from varda.request_logging import auditlog, auditlogclass, request_log_viewset_decorator_factory, save_data_access_log
 from varda.serializers_henkilosto import (
@@ -293,7 +294,7 @@ class NestedTyontekijaKoosteViewSet(ObjectByTunnisteMixin, GenericViewSet, ListM
             [Z4_CasKayttoOikeudet.HENKILOSTO_TYONTEKIJA_KATSELIJA, Z4_CasKayttoOikeudet.HENKILOSTO_TYONTEKIJA_TALLENTAJA],
         )
         if not is_superuser_or_oph_staff and not tyontekija_organization_groups_qs.exists():
-            palvelussuhde_filter = palvelussuhde_filter & Q(id__in=get_object_ids_user_has_permissions(user, Palvelussuhde))
+            palvelussuhde_filter = palvelussuhde_filter & Q(id__in=get_object_id_qs_user_has_permissions(user, Palvelussuhde))
 
         palvelussuhteet = (
             Palvelussuhde.objects.using(settings.READER_DB).filter(palvelussuhde_filter).distinct().order_by("-alkamis_pvm")
@@ -312,8 +313,8 @@ class NestedTyontekijaKoosteViewSet(ObjectByTunnisteMixin, GenericViewSet, ListM
         )
         available_tehtavanimike_codes = [code.lower() for code in get_available_tehtavanimike_codes_for_user(user, tyontekija)]
         if not is_superuser_or_oph_staff and not taydennyskoulutus_organization_groups_qs.exists():
-            taydennyskoulutus_id_list = get_object_ids_user_has_permissions(user, Taydennyskoulutus)
-            taydennyskoulutus_filter &= Q(taydennyskoulutus__id__in=taydennyskoulutus_id_list)
+            taydennyskoulutus_id_qs = get_object_id_qs_user_has_permissions(user, Taydennyskoulutus)
+            taydennyskoulutus_filter &= Q(taydennyskoulutus__id__in=taydennyskoulutus_id_qs)
             if not user_belongs_to_correct_groups(
                 user,
                 tyontekija.vakajarjestaja,
@@ -347,7 +348,7 @@ class NestedTyontekijaKoosteViewSet(ObjectByTunnisteMixin, GenericViewSet, ListM
         # Get tutkinnot
         tutkinto_filter = Q(henkilo=tyontekija.henkilo) & Q(vakajarjestaja=tyontekija.vakajarjestaja)
         if not is_superuser_or_oph_staff and not tyontekija_organization_groups_qs.exists():
-            tutkinto_filter = tutkinto_filter & Q(id__in=get_object_ids_user_has_permissions(user, Tutkinto))
+            tutkinto_filter = tutkinto_filter & Q(id__in=get_object_id_qs_user_has_permissions(user, Tutkinto))
 
         tutkinnot = set(Tutkinto.objects.using(settings.READER_DB).filter(tutkinto_filter).distinct().order_by("-luonti_pvm"))
         tyontekija_data["tutkinnot"] = tutkinnot
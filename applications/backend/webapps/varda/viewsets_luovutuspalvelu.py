@@ -17,7 +17,7 @@ from varda.clients.aws_boto3_pca_client import Client as Boto3PcaClient
 from varda.clients.aws_s3_client import Client as AwsS3Client
 from varda.misc import CustomServerErrorException, single_line_with_linebreaks_parse
 from varda.models import LuovutuspalveluClientCsr, Organisaatio
-from varda.permissions import ClientCertPermissions
+from varda.permissions import ClientCertPermissions, get_user_group_qs
 from varda.serializers_luovutuspalvelu import UploadSerializer
 
 
@@ -56,7 +56,7 @@ class CsrViewset(GenericViewSet, CreateModelMixin):
         Example of creating a valid CSR:
         $ openssl req -new -newkey rsa:2048 -nodes -keyout your_domain.key -out your_domain.csr
         """
-        user_groups = request.user.groups.all()
+        user_groups = get_user_group_qs(request.user)
         self._validate_user_groups_length(user_groups)
 
         file_uploaded = request.FILES.get("file_uploaded")
@@ -15,6 +15,7 @@ from django.db.models import (
     Exists,
     F,
     FloatField,
+    Func,
     IntegerField,
     Max,
     OuterRef,
@@ -60,12 +61,13 @@ from varda.filters import (
 from varda.misc import encrypt_string, make_random_password
 from varda.misc_queries import (
     get_active_filter,
+    get_history_interval_id_qs,
     get_related_object_changed_id_qs,
     get_tuentaso_codes_by_tilastointi_pvm,
     get_ikaryhma_codes_by_tilastointi_pvm,
     get_queryset_count,
 )
-from varda.misc_viewsets import ParentObjectByOidMixin, ViewSetValidator, parse_query_parameter
+from varda.misc_viewsets import ParentObjectByOidMixin, StreamingListMixin, ViewSetValidator, parse_query_parameter
 from varda.models import (
     Henkilo,
     KieliPainotus,
@@ -96,6 +98,7 @@ from varda.models import (
     Z6_RequestSummary,
     Z8_ExcelReport,
     Z9_RelatedObjectChanged,
+    Z14_ErrorReportError,
 )
 from varda.pagination import (
     ChangeablePageSizeCursorPagination,
@@ -106,8 +109,9 @@ from varda.pagination import (
     HistoricalLargePagination,
     IdCursorPagination,
     HistoricalCursorPagination,
+    ChangeablePageSizeKeysetPagination,
     ChangeablePageSizePagination,
-    ChangeableReportingPageSizePagination,
+    ChangeableReportingPageSizeKeysetPagination,
     TransferOutageCursorPagination,
     RequestSummaryCursorPagination,
     RequestSummaryGroupCursorPagination,
@@ -194,13 +198,22 @@ def _get_common_kela_filter_raw(prefix=""):
     """
 
 
-class KelaBaseViewSet(GenericViewSet, ListModelMixin):
+class KelaBaseViewSet(StreamingListMixin, GenericViewSet, ListModelMixin):
+    """
+    Results can be paginated with page numbers (default), with keyset pagination (keyset=true, next page is fetched
+    with the cursor in next link), or all results of the time window can be fetched at once as newline delimited JSON
+    (stream=true). keyset_fields must uniquely identify a row of the raw query, see RawKeysetPaginationMixin.
+    Keyset pagination evaluates the whole raw query for every page, so fetching all results of a large time window
+    should be done with stream=true.
+    """
+
     permission_classes = (IsCertificateAccess,)
-    pagination_class = ChangeableReportingPageSizePagination
+    pagination_class = ChangeableReportingPageSizeKeysetPagination
     queryset = Z10_KelaVarhaiskasvatussuhde.objects.none()
     filter_backends = (CustomParametersFilterBackend,)
     datetime_gte_field_name = ""
     datetime_lte_field_name = ""
+    keyset_fields = ()
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -225,6 +238,21 @@ class KelaBaseViewSet(GenericViewSet, ListModelMixin):
                 data_type="string",
                 description="ISO DateTime (YYYY-MM-DDTHH:MM:SSZ), e.g. 2021-01-01T00%3A00%3A00Z",
             ),
+            CustomParameter(
+                name="keyset",
+                required=False,
+                location="query",
+                data_type="boolean",
+                description="Use keyset pagination (results do not include count, next page is fetched with cursor). "
+                "Use stream=true to fetch all results of the time window.",
+            ),
+            CustomParameter(
+                name="stream",
+                required=False,
+                location="query",
+                data_type="boolean",
+                description="Return all results as newline delimited JSON (application/x-ndjson) without pagination",
+            ),
         )
 
     def initial(self, *args, **kwargs):
@@ -257,6 +285,7 @@ class KelaEtuusmaksatusAloittaneetViewset(KelaBaseViewSet):
     serializer_class = KelaEtuusmaksatusAloittaneetSerializer
     datetime_gte_field_name = "luonti_pvm_gte"
     datetime_lte_field_name = "luonti_pvm_lte"
+    keyset_fields = (("henkilo_id", int), ("suhde_alkamis_pvm", datetime.date), ("generate_series", int))
 
     def get_queryset(self):
         return Z10_KelaVarhaiskasvatussuhde.objects.using(settings.READER_DB).raw(
@@ -316,6 +345,12 @@ class KelaEtuusmaksatusAloittaneetV2Viewset(KelaBaseViewSet):
     serializer_class = KelaEtuusmaksatusAloittaneetV2Serializer
     datetime_gte_field_name = "luonti_pvm_gte"
     datetime_lte_field_name = "luonti_pvm_lte"
+    keyset_fields = (
+        ("henkilo_id", int),
+        ("suhde_alkamis_pvm", datetime.date),
+        ("varhaiskasvatussuhde_id", int),
+        ("generate_series", int),
+    )
 
     def get_queryset(self):
         return Z10_KelaVarhaiskasvatussuhde.objects.using(settings.READER_DB).raw(
@@ -375,6 +410,12 @@ class KelaEtuusmaksatusMaaraaikaisetViewSet(KelaBaseViewSet):
     serializer_class = KelaEtuusmaksatusMaaraaikaisetSerializer
     datetime_gte_field_name = "luonti_pvm_gte"
     datetime_lte_field_name = "luonti_pvm_lte"
+    keyset_fields = (
+        ("henkilo_id", int),
+        ("suhde_alkamis_pvm", datetime.date),
+        ("suhde_paattymis_pvm", datetime.date),
+        ("generate_series", int),
+    )
 
     def get_queryset(self):
         return Z10_KelaVarhaiskasvatussuhde.objects.using(settings.READER_DB).raw(
@@ -435,6 +476,13 @@ class KelaEtuusmaksatusMaaraaikaisetV2ViewSet(KelaBaseViewSet):
     serializer_class = KelaEtuusmaksatusMaaraaikaisetV2Serializer
     datetime_gte_field_name = "luonti_pvm_gte"
     datetime_lte_field_name = "luonti_pvm_lte"
+    keyset_fields = (
+        ("henkilo_id", int),
+        ("suhde_alkamis_pvm", datetime.date),
+        ("suhde_paattymis_pvm", datetime.date),
+        ("varhaiskasvatussuhde_id", int),
+        ("generate_series", int),
+    )
 
     def get_queryset(self):
         return Z10_KelaVarhaiskasvatussuhde.objects.using(settings.READER_DB).raw(
@@ -487,7 +535,7 @@ class KelaEtuusmaksatusMaaraaikaisetV2ViewSet(KelaBaseViewSet):
 
 
 @auditlogclass
-class KelaEtuusmaksatusLopettaneetViewSet(GenericViewSet, ListModelMixin):
+class KelaEtuusmaksatusLopettaneetViewSet(StreamingListMixin, GenericViewSet, ListModelMixin):
     """
     list:
     nouda ne lapset jotka ovat lopettaneet varhaiskasvatuksessa viikon
@@ -497,12 +545,15 @@ class KelaEtuusmaksatusLopettaneetViewSet(GenericViewSet, ListModelMixin):
         page_size: Change amount of search results per page
         muutos_pvm_gte: Fetch added end date data after given muutos_pvm_gte
         muutos_pvm_lte: Fetch added end date data from a time window with muutos_pvm_gte
+        keyset: Use keyset pagination (keyset=true), next page is fetched with cursor
+        stream: Return all results as newline delimited JSON (stream=true)
     """
 
     queryset = Varhaiskasvatussuhde.objects.none()
     serializer_class = KelaEtuusmaksatusLopettaneetSerializer
     permission_classes = (IsCertificateAccess,)
-    pagination_class = ChangeablePageSizePagination
+    pagination_class = ChangeablePageSizeKeysetPagination
+    keyset_fields = (("id", int),)
 
     def get_queryset(self):
         now = datetime.datetime.now().astimezone()
@@ -523,7 +574,7 @@ class KelaEtuusmaksatusLopettaneetViewSet(GenericViewSet, ListModelMixin):
 
         return Varhaiskasvatussuhde.objects.using(settings.READER_DB).raw(
             """
-            SELECT DISTINCT ON (vas.id) vas.id, vas.paattymis_pvm, he.henkilotunnus, he.kotikunta_koodi
+            SELECT DISTINCT ON (vas.id) vas.id, vas.paattymis_pvm, he.id AS henkilo_id, he.henkilotunnus, he.kotikunta_koodi
             FROM varda_varhaiskasvatussuhde vas
             INNER JOIN varda_varhaiskasvatuspaatos vap ON vas.varhaiskasvatuspaatos_id = vap.id
             INNER JOIN varda_lapsi la ON vap.lapsi_id = la.id
@@ -546,7 +597,7 @@ class KelaEtuusmaksatusLopettaneetViewSet(GenericViewSet, ListModelMixin):
 
 
 @auditlogclass
-class KelaEtuusmaksatusLopettaneetV2ViewSet(GenericViewSet, ListModelMixin):
+class KelaEtuusmaksatusLopettaneetV2ViewSet(StreamingListMixin, GenericViewSet, ListModelMixin):
     """
     list:
     nouda ne lapset jotka ovat lopettaneet varhaiskasvatuksessa viikon
@@ -556,12 +607,15 @@ class KelaEtuusmaksatusLopettaneetV2ViewSet(GenericViewSet, ListModelMixin):
         page_size: Change amount of search results per page
         muutos_pvm_gte: Fetch added end date data after given muutos_pvm_gte
         muutos_pvm_lte: Fetch added end date data from a time window with muutos_pvm_gte
+        keyset: Use keyset pagination (keyset=true), next page is fetched with cursor
+        stream: Return all results as newline delimited JSON (stream=true)
     """
 
     queryset = Varhaiskasvatussuhde.objects.none()
     serializer_class = KelaEtuusmaksatusLopettaneetV2Serializer
     permission_classes = (IsCertificateAccess,)
-    pagination_class = ChangeableReportingPageSizePagination
+    pagination_class = ChangeableReportingPageSizeKeysetPagination
+    keyset_fields = (("id", int),)
 
     def get_queryset(self):
         now = datetime.datetime.now().astimezone()
@@ -582,7 +636,8 @@ class KelaEtuusmaksatusLopettaneetV2ViewSet(GenericViewSet, ListModelMixin):
 
         return Varhaiskasvatussuhde.objects.using(settings.READER_DB).raw(
             """
-            SELECT DISTINCT ON (vas.id) vas.id, vas.paattymis_pvm, la.vakatoimija_id, la.oma_organisaatio_id, la.paos_kytkin, he.henkilotunnus, he.kotikunta_koodi
+            SELECT DISTINCT ON (vas.id) vas.id, vas.paattymis_pvm, vas.muutos_pvm, la.vakatoimija_id, la.oma_organisaatio_id,
+                la.paos_kytkin, he.id AS henkilo_id, he.henkilotunnus, he.kotikunta_koodi
             FROM varda_varhaiskasvatussuhde vas
             INNER JOIN varda_varhaiskasvatuspaatos vap ON vas.varhaiskasvatuspaatos_id = vap.id
             INNER JOIN varda_lapsi la ON vap.lapsi_id = la.id
@@ -616,6 +671,12 @@ class KelaEtuusmaksatusKorjaustiedotViewSet(KelaBaseViewSet):
     serializer_class = KelaEtuusmaksatusKorjaustiedotSerializer
     datetime_gte_field_name = "muutos_pvm_gte"
     datetime_lte_field_name = "muutos_pvm_lte"
+    keyset_fields = (
+        ("henkilo_id", int),
+        ("suhde_alkamis_pvm", datetime.date),
+        ("COALESCE(suhde_paattymis_pvm, '9999-12-31')", datetime.date),
+        ("varhaiskasvatussuhde_id", int),
+    )
 
     def get_queryset(self):
         return Z10_KelaVarhaiskasvatussuhde.objects.using(settings.READER_DB).raw(
@@ -657,6 +718,12 @@ class KelaEtuusmaksatusKorjaustiedotV2ViewSet(KelaBaseViewSet):
     serializer_class = KelaEtuusmaksatusKorjaustiedotV2Serializer
     datetime_gte_field_name = "muutos_pvm_gte"
     datetime_lte_field_name = "muutos_pvm_lte"
+    keyset_fields = (
+        ("henkilo_id", int),
+        ("suhde_alkamis_pvm", datetime.date),
+        ("COALESCE(suhde_paattymis_pvm, '9999-12-31')", datetime.date),
+        ("varhaiskasvatussuhde_id", int),
+    )
 
     def get_queryset(self):
         return Z10_KelaVarhaiskasvatussuhde.objects.using(settings.READER_DB).raw(
@@ -698,6 +765,13 @@ class KelaEtuusmaksatusKorjaustiedotPoistetutViewSet(KelaBaseViewSet):
     serializer_class = KelaEtuusmaksatusKorjaustiedotPoistetutSerializer
     datetime_gte_field_name = "poisto_pvm_gte"
     datetime_lte_field_name = "poisto_pvm_lte"
+    keyset_fields = (
+        # Last transferred values can be missing if Varhaiskasvatussuhde was created and deleted within time frame
+        ("COALESCE(henkilo_id, 0)", int),
+        ("COALESCE(suhde_alkamis_pvm, '0001-01-01')", datetime.date),
+        ("COALESCE(suhde_paattymis_pvm, '9999-12-31')", datetime.date),
+        ("generate_series", int),
+    )
 
     def get_queryset(self):
         return Z10_KelaVarhaiskasvatussuhde.objects.using(settings.READER_DB).raw(
@@ -760,6 +834,14 @@ class KelaEtuusmaksatusKorjaustiedotPoistetutV2ViewSet(KelaBaseViewSet):
     serializer_class = KelaEtuusmaksatusKorjaustiedotPoistetutV2Serializer
     datetime_gte_field_name = "poisto_pvm_gte"
     datetime_lte_field_name = "poisto_pvm_lte"
+    keyset_fields = (
+        # Last transferred values can be missing if Varhaiskasvatussuhde was created and deleted within time frame
+        ("COALESCE(henkilo_id, 0)", int),
+        ("COALESCE(suhde_alkamis_pvm, '0001-01-01')", datetime.date),
+        ("COALESCE(suhde_paattymis_pvm, '9999-12-31')", datetime.date),
+        ("COALESCE(varhaiskasvatussuhde_id, 0)", int),
+        ("generate_series", int),
+    )
 
     def get_queryset(self):
         return Z10_KelaVarhaiskasvatussuhde.objects.using(settings.READER_DB).raw(
@@ -949,6 +1031,8 @@ class AbstractErrorReportViewSet(GenericViewSet, ListModelMixin):
     """
 
     pagination_class = ChangeablePageSizePagination
+    # Alias of the main table in get_raw_query
+    table_alias = None
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -1083,6 +1167,65 @@ class AbstractErrorReportViewSet(GenericViewSet, ListModelMixin):
     def get_queryset(self):
         raise NotImplementedError("get_queryset")
 
+    def get_raw_query(self, errors, where_clause, where_parameter_list):
+        """
+        Returns raw SQL that evaluates errors for objects matching where_clause
+        :param errors: nested error list from get_errors function
+        :param where_clause: raw SQL condition for objects, e.g. la.vakatoimija_id = %s
+        :param where_parameter_list: parameters of where_clause
+        :return: raw_query, parameter_list
+        """
+        raise NotImplementedError("get_raw_query")
+
+    def get_organisaatio_queryset(self):
+        """
+        Returns QuerySet of all objects of the Organisaatio in the same order as get_raw_query
+        """
+        raise NotImplementedError("get_organisaatio_queryset")
+
+    def get_persisted_error_condition(self, error_code):
+        """
+        Returns condition for objects that the persisted error applies to when viewed by the Organisaatio.
+        Persisted errors are evaluated regardless of the Organisaatio.
+        :param error_code: error code, e.g. VP002
+        :return: Q object or None if error always applies
+        """
+        return None
+
+    def get_persisted_queryset(self):
+        """
+        Returns objects with errors from Z14_ErrorReportError table (see error_report.update_error_report_table)
+        instead of evaluating the rules. Used by background operations, so search and rows_filter parameters are not
+        supported.
+        :return: QuerySet with the same error annotations as get_queryset
+        """
+        model = self.queryset.model
+        errors = self.get_errors()
+        if not errors:
+            return model.objects.none()
+
+        error_qs = Z14_ErrorReportError.objects.filter(model_name=model.get_name(), instance_id=OuterRef("id"))
+        annotations = {}
+        unconditional_error_code_list = []
+        error_filter = Q()
+        for error in errors:
+            error_code = error[0].value["error_code"]
+            id_string_subquery = Subquery(
+                error_qs.filter(error_code=error_code)
+                .annotate(id_string=Func(F("model_id_list"), Value(","), function="array_to_string", output_field=CharField()))
+                .values("id_string")
+            )
+            if (condition := self.get_persisted_error_condition(error_code)) is not None:
+                annotations[error_code] = Case(When(condition, then=id_string_subquery), default=Value(None))
+                error_filter |= Exists(error_qs.filter(error_code=error_code)) & condition
+            else:
+                annotations[error_code] = id_string_subquery
+                unconditional_error_code_list.append(error_code)
+        if unconditional_error_code_list:
+            error_filter |= Exists(error_qs.filter(error_code__in=unconditional_error_code_list))
+
+        return self.get_organisaatio_queryset().filter(error_filter).annotate(**annotations)
+
     @action(methods=["get"], detail=False, url_path="error_codes", url_name="error_codes")
     def error_codes(self, request, *args, **kwargs):
         """
@@ -1103,6 +1246,7 @@ class ErrorReportLapsetViewSet(AbstractErrorReportViewSet):
     queryset = Lapsi.objects.none()
     swagger_schema = IntegerIdSchema
     swagger_path_model = Organisaatio
+    table_alias = "la"
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -1142,11 +1286,16 @@ class ErrorReportLapsetViewSet(AbstractErrorReportViewSet):
             raise Http404()
 
     def get_error_nested_list(self):
+        vakatiedot_list = self.get_vakatiedot_error_nested_list() if self.is_vakatiedot_permissions else []
+        huoltajatiedot_list = self.get_huoltajatiedot_error_nested_list() if self.is_huoltajatiedot_permissions else []
+        return [*vakatiedot_list, *huoltajatiedot_list]
+
+    def get_vakatiedot_error_nested_list(self):
         today = datetime.date.today()
         overage_date = today - relativedelta(years=8)
 
         # [[ErrorMessages, filter condition, parameters[], ID lookup, model name for ID lookup]]
-        vakatiedot_error_nested_list = [
+        return [
             [ErrorMessages.VP002, "vapa.alkamis_pvm > vasu.alkamis_pvm", [], "vasu.id", Varhaiskasvatussuhde.get_name()],
             [ErrorMessages.VP003, "vapa.paattymis_pvm < vasu.paattymis_pvm", [], "vasu.id", Varhaiskasvatussuhde.get_name()],
             [
@@ -1178,58 +1327,79 @@ class ErrorReportLapsetViewSet(AbstractErrorReportViewSet):
             [ErrorMessages.HE018, "he.henkilotunnus = ''", [], "la.id", Lapsi.get_name()],
         ]
 
-        # Do not get Maksutieto related errors for Lapsi objects for which vakajarjestaja is paos_organisaatio
+    def get_huoltajatiedot_error_nested_list(self):
+        today = datetime.date.today()
+        overage_date = today - relativedelta(years=8)
+
+        # Do not get Maksutieto related errors for Lapsi objects for which vakajarjestaja is paos_organisaatio,
+        # condition is left out if errors are evaluated regardless of vakajarjestaja (see get_persisted_error_condition)
+        if self.vakajarjestaja_id is not None:
+            paos_condition = "la.paos_organisaatio_id IS DISTINCT FROM %s AND"
+            paos_parameter_list = [self.vakajarjestaja_id]
+        else:
+            paos_condition = ""
+            paos_parameter_list = []
+
         # [[ErrorMessages, filter condition, parameters[], ID lookup, model name for ID lookup]]
-        huoltajatiedot_error_nested_list = [
+        return [
             [
                 ErrorMessages.MA015,
-                """la.paos_organisaatio_id IS DISTINCT FROM %s
-                AND ma.paattymis_pvm IS NULL
+                f"""{paos_condition} ma.paattymis_pvm IS NULL
                 AND NOT EXISTS(SELECT id FROM varda_varhaiskasvatuspaatos WHERE lapsi_id = la.id
                 AND alkamis_pvm <= %s
                 AND (paattymis_pvm IS NULL OR paattymis_pvm >= %s))
                 AND (ma.alkamis_pvm <= %s)""",
-                [self.vakajarjestaja_id, today, today, today],
+                [*paos_parameter_list, today, today, today],
                 "ma.id",
                 Maksutieto.get_name(),
             ],
             [
                 ErrorMessages.MA016,
-                """la.paos_organisaatio_id IS DISTINCT FROM %s
-                AND ma.paattymis_pvm IS NULL
+                f"""{paos_condition} ma.paattymis_pvm IS NULL
                 AND he.syntyma_pvm < %s""",
-                [self.vakajarjestaja_id, overage_date],
+                [*paos_parameter_list, overage_date],
                 "ma.id",
                 Maksutieto.get_name(),
             ],
             [
                 ErrorMessages.MA020,
-                """la.paos_organisaatio_id IS DISTINCT FROM %s
-                AND asiakasmaksu > %s
+                f"""{paos_condition} asiakasmaksu > %s
                 AND org.yritysmuoto = ANY(%s)""",
-                [self.vakajarjestaja_id, MAXIMUM_ASIAKASMAKSU, YRITYSMUOTO_KUNTA],
+                [*paos_parameter_list, MAXIMUM_ASIAKASMAKSU, YRITYSMUOTO_KUNTA],
                 "ma.id",
                 Maksutieto.get_name(),
             ],
             [
                 ErrorMessages.MA021,
-                """la.paos_organisaatio_id IS DISTINCT FROM %s
-                AND la.paos_kytkin = TRUE
+                f"""{paos_condition} la.paos_kytkin = TRUE
                 AND vapa.jarjestamismuoto_koodi ILIKE 'jm03'
                 AND ma.maksun_peruste_koodi ILIKE 'mp03'
                 AND ma.palveluseteli_arvo = 0
                 AND (ma.paattymis_pvm IS NULL or ma.paattymis_pvm > '2019-12-31')
                 AND daterange(vapa.alkamis_pvm, vapa.paattymis_pvm, '[]')
                     && daterange(ma.alkamis_pvm, ma.paattymis_pvm, '[]') """,
-                [self.vakajarjestaja_id],
+                paos_parameter_list,
                 "ma.id",
                 Maksutieto.get_name(),
             ],
         ]
 
-        vakatiedot_list = vakatiedot_error_nested_list if self.is_vakatiedot_permissions else []
-        huoltajatiedot_list = huoltajatiedot_error_nested_list if self.is_huoltajatiedot_permissions else []
-        return [*vakatiedot_list, *huoltajatiedot_list]
+    def get_persisted_error_condition(self, error_code):
+        huoltajatiedot_error_code_list = [error[0].value["error_code"] for error in self.get_huoltajatiedot_error_nested_list()]
+        if error_code in huoltajatiedot_error_code_list:
+            return ~Q(paos_organisaatio=self.vakajarjestaja_id)
+        return None
+
+    def get_organisaatio_queryset(self):
+        return (
+            Lapsi.objects.filter(
+                Q(vakatoimija=self.vakajarjestaja_id)
+                | Q(oma_organisaatio=self.vakajarjestaja_id)
+                | Q(paos_organisaatio=self.vakajarjestaja_id)
+            )
+            .select_related("henkilo", "oma_organisaatio", "paos_organisaatio")
+            .order_by("-muutos_pvm", "henkilo__sukunimi")
+        )
 
     def get_queryset(self):
         errors = self.get_errors()
@@ -1237,8 +1407,16 @@ class ErrorReportLapsetViewSet(AbstractErrorReportViewSet):
             # No errors in filtered query
             return Lapsi.objects.none()
 
-        annotation_query, filter_query, parameter_list = self.get_sql_content(errors)
         search_filter, search_parameter_list = self.get_search_filter("la")
+        raw_query, parameter_list = self.get_raw_query(
+            errors,
+            f"(la.vakatoimija_id = %s OR la.oma_organisaatio_id = %s OR la.paos_organisaatio_id = %s) {search_filter}",
+            [self.vakajarjestaja_id, self.vakajarjestaja_id, self.vakajarjestaja_id, *search_parameter_list],
+        )
+        return Lapsi.objects.using(settings.READER_DB).raw(raw_query, parameter_list)
+
+    def get_raw_query(self, errors, where_clause, where_parameter_list):
+        annotation_query, filter_query, parameter_list = self.get_sql_content(errors)
 
         # If user has partial permissions, only join required tables
         vakatiedot_join = (
@@ -1267,24 +1445,13 @@ class ErrorReportLapsetViewSet(AbstractErrorReportViewSet):
             LEFT JOIN varda_henkilo he ON he.id = la.henkilo_id
             LEFT JOIN varda_varhaiskasvatuspaatos vapa ON vapa.lapsi_id = la.id
             {join_clause}
-            WHERE (la.vakatoimija_id = %s OR la.oma_organisaatio_id = %s OR la.paos_organisaatio_id = %s)
-                  {search_filter}
+            WHERE {where_clause}
             GROUP BY la.id, he.sukunimi
             HAVING {filter_query}
             ORDER BY la.muutos_pvm DESC, he.sukunimi
         """
 
-        return Lapsi.objects.using(settings.READER_DB).raw(
-            raw_query,
-            [
-                *parameter_list,
-                self.vakajarjestaja_id,
-                self.vakajarjestaja_id,
-                self.vakajarjestaja_id,
-                *search_parameter_list,
-                *parameter_list,
-            ],
-        )
+        return raw_query, [*parameter_list, *where_parameter_list, *parameter_list]
 
 
 @auditlogclass
@@ -1293,6 +1460,7 @@ class ErrorReportTyontekijatViewSet(AbstractErrorReportViewSet):
     queryset = Tyontekija.objects.none()
     swagger_schema = IntegerIdSchema
     swagger_path_model = Organisaatio
+    table_alias = "ty"
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -1358,14 +1526,27 @@ class ErrorReportTyontekijatViewSet(AbstractErrorReportViewSet):
             ],
         ]
 
+    def get_organisaatio_queryset(self):
+        return (
+            Tyontekija.objects.filter(vakajarjestaja=self.vakajarjestaja_id)
+            .select_related("henkilo")
+            .order_by("-muutos_pvm", "henkilo__sukunimi")
+        )
+
     def get_queryset(self):
         errors = self.get_errors()
         if not errors:
             # No errors in filtered query
             return Tyontekija.objects.none()
 
-        annotation_query, filter_query, parameter_list = self.get_sql_content(errors)
         search_filter, search_parameter_list = self.get_search_filter("ty")
+        raw_query, parameter_list = self.get_raw_query(
+            errors, f"ty.vakajarjestaja_id = %s {search_filter}", [self.vakajarjestaja_id, *search_parameter_list]
+        )
+        return Tyontekija.objects.using(settings.READER_DB).raw(raw_query, parameter_list)
+
+    def get_raw_query(self, errors, where_clause, where_parameter_list):
+        annotation_query, filter_query, parameter_list = self.get_sql_content(errors)
 
         raw_query = f"""
             SELECT ty.*, {annotation_query}
@@ -1375,16 +1556,13 @@ class ErrorReportTyontekijatViewSet(AbstractErrorReportViewSet):
             LEFT JOIN varda_tyoskentelypaikka typa ON typa.palvelussuhde_id = pasu.id
             LEFT JOIN varda_toimipaikka tp ON tp.id = typa.toimipaikka_id
             LEFT JOIN varda_tutkinto tu ON tu.henkilo_id = ty.henkilo_id AND tu.vakajarjestaja_id = ty.vakajarjestaja_id
-            WHERE ty.vakajarjestaja_id = %s
-                  {search_filter}
+            WHERE {where_clause}
             GROUP BY ty.id, he.sukunimi
             HAVING {filter_query}
             ORDER BY ty.muutos_pvm DESC, he.sukunimi
         """
 
-        return Tyontekija.objects.using(settings.READER_DB).raw(
-            raw_query, [*parameter_list, self.vakajarjestaja_id, *search_parameter_list, *parameter_list]
-        )
+        return raw_query, [*parameter_list, *where_parameter_list, *parameter_list]
 
 
 @auditlogclass
@@ -1393,6 +1571,7 @@ class ErrorReportToimipaikatViewSet(AbstractErrorReportViewSet):
     queryset = Toimipaikka.objects.none()
     swagger_schema = IntegerIdSchema
     swagger_path_model = Organisaatio
+    table_alias = "tp"
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -1527,14 +1706,23 @@ class ErrorReportToimipaikatViewSet(AbstractErrorReportViewSet):
         )
         return [*vakatiedot_list, *tyontekijatiedot_list]
 
+    def get_organisaatio_queryset(self):
+        return Toimipaikka.objects.filter(vakajarjestaja=self.vakajarjestaja_id).order_by("-muutos_pvm", "nimi")
+
     def get_queryset(self):
         errors = self.get_errors()
         if not errors:
             # No errors in filtered query
             return Toimipaikka.objects.none()
 
-        annotation_query, filter_query, parameter_list = self.get_sql_content(errors)
         search_filter, search_parameter_list = self.get_search_filter("tp")
+        raw_query, parameter_list = self.get_raw_query(
+            errors, f"tp.vakajarjestaja_id = %s {search_filter}", [self.vakajarjestaja_id, *search_parameter_list]
+        )
+        return Toimipaikka.objects.using(settings.READER_DB).raw(raw_query, parameter_list)
+
+    def get_raw_query(self, errors, where_clause, where_parameter_list):
+        annotation_query, filter_query, parameter_list = self.get_sql_content(errors)
 
         # If user has partial permissions, only join required tables
         vakatiedot_join = (
@@ -1566,16 +1754,13 @@ class ErrorReportToimipaikatViewSet(AbstractErrorReportViewSet):
             SELECT tp.*, {annotation_query}
             FROM varda_toimipaikka tp
             {join_clause}
-            WHERE tp.vakajarjestaja_id = %s
-                  {search_filter}
+            WHERE {where_clause}
             GROUP BY tp.id
             HAVING {filter_query}
             ORDER BY tp.muutos_pvm DESC, tp.nimi
         """
 
-        return Toimipaikka.objects.using(settings.READER_DB).raw(
-            raw_query, [*parameter_list, *join_parameter_list, self.vakajarjestaja_id, *search_parameter_list, *parameter_list]
-        )
+        return raw_query, [*parameter_list, *join_parameter_list, *where_parameter_list, *parameter_list]
 
 
 @auditlogclass
@@ -1584,6 +1769,7 @@ class ErrorReportOrganisaatioViewSet(AbstractErrorReportViewSet):
     queryset = Organisaatio.objects.none()
     swagger_schema = IntegerIdSchema
     swagger_path_model = Organisaatio
+    table_alias = "org"
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -1614,28 +1800,34 @@ class ErrorReportOrganisaatioViewSet(AbstractErrorReportViewSet):
             ],
         ]
 
+    def get_organisaatio_queryset(self):
+        return Organisaatio.objects.filter(id=self.vakajarjestaja_id).order_by("-muutos_pvm", "nimi")
+
     def get_queryset(self):
         errors = self.get_errors()
         if not errors:
             # No errors in filtered query
             return Organisaatio.objects.none()
 
-        annotation_query, filter_query, parameter_list = self.get_sql_content(errors)
         search_filter, search_parameter_list = self.get_search_filter("org")
+        raw_query, parameter_list = self.get_raw_query(
+            errors, f"org.id = %s {search_filter}", [self.vakajarjestaja_id, *search_parameter_list]
+        )
+        return Organisaatio.objects.using(settings.READER_DB).raw(raw_query, parameter_list)
+
+    def get_raw_query(self, errors, where_clause, where_parameter_list):
+        annotation_query, filter_query, parameter_list = self.get_sql_content(errors)
 
         raw_query = f"""
             SELECT org.*, {annotation_query}
             FROM varda_organisaatio org
-            WHERE org.id = %s
-                  {search_filter}
+            WHERE {where_clause}
             GROUP BY org.id
             HAVING {filter_query}
             ORDER BY org.muutos_pvm DESC, org.nimi
         """
 
-        return Organisaatio.objects.using(settings.READER_DB).raw(
-            raw_query, [*parameter_list, self.vakajarjestaja_id, *search_parameter_list, *parameter_list]
-        )
+        return raw_query, [*parameter_list, *where_parameter_list, *parameter_list]
 
 
 @auditlogclass
@@ -2128,11 +2320,10 @@ class TkOrganisaatiot(HistoricalAbstractViewSet):
 
     def get_queryset(self):
         id_qs = get_related_object_changed_id_qs(Organisaatio.get_name(), self.datetime_gt, self.datetime_lte)
-        return (
-            Organisaatio.history.filter(id__in=Subquery(id_qs), history_date__lte=self.datetime_lte)
-            .distinct("id")
-            .order_by("id", "-history_date")
+        history_id_qs = get_history_interval_id_qs(
+            Organisaatio, self.datetime_lte, additional_filters=Q(instance_id__in=Subquery(id_qs))
         )
+        return Organisaatio.history.filter(history_id__in=Subquery(history_id_qs)).order_by("id", "-history_date")
 
 
 @auditlogclass
@@ -2142,11 +2333,10 @@ class TkVakatiedot(HistoricalAbstractViewSet):
 
     def get_queryset(self):
         id_qs = get_related_object_changed_id_qs(Lapsi.get_name(), self.datetime_gt, self.datetime_lte)
-        return (
-            Lapsi.history.filter(id__in=Subquery(id_qs), history_date__lte=self.datetime_lte)
-            .distinct("id")
-            .order_by("id", "-history_date")
+        history_id_qs = get_history_interval_id_qs(
+            Lapsi, self.datetime_lte, additional_filters=Q(instance_id__in=Subquery(id_qs))
         )
+        return Lapsi.history.filter(history_id__in=Subquery(history_id_qs)).order_by("id", "-history_date")
 
 
 @auditlogclass
@@ -2156,11 +2346,10 @@ class TkHenkilostotiedot(HistoricalAbstractViewSet):
 
     def get_queryset(self):
         id_qs = get_related_object_changed_id_qs(Tyontekija.get_name(), self.datetime_gt, self.datetime_lte)
-        return (
-            Tyontekija.history.filter(id__in=Subquery(id_qs), history_date__lte=self.datetime_lte)
-            .distinct("id")
-            .order_by("id", "-history_date")
+        history_id_qs = get_history_interval_id_qs(
+            Tyontekija, self.datetime_lte, additional_filters=Q(instance_id__in=Subquery(id_qs))
         )
+        return Tyontekija.history.filter(history_id__in=Subquery(history_id_qs)).order_by("id", "-history_date")
 
 
 class SimpleHistoricalViewSet(HistoricalAbstractViewSet):
@@ -2175,14 +2364,9 @@ class SimpleHistoricalViewSet(HistoricalAbstractViewSet):
         return page
 
     def get_queryset(self):
-        base_queryset = self.queryset.model.history.filter(history_date__gt=self.datetime_gt, history_date__lte=self.datetime_lte)
-        include_ids = (
-            base_queryset.values("id")
-            .annotate(history_type_array=ArrayAgg("history_type", distinct=True))
-            .exclude(history_type_array__contains=["+", "-"])
-            .values("id")
-        )
-        return base_queryset.filter(id__in=include_ids).distinct("id").order_by("id", "-history_date")
+        model = self.queryset.model
+        history_id_qs = get_history_interval_id_qs(model, self.datetime_lte, datetime_gt=self.datetime_gt)
+        return model.history.filter(history_id__in=Subquery(history_id_qs)).order_by("id", "-history_date")
 
 
 # Use ParentObjectByOidMixin, NestedSimpleRouter must get the correct lookup_value_regex for ValssiTaustatiedotViewSet
@@ -2544,11 +2728,10 @@ class VipunenLapsiViewSet(SimpleHistoricalViewSet):
             self.datetime_lte,
             additional_filters=Q(trigger_model_name=Henkilo.get_name()) | Q(trigger_model_name=Lapsi.get_name()),
         )
-        return (
-            Lapsi.history.filter(id__in=Subquery(id_qs), history_date__lte=self.datetime_lte)
-            .distinct("id")
-            .order_by("id", "-history_date")
+        history_id_qs = get_history_interval_id_qs(
+            Lapsi, self.datetime_lte, additional_filters=Q(instance_id__in=Subquery(id_qs))
         )
+        return Lapsi.history.filter(history_id__in=Subquery(history_id_qs)).order_by("id", "-history_date")
 
 
 @auditlogclass
@@ -2598,11 +2781,10 @@ class VipunenTyontekijaViewSet(SimpleHistoricalViewSet):
             self.datetime_lte,
             additional_filters=Q(trigger_model_name=Henkilo.get_name()) | Q(trigger_model_name=Tyontekija.get_name()),
         )
-        return (
-            Tyontekija.history.filter(id__in=Subquery(id_qs), history_date__lte=self.datetime_lte)
-            .distinct("id")
-            .order_by("id", "-history_date")
+        history_id_qs = get_history_interval_id_qs(
+            Tyontekija, self.datetime_lte, additional_filters=Q(instance_id__in=Subquery(id_qs))
         )
+        return Tyontekija.history.filter(history_id__in=Subquery(history_id_qs)).order_by("id", "-history_date")
 
 
 @auditlogclass
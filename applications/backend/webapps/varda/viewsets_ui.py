@@ -17,7 +17,7 @@ from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
 
 from varda import filters
-from varda.cache import get_object_ids_user_has_permissions, get_queryset_count_cache_key
+from varda.cache import get_queryset_count_cache_key
 from varda.cas.varda_permissions import IsVardaPaakayttaja
 from varda.custom_swagger import ActionPaginationSwaggerAutoSchema
 from varda.filters import CustomParametersFilterBackend, CustomParameter
@@ -48,10 +48,12 @@ from varda.permissions import (
     LapsihakuPermissions,
     TYONTEKIJA_GROUPS,
     user_belongs_to_correct_groups,
+    user_has_object_permission,
     user_permission_groups_in_organization,
     get_tyontekija_filters_for_taydennyskoulutus_groups,
     is_oph_staff,
     VAKA_GROUPS,
+    get_object_id_qs_user_has_permissions,
 )
 from varda.request_logging import auditlog, auditlogclass, request_log_viewset_decorator_factory
 from varda.serializers import PaosToimipaikkaSerializer, PaosOrganisaatioSerializer
@@ -72,7 +74,7 @@ def parse_vakajarjestaja(user, vakajarjestaja_id, permission_group_list):
     vakajarjestaja = Organisaatio.objects.using(settings.READER_DB).filter(pk=vakajarjestaja_id).first()
     if (
         not vakajarjestaja
-        or not user.has_perm("view_organisaatio", vakajarjestaja)
+        or not user_has_object_permission(user, "view_organisaatio", vakajarjestaja)
         or not user_belongs_to_correct_groups(
             user, vakajarjestaja, permission_groups=permission_group_list, accept_toimipaikka_permission=True
         )
@@ -110,7 +112,7 @@ class UiVakajarjestajatViewSet(GenericViewSet, ListModelMixin):
         if user.is_superuser:
             queryset = Organisaatio.objects.using(settings.READER_DB).all().order_by("nimi")
         else:
-            vakajarjestaja_ids = get_object_ids_user_has_permissions(user, Organisaatio)
+            vakajarjestaja_ids = get_object_id_qs_user_has_permissions(user, Organisaatio)
             queryset = Organisaatio.objects.using(settings.READER_DB).filter(id__in=vakajarjestaja_ids).order_by("nimi")
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
@@ -169,9 +171,9 @@ class UiVakajarjestajatViewSet(GenericViewSet, ListModelMixin):
 
         if not self._has_organisaatio_level_henkilosto_permissions():
             # No organisaatio level permissions, get results based on object permissions
-            tyontekija_id_list = get_object_ids_user_has_permissions(user, Tyontekija)
+            tyontekija_id_qs = get_object_id_qs_user_has_permissions(user, Tyontekija)
             taydennyskoulutus_filters, organisaatio_oids = get_tyontekija_filters_for_taydennyskoulutus_groups(user)
-            filter_condition &= Q(id__in=tyontekija_id_list) | taydennyskoulutus_filters
+            filter_condition &= Q(id__in=tyontekija_id_qs) | taydennyskoulutus_filters
 
         query_params = self.request.query_params
         if toimipaikka_id := query_params.get("toimipaikka_id", None):
@@ -244,8 +246,8 @@ class UiVakajarjestajatViewSet(GenericViewSet, ListModelMixin):
 
         if not self._has_organisaatio_level_vaka_permissions():
             # No organisaatio level permissions, get results based on object permissions
-            lapsi_id_list = get_object_ids_user_has_permissions(user, Lapsi)
-            filter_condition &= Q(id__in=lapsi_id_list)
+            lapsi_id_qs = get_object_id_qs_user_has_permissions(user, Lapsi)
+            filter_condition &= Q(id__in=lapsi_id_qs)
 
         query_params = self.request.query_params
         if toimipaikka_id := query_params.get("toimipaikka_id", None):
@@ -353,7 +355,7 @@ class NestedToimipaikkaViewSet(GenericViewSet, ListModelMixin):
         vaka_group_qs = user_permission_groups_in_organization(self.request.user, self.vakajarjestaja_oid, VAKA_GROUPS)
         if not user.is_superuser and not is_oph_staff(user) and not vaka_group_qs.exists():
             # Get only toimipaikat user has object level permissions to
-            toimipaikka_ids_user_has_view_permissions = get_object_ids_user_has_permissions(user, Toimipaikka)
+            toimipaikka_ids_user_has_view_permissions = get_object_id_qs_user_has_permissions(user, Toimipaikka)
             toimipaikka_filter = toimipaikka_filter & Q(id__in=toimipaikka_ids_user_has_view_permissions)
 
         return (
@@ -385,7 +387,7 @@ class NestedToimipaikkaViewSet(GenericViewSet, ListModelMixin):
     def get_vakajarjestaja(self, request, vakajarjestaja_pk=None):
         vakajarjestaja = get_object_or_404(Organisaatio.objects.using(settings.READER_DB).all(), pk=vakajarjestaja_pk)
         user = request.user
-        if user.has_perm("view_organisaatio", vakajarjestaja):
+        if user_has_object_permission(user, "view_organisaatio", vakajarjestaja):
             return vakajarjestaja
         else:
             raise Http404
@@ -393,7 +395,7 @@ class NestedToimipaikkaViewSet(GenericViewSet, ListModelMixin):
     def get_toimipaikka(self, request, toimipaikka_pk=None):
         toimipaikka = get_object_or_404(Toimipaikka.objects.using(settings.READER_DB).all(), pk=toimipaikka_pk)
         user = request.user
-        if user.has_perm("view_toimipaikka", toimipaikka):
+        if user_has_object_permission(user, "view_toimipaikka", toimipaikka):
             return toimipaikka
         else:
             raise Http404
@@ -645,7 +647,7 @@ class UiNestedLapsiViewSet(GenericViewSet, ListModelMixin):
         # Get all Lapsi objects for superuser, OPH and vakajarjestaja level KATSELIJA/TALLENTAJA permissions
         # Huoltajatieto groups do not have permissions to Lapsi objects where organisaatio is paos_organisaatio
         if not user.is_superuser and not is_oph_staff(user) and not lapsi_organization_groups_qs.exists():
-            lapsi_object_ids_user_has_view_permissions = get_object_ids_user_has_permissions(user, Lapsi)
+            lapsi_object_ids_user_has_view_permissions = get_object_id_qs_user_has_permissions(user, Lapsi)
             lapsi_filter &= Q(id__in=lapsi_object_ids_user_has_view_permissions)
 
         return (
@@ -823,7 +825,7 @@ class UiNestedTyontekijaViewSet(GenericViewSet, ListModelMixin):
         if not self.has_vakajarjestaja_tyontekija_permissions and not taydennyskoulutus_organization_groups_qs.exists():
             # Get only Tyontekija objects user has object permissions to, or objects that belong to user's
             # taydennyskoulutus groups
-            tyontekija_ids_user_has_view_permissions = get_object_ids_user_has_permissions(user, Tyontekija)
+            tyontekija_ids_user_has_view_permissions = get_object_id_qs_user_has_permissions(user, Tyontekija)
             tyontekija_taydennyskoulutus_filters, organisaatio_oids = get_tyontekija_filters_for_taydennyskoulutus_groups(
                 self.request.user
             )